@@ -1,59 +1,121 @@
 import os
 import re
+import sys
 import traceback
 import time
-from es_storage import ESStorage
+import multiprocessing
+from collections import deque
+from storage_factory import make_storage
 from urllib.parse import ParseResult, urljoin, urlparse
 import logging
 logger = logging.getLogger(__name__)
 
 from storage import StorageI
-from es_doc_maker import make_article_doc
+from es_doc_maker import make_article_doc, make_extraction_state_doc
 import conf_parser
 from html_parser import Website, KannadaPrabhaParser, PrajavaniParser, VijayakarnatakaParser
+from extraction_rules import load_site_rules, RuleBasedParser
+from url_hash_index import URLHashIndex
+from checkpoint import Checkpoint
+from prefetcher import Prefetcher
+from dump_archive import DumpArchive
+from metrics import METRICS, metric_name, metrics_path, ProgressReporter
+from profiler import PageProfiler, make_profiler, profile_flag, profile_page
+from dedup import MinHasher, Deduplicator, make_deduplicator, SIGNATURE_FIELD
 
 class URLLookup():
-    """Helper class that defines url-lookup. Currently, it uses in-memory set for lookup.
+    """Helper class that defines url-lookup. By default, it uses in-memory set for lookup.
+    If lookup_dir is given, it uses a persistent URLHashIndex under that directory instead, which is
+    reused across the runs. Only the articles extracted after the previous sync are fetched from article_storage.
+    sync=False uses the persistent index as it is, for resuming an interrupted run whose saved urls are already in it.
     """
-    def __init__(self, article_storage: StorageI):
+    # Articles indexed this many seconds before a sync may not be searchable yet, so they are fetched again
+    SYNC_MARGIN_SECONDS = 300
+
+    def __init__(self, article_storage: StorageI, lookup_dir=None, lookup_name=None, sync=True):
         self.article_storage = article_storage
         self.extracted_url_set = set()
-        self.__load_url_index()
+        self.url_index = None
+        if lookup_dir is not None:
+            self.url_index = URLHashIndex(lookup_dir, lookup_name)
+            if sync or not self.url_index.exists():
+                self.__sync_url_index()
+            else:
+                logger.warning("Using the url lookup index as it is, with {} urls".format(len(self.url_index)))
+        else:
+            self.__load_url_index()
 
-    def __load_url_index(self):
-        # URLs from which article has been extracted already
-        extracted_url_itr = []
-        if self.article_storage.storage_exists():
-            es_query_extracted = {
-                "_source": False,
-                "query": {"bool": {"must": [{"match_all":{}}] } } }
-            # Do a bulk-scroll here
-            extracted_url_itr = self.article_storage.get_documents(es_query_extracted, bulk_scroll=True)
+    def __get_extracted_urls(self, extracted_after=None):
+        """Iterator over the urls in article_storage, extracted after the given epoch time if given"""
+        if not self.article_storage.storage_exists():
+            return iter([])
+        es_query_extracted = {
+            "_source": False,
+            "query": {"bool": {"must": [{"match_all":{}}] } } }
+        if extracted_after is not None:
+            es_query_extracted["query"] = {"bool": {"must": [{"range": {"extracted_at": {"gte": extracted_after}}}] } }
+        # Do a bulk-scroll here
+        extracted_url_itr = self.article_storage.get_documents(es_query_extracted, bulk_scroll=True)
+        return (e_url['_id'] for e_url in extracted_url_itr)
 
+    def __load_url_index(self):
         # Bad Idea? Create a set-of-extracted-urls for lookup
         logger.info("Going to load all the extracted-urls into memory for lookup")
         start = time.time()
         # Get the URLs from the query results
-        self.extracted_url_set = {e_url['_id'] for e_url in extracted_url_itr}
+        self.extracted_url_set = set(self.__get_extracted_urls())
         logger.info("Done. Have {0} urls in lookup index. Time taken:{1} seconds".format(len(self.extracted_url_set), time.time()-start))
 
+    def __sync_url_index(self):
+        start = time.time()
+        synced_until = self.url_index.meta.get('synced_until')
+        if not self.url_index.exists() or synced_until is None:
+            logger.warning("Building the url lookup index from scratch")
+            self.url_index.rebuild(self.__get_extracted_urls())
+        else:
+            logger.info("Syncing the url lookup index with the articles extracted after {}".format(synced_until))
+            self.url_index.add_urls(self.__get_extracted_urls(synced_until - self.SYNC_MARGIN_SECONDS))
+            self.url_index.flush()
+        self.url_index.meta['synced_until'] = int(start)
+        self.url_index.save_meta()
+        logger.info("Done. Have {0} urls in lookup index. Time taken:{1} seconds".format(len(self.url_index), time.time()-start))
+
     def url_exists(self, url):
         """Check if the given url already exists in the article_storage or not"""
+        if self.url_index is not None:
+            return self.url_index.contains(url)
         return (url in self.extracted_url_set)
 
+    def add_urls(self, urls):
+        """Add the urls whose articles have just been saved to the article_storage"""
+        if self.url_index is not None:
+            self.url_index.add_urls(urls)
+        else:
+            self.extracted_url_set.update(urls)
+
+    def close(self):
+        if self.url_index is not None:
+            self.url_index.close()
+
 class ArticleParser():
-    def __init__(self, website):
+    def __init__(self, website, parser_backend=None, rules_path=None):
         """The parameter website is used to decide 
-        the specific HtmlParserI implementation be used."""
+        the specific HtmlParserI implementation be used.
+        parser_backend is the BeautifulSoup tree builder, the configured one if None.
+        If rules_path is given, the declarative extraction rules in that file are used instead."""
         self.website = website
+        self.parser_backend = parser_backend
+        self.site_rules = load_site_rules(rules_path) if rules_path is not None else None
 
     def __get_html_parser(self, html_text, url):
-        if self.website == Website.KANNADAPRABHA:
-            return KannadaPrabhaParser(html_text, url)
+        if self.site_rules is not None:
+            return RuleBasedParser(self.site_rules, html_text, url, self.parser_backend)
+        elif self.website == Website.KANNADAPRABHA:
+            return KannadaPrabhaParser(html_text, url, self.parser_backend)
         elif self.website == Website.PRAJAVANI:
-            return PrajavaniParser(html_text, url)
+            return PrajavaniParser(html_text, url, self.parser_backend)
         elif self.website == Website.VIJAYAKARNATAKA:
-            return VijayakarnatakaParser(html_text, url)
+            return VijayakarnatakaParser(html_text, url, self.parser_backend)
         # Other parsers go here
         else:
             return None
@@ -63,25 +125,124 @@ class ArticleParser():
         If it is valid, extractss the various article fields from the given html_text and 
         returns the final-indexable object.
         Otherwise, returns 'None'"""
+        start = time.perf_counter()
         parser = self.__get_html_parser(html_text, url)
-        if parser.is_valid_article_page():
-            art_text = parser.extract_article_text()
-            # If the page has valid article text
-            if art_text is not None and len(art_text) > conf_parser.ARTICLE_TEXT_LEN_LIMIT:
-                title = parser.extract_title()
-                desc = parser.extract_description()
-                keywords = parser.extract_keywords()
-                pub_date = parser.extract_publish_date()
+        parsed = time.perf_counter()
+        METRICS.observe(metric_name('parse', parser.website_name), parsed - start)
+        article_doc = None
+        outcome = 'invalid'
+        is_valid = parser.is_valid_article_page()
+        METRICS.observe(metric_name('validity', parser.website_name), time.perf_counter() - parsed)
+        if is_valid:
+            # None if the page does not have a valid article text
+            fields = parser.extract_fields()
+            outcome = 'no_text'
+            if fields is not None:
                 # Make the document
-                article_doc = make_article_doc(url, title, desc, keywords, pub_date, art_text)
-                return article_doc
-        
-        # In case of failures
-        return None
+                article_doc = make_article_doc(url, fields['title'], fields['description'], \
+                    fields['keywords'], fields['publish_date'], fields['article_text'])
+                outcome = 'article'
+
+        elapsed = time.perf_counter() - start
+        METRICS.observe(metric_name('extract_article', parser.website_name), elapsed)
+        METRICS.count(metric_name('pages', parser.website_name, outcome))
+        METRICS.observe_url(url, elapsed)
+        # None in case of failures
+        return article_doc
+
+def get_html_file_path(d_url: str, base_url: str, website_base_dir: str):
+    """Map the URL to the path of its downloaded HTML file under website_base_dir"""
+    # To avoid confusions
+    url_ = d_url.replace("http://", "https://")
+    # Remove the base path
+    relative_path = url_.replace(base_url, '')
+    relative_path = relative_path.lstrip("/") # Remove the first '/' in the path, if exists
+    return os.path.join(website_base_dir, relative_path)
+
+# Possible outcomes of extracting the article of a single URL
+EXTRACT_MISSING = 'missing'
+EXTRACT_EMPTY = 'empty'
+EXTRACT_DONE = 'extracted'
+EXTRACT_ERROR = 'error'
+
+def extract_from_html(article_parser: ArticleParser, d_url: str, html_text, minhasher: MinHasher = None):
+    """Extract the article of d_url from its HTML.
+    Returns a tuple (d_url, status, result) where the result is the article doc
+    if status is EXTRACT_DONE, the traceback if it is EXTRACT_ERROR and None otherwise.
+    If minhasher is given, the article doc carries the MinHash signature of its text for the Deduplicator"""
+    # Catch any kind of exception here and just report it, so that the caller can move on
+    try:
+        logger.debug("Going to extract and index the article from {}".format(d_url))
+
+        # Extract the article details
+        article_doc = article_parser.extract_article(html_text, d_url)
+        logger.debug('Artile:{}'.format(article_doc))
+        if article_doc is None:
+            return d_url, EXTRACT_EMPTY, None
+        if minhasher is not None:
+            with METRICS.timer('minhash'):
+                article_doc[SIGNATURE_FIELD] = minhasher.signature(article_doc['article_text'])
+        return d_url, EXTRACT_DONE, article_doc
+    except:
+        return d_url, EXTRACT_ERROR, traceback.format_exc()
+
+def extract_urls(article_parser: ArticleParser, urls, base_url: str, website_base_dir: str, reader, \
+    profiler: PageProfiler = None, minhasher: MinHasher = None):
+    """Extract the articles of the urls in the same order. Their HTML files are read by the reader: a Prefetcher
+    reading them ahead of the extraction, or the DumpArchive of the website.
+    The extraction of every page is profiled by the profiler, if given"""
+    def keyed_paths():
+        for d_url in urls:
+            html_file_path = get_html_file_path(d_url, base_url, website_base_dir)
+            yield (d_url, html_file_path), html_file_path
+
+    for (d_url, html_file_path), html_text in reader.read_ahead(keyed_paths()):
+        if html_text is None:
+            logger.warning("The html file {0} does not exist for the URL {1}".format(html_file_path, d_url))
+            yield d_url, EXTRACT_MISSING, None
+            continue
+        with profile_page(profiler):
+            result = extract_from_html(article_parser, d_url, html_text, minhasher)
+        yield result
+
+# State of an extraction worker process, set once by _init_extract_worker
+_worker_state = {}
+
+def _init_extract_worker(website, rules_path, base_url, website_base_dir, prefetch_threads, prefetch_depth, archive_path, \
+    slowest_urls, minhasher):
+    # A forked worker starts with a copy of the METRICS of the main process, which are counted there already
+    METRICS.reset()
+    METRICS.slowest_n = slowest_urls
+    _worker_state['article_parser'] = ArticleParser(website, rules_path=rules_path)
+    if archive_path is not None:
+        _worker_state['reader'] = DumpArchive(archive_path, website_base_dir)
+    else:
+        _worker_state['reader'] = Prefetcher(prefetch_threads, prefetch_depth)
+    _worker_state['base_url'] = base_url
+    _worker_state['website_base_dir'] = website_base_dir
+    _worker_state['minhasher'] = minhasher
+
+def _extract_url_batch(url_batch):
+    """Runs in the worker process. Extracts the articles of the given batch of URLs.
+    Returns them along with the metrics recorded for them"""
+    results = list(extract_urls(_worker_state['article_parser'], url_batch, \
+        _worker_state['base_url'], _worker_state['website_base_dir'], _worker_state['reader'], \
+        minhasher=_worker_state['minhasher']))
+    return results, METRICS.take_snapshot()
+
+def _collect_url_batch(async_result):
+    """Results of a batch extracted by a worker process, merging its metrics into the METRICS of this process"""
+    results, metrics_snapshot = async_result.get()
+    METRICS.merge(metrics_snapshot)
+    return results
 
 class ArticleExtractor():
     def __init__(self, seed_storage: StorageI, article_storage: StorageI, \
-        website: Website, website_base_dir: str, base_url: str, save_batch_limit = 1000):
+        website: Website, website_base_dir: str, base_url: str, save_batch_limit = 1000, \
+        num_workers = 1, worker_batch_size = 100, rules_path = None, lookup_dir = None, lookup_name = None, \
+        track_extraction_state = False, checkpoint: Checkpoint = None, resume = False, \
+        prefetch_threads = 4, prefetch_depth = 32, archive_path = None, reporter: ProgressReporter = None, \
+        profiler: PageProfiler = None, deduplicator: Deduplicator = None):
         """Extract the articles from those URLs from seed_storage whose HTML is already
          downloaded and save the article document to article_storage.
 
@@ -92,105 +253,299 @@ class ArticleExtractor():
             website_base_dir (str): The base path of the downloaded HTML file on the local storage
             base_url (str): The base URL of all the urls
             save_batch_limit (int): Num of article docs to be batched to save in one go
+            num_workers (int): Num of worker processes used for the extraction. 1 extracts in this process
+            worker_batch_size (int): Num of urls sent to a worker process in one go
+            rules_path (str): Declarative extraction rules of the website. The built-in parser of website if None
+            lookup_dir (str): Directory of the persistent url lookup index. In-memory lookup if None
+            lookup_name (str): Name of the url lookup index files, usually the article index name
+            track_extraction_state (bool): Mark the processed urls on seed_storage(extracted, parser_version)
+                and query only the urls not extracted yet. Needs a writable seed_storage
+            checkpoint (Checkpoint): Saves the counters and the last saved batch after every batch, if given
+            resume (bool): Continue an interrupted run from the checkpoint. The urls saved by that run are
+                skipped using the persistent url lookup, without syncing it with article_storage. Needs lookup_dir
+            prefetch_threads (int): Num of threads reading the HTML files ahead of the extraction, per process
+            prefetch_depth (int): Num of HTML files read ahead, per process. 0 reads them one by one
+            archive_path (str): Packed dump of the website (see dump_archive), read instead of website_base_dir if given
+            reporter (ProgressReporter): Reports the progress over the downloaded urls and the METRICS. A default one if None
+            profiler (PageProfiler): Profiles the pages in this process, without the worker processes, if given
+            deduplicator (Deduplicator): Sets the cluster_id of the near-duplicate articles (or drops them), if given.
+                The signatures are computed along with the extraction, by the worker processes
         """
         self.seed_storage = seed_storage
         self.article_storage = article_storage
+        self.website = website
         self.website_base_dir = website_base_dir
         self.base_url = base_url
         self.save_batch_limit = save_batch_limit
+        self.num_workers = num_workers
+        self.worker_batch_size = worker_batch_size
+        self.rules_path = rules_path
+        self.track_extraction_state = track_extraction_state
+        # Urls processed since the last saved batch, to be marked on seed_storage
+        self.processed_urls = []
+        # Batch written in the background, not yet confirmed as saved
+        self.unconfirmed_batch = None
 
-        self.url_lookup = URLLookup(self.article_storage)
-        self.article_parser = ArticleParser(website)
-
-    def __get_html_text(self, d_url: str):
-        # To avoid confusions
-        url_ = d_url.replace("http://", "https://")
-        # Remove the base path
-        relative_path = url_.replace(self.base_url, '')
-        relative_path = relative_path.lstrip("/") # Remove the first '/' in the path, if exists
-        html_file_path = os.path.join(self.website_base_dir, relative_path)
-        if os.path.isfile(html_file_path):
-            # Path exists and it is a file, read the text
-            return open(html_file_path, 'rb').read()
-        else:
-            logger.warning("The html file {0} does not exist for the URL {1}".format(html_file_path, d_url))
-            return None
+        if resume and lookup_dir is None:
+            # The in-memory lookup would be loaded from article_storage all over again
+            raise ValueError("Resuming needs the persistent url lookup, set url_lookup_dir in the run_config")
+        self.checkpoint = checkpoint
+        self.progress = {'extracted': 0, 'saved_batches': 0, 'last_batch': None}
+        saved_progress = checkpoint.load() if checkpoint is not None and resume else None
+        if saved_progress is not None:
+            self.progress.update(saved_progress)
+            last_batch = self.progress['last_batch'] or {}
+            logger.warning("Resuming after {0} saved batches, extracted:{1}, last saved:{2}"\
+                .format(self.progress['saved_batches'], self.progress['extracted'], last_batch.get('last_id')))
+        elif resume:
+            logger.warning("No checkpoint to resume from, starting from scratch")
+
+        # The persistent url lookup already has the urls saved by the interrupted run
+        self.url_lookup = URLLookup(self.article_storage, lookup_dir, lookup_name, sync=saved_progress is None)
+        self.article_parser = ArticleParser(website, rules_path=rules_path)
+        self.prefetch_threads = prefetch_threads
+        self.prefetch_depth = prefetch_depth
+        self.archive_path = archive_path
+        self.reporter = reporter if reporter is not None else ProgressReporter('article extraction')
+        self.profiler = profiler
+        self.deduplicator = deduplicator
+        self.minhasher = deduplicator.minhasher if deduplicator is not None else None
+        if profiler is not None and num_workers > 1:
+            logger.warning("Profiling in this process, instead of {} worker processes".format(num_workers))
+            self.num_workers = 1
 
     def __save_article_batch(self, article_batch):
-        """Save the list of article documents to article_storage in one go"""
+        """Save the list of article documents to article_storage in one go.
+        If the storage writes in the background, the batch is confirmed while saving the next one,
+        so that the extraction of the next batch overlaps with the write"""
+        if self.article_storage.writes_in_background:
+            self.__confirm_saved_batch(article_batch)
         self.article_storage.save_documents(article_batch)
+        self.unconfirmed_batch = (article_batch, self.processed_urls)
+        self.processed_urls = []
+        if not self.article_storage.writes_in_background:
+            self.__confirm_saved_batch()
 
-    def extract_and_save_pending_articles(self):
-        """Gather the URLs whose HTML is stored locally and has not been extracted"""
-        logger.warning("Going to do a bulk-scroll on the seed storage.")
-        
-        # URLs whose HTML is stored
+    def __confirm_saved_batch(self, next_batch=()):
+        """Once the unconfirmed batch is saved, add it to the url lookup, mark its seed urls and checkpoint.
+        The articles that failed to be written are left out, so that they are extracted again by the next run.
+        next_batch is the batch to be written after it, if any"""
+        if self.unconfirmed_batch is None:
+            return
+        self.article_storage.flush()
+        failed_ids = set(self.article_storage.take_failed_ids())
+        article_batch, processed_urls = self.unconfirmed_batch
+        self.unconfirmed_batch = None
+        if len(failed_ids) > 0:
+            logger.error("{} articles failed to be saved, they are left for the next run".format(len(failed_ids)))
+            article_batch = [article_doc for article_doc in article_batch if article_doc['id'] not in failed_ids]
+            # Their seed urls stay pending as well
+            processed_urls = [url for url in processed_urls if url not in failed_ids]
+        if self.deduplicator is not None:
+            # The clusters of the saved articles are kept
+            reclustered = self.deduplicator.commit(failed_ids)
+            processed_urls = self.__move_to_new_clusters(reclustered, article_batch, next_batch, processed_urls)
+        self.url_lookup.add_urls([article_doc['id'] for article_doc in article_batch])
+        # Mark the seed urls only after their articles are saved
+        self.__mark_extracted(processed_urls)
+        self.__save_checkpoint(article_batch)
+
+    def __move_to_new_clusters(self, reclustered, article_batch, next_batch, processed_urls):
+        """Update the cluster_id of the near-duplicates of the failed articles, as given by Deduplicator.commit.
+        The ones dropped for a failed article stay pending, so that they are extracted again along with it.
+        Returns the processed_urls left to be marked"""
+        if len(reclustered) == 0:
+            return processed_urls
+        logger.warning("{} near-duplicates of the failed articles are clustered again".format(len(reclustered)))
+        dropped_ids = {id for id, cluster_id in reclustered.items() if cluster_id is None}
+        self.processed_urls = [url for url in self.processed_urls if url not in dropped_ids]
+        # The saved ones are updated on the storage, the ones of the next batch before they are written
+        cluster_docs = [{'id': article_doc['id'], 'cluster_id': reclustered[article_doc['id']]} \
+            for article_doc in article_batch if reclustered.get(article_doc['id']) is not None]
+        if len(cluster_docs) > 0:
+            self.article_storage.update_documents(cluster_docs)
+        for article_doc in next_batch:
+            if reclustered.get(article_doc['id']) is not None:
+                article_doc['cluster_id'] = reclustered[article_doc['id']]
+        return [url for url in processed_urls if url not in dropped_ids]
+
+    def __save_checkpoint(self, article_batch):
+        self.progress['extracted'] += len(article_batch)
+        self.progress['saved_batches'] += 1
+        if len(article_batch) > 0:
+            self.progress['last_batch'] = {'size': len(article_batch), \
+                'first_id': article_batch[0]['id'], 'last_id': article_batch[-1]['id']}
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.progress)
+
+    def __mark_extracted(self, urls):
+        """Record the extraction state on the seed docs of the processed urls, in one bulk request"""
+        if not self.track_extraction_state or len(urls) == 0:
+            return
+        state_docs = [make_extraction_state_doc(url, conf_parser.PARSER_VERSION) for url in urls]
+        self.seed_storage.update_documents(state_docs)
+
+    def __get_pending_query(self):
+        """Query for the URLs whose HTML is stored"""
         es_query_downloaded = {
             "_source": ["downloaded"],
             "query": {"bool": {"must": [{"term": {"downloaded": "true"} }] } } }
-        # Do a bulk-scroll here
-        downloaded_url_itr = self.seed_storage.get_documents(es_query_downloaded, bulk_scroll=True)
-        downloaded_count = 0
-        extracted_count = 0
+        if self.track_extraction_state:
+            # Leave out the URLs already extracted by the current parser version
+            es_query_downloaded["query"]["bool"]["must_not"] = [{"bool": {"must": [
+                {"term": {"extracted": "true"}},
+                {"term": {"parser_version": conf_parser.PARSER_VERSION}}] } }]
+        return es_query_downloaded
 
-        # Find the downloaded URLs whose article has not been extracted
-        article_batch = []
+    def __get_pending_urls(self, downloaded_url_itr):
+        """Yield the downloaded URLs whose article has not been extracted"""
         for doc in downloaded_url_itr:
             # Get the url from doc
             d_url = doc['_id']
-            downloaded_count += 1
+            self.downloaded_count += 1
 
             if self.url_lookup.url_exists(d_url):
-                # Article is already extracted, Nothing to do here
+                # Article is already extracted, just make sure its seed doc says so
+                if self.track_extraction_state:
+                    self.processed_urls.append(d_url)
                 continue
-            else:
-                # Catch any kind of exception here and just log it and move on
-                try:
-                    logger.debug("Going to extract and index the article from {}".format(d_url))
-
-                    # Get the downloaded HTML text
-                    html_text = self.__get_html_text(d_url)
-                    if html_text is not None:
-                        # Extract the article details
-                        article_doc = self.article_parser.extract_article(html_text, d_url)
-                        logger.debug('Artile:{}'.format(article_doc))
-
-                        # Accumulate the docs into a mini-batch and save them.
-                        # if article_doc is not None, accumulate it
-                        if article_doc is not None:
-                            article_batch.append(article_doc)
-                            extracted_count += 1
-                        else:
-                            conf_parser.error_logger.error("Empty artilce:{}".format(d_url))
-
-                        if len(article_batch) >= self.save_batch_limit:
-                            self.__save_article_batch(article_batch)
-                            article_batch = [] # Clear the batch
-                    else:
-                        # Ignore these errors for now
-                        pass
-
-                except:
-                    # Just log and move on
-                    logger.error("Error on {}".format(d_url))
-                    conf_parser.error_logger.error(traceback.format_exc())
+            yield d_url
+
+    def __extract_serial(self, pending_urls):
+        if self.archive_path is not None:
+            reader = DumpArchive(self.archive_path, self.website_base_dir)
+        else:
+            reader = Prefetcher(self.prefetch_threads, self.prefetch_depth)
+        try:
+            yield from extract_urls(self.article_parser, pending_urls, self.base_url, self.website_base_dir, reader, \
+                self.profiler, self.minhasher)
+        finally:
+            reader.close()
+
+    def __extract_parallel(self, pending_urls):
+        """Shard the pending URLs into batches and extract them on a pool of worker processes.
+        The results are yielded in the same order as the URLs"""
+        # The background writes of the storage run on a thread, which must not be forked along with its locks
+        context = multiprocessing.get_context('forkserver' if self.article_storage.writes_in_background else None)
+        pool = context.Pool(self.num_workers, initializer=_init_extract_worker, \
+            initargs=(self.website, self.rules_path, self.base_url, self.website_base_dir, \
+                self.prefetch_threads, self.prefetch_depth, self.archive_path, METRICS.slowest_n, \
+                self.minhasher))
+        in_flight = deque()
+        try:
+            url_batch = []
+            for d_url in pending_urls:
+                url_batch.append(d_url)
+                if len(url_batch) >= self.worker_batch_size:
+                    in_flight.append(pool.apply_async(_extract_url_batch, (url_batch,)))
+                    url_batch = []
+                # Keep the workers busy, but do not run ahead of them
+                if len(in_flight) >= 2 * self.num_workers:
+                    yield from _collect_url_batch(in_flight.popleft())
+
+            if len(url_batch) > 0:
+                in_flight.append(pool.apply_async(_extract_url_batch, (url_batch,)))
+            while len(in_flight) > 0:
+                yield from _collect_url_batch(in_flight.popleft())
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def extract_and_save_pending_articles(self):
+        """Gather the URLs whose HTML is stored locally and has not been extracted"""
+        logger.warning("Going to do a bulk-scroll on the seed storage.")
+        
+        if self.profiler is not None:
+            self.profiler.start()
+        # Do a bulk-scroll here
+        pending_query = self.__get_pending_query()
+        if self.reporter.total is None:
+            self.reporter.total = self.seed_storage.count_documents(pending_query)
+        downloaded_url_itr = self.seed_storage.get_documents(pending_query, bulk_scroll=True)
+        self.downloaded_count = 0
+
+        # Find the downloaded URLs whose article has not been extracted
+        pending_urls = self.__get_pending_urls(downloaded_url_itr)
+        if self.num_workers > 1:
+            logger.warning("Extracting the articles using {} worker processes".format(self.num_workers))
+            extract_results = self.__extract_parallel(pending_urls)
+        else:
+            extract_results = self.__extract_serial(pending_urls)
+
+        article_batch = []
+        for d_url, status, result in extract_results:
+            # Accumulate the docs into a mini-batch and save them.
+            if status == EXTRACT_DONE:
+                # A near-duplicate is left out in the drop mode of the deduplicator
+                if self.deduplicator is None or self.deduplicator.process(result):
+                    article_batch.append(result)
+            elif status == EXTRACT_EMPTY:
+                conf_parser.error_logger.error("Empty artilce:{}".format(d_url))
+            elif status == EXTRACT_ERROR:
+                # Just log and move on
+                logger.error("Error on {}".format(d_url))
+                conf_parser.error_logger.error(result)
+            # Ignore the missing HTML files for now
+
+            if self.track_extraction_state and status in (EXTRACT_DONE, EXTRACT_EMPTY):
+                self.processed_urls.append(d_url)
+            # The scrolled urls, ahead of the extraction by the urls in flight at most
+            self.reporter.update(self.downloaded_count)
+
+            if len(article_batch) >= self.save_batch_limit or len(self.processed_urls) >= self.save_batch_limit:
+                self.__save_article_batch(article_batch)
+                article_batch = [] # Clear the batch
 
         # Save the residual article_doc in the list
         self.__save_article_batch(article_batch)
-        logger.info("Done processing. Downloaded urls:{0}. Extracted urls:{1}".format(downloaded_count, extracted_count))
+        self.__confirm_saved_batch()
+        self.url_lookup.close()
+        if self.deduplicator is not None:
+            self.deduplicator.close()
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+        logger.info("Done processing. Downloaded urls:{0}. Extracted urls:{1}".format(self.downloaded_count, self.progress['extracted']))
+        self.reporter.finish(self.downloaded_count)
+        if self.profiler is not None:
+            self.profiler.finish()
 
-def run_extractor():
+def run_extractor(resume=False, profile=None):
     seed_url_config = conf_parser.SYS_CONFIG['url_index']
     article_config = conf_parser.SYS_CONFIG['article_index']
-    seed_storage = ESStorage(seed_url_config, read_only=True)
-    article_storage = ESStorage(article_config)
-
     run_config = conf_parser.SYS_CONFIG['run_config']
-    website_enum = Website(run_config['website_enum'])
+    # The extraction state is written back to the seed urls
+    track_extraction_state = run_config.get('track_extraction_state', False)
+    seed_storage = make_storage(seed_url_config, read_only=not track_extraction_state)
+    # With async_storage, the articles are written in the background while extracting the next ones
+    article_storage = make_storage(article_config, async_writes=run_config.get('async_storage', False))
+
+    rules_path = run_config.get('extraction_rules')
+    # A website driven by extraction rules does not need an entry in Website
+    website_enum = Website(run_config['website_enum']) if rules_path is None else run_config['website_enum']
     website_base_dir = run_config['website_base_dir']
     base_url = run_config['base_url']
-    art_extractor = ArticleExtractor(seed_storage, article_storage, website_enum, website_base_dir, base_url)
+    num_workers = run_config.get('extract_workers', 1)
+    worker_batch_size = run_config.get('extract_worker_batch_size', 100)
+    checkpoint = None
+    if run_config.get('checkpoint_dir') is not None:
+        checkpoint = Checkpoint(run_config['checkpoint_dir'], article_config['index'] + '_articles')
+    METRICS.slowest_n = run_config.get('slowest_urls', 20)
+    reporter = ProgressReporter('article extraction', every_seconds=run_config.get('progress_every_seconds', 30), \
+        metrics_path=metrics_path(run_config, article_config['index'] + '_articles'))
+    art_extractor = ArticleExtractor(seed_storage, article_storage, website_enum, website_base_dir, base_url, \
+        num_workers=num_workers, worker_batch_size=worker_batch_size, rules_path=rules_path, \
+        lookup_dir=run_config.get('url_lookup_dir'), lookup_name=article_config['index'], \
+        track_extraction_state=track_extraction_state, checkpoint=checkpoint, resume=resume, \
+        prefetch_threads=run_config.get('prefetch_threads', 4), prefetch_depth=run_config.get('prefetch_depth', 32), \
+        archive_path=run_config.get('dump_archive'), reporter=reporter, \
+        profiler=make_profiler(run_config, article_config['index'] + '_articles', profile), \
+        deduplicator=make_deduplicator(run_config, article_config['index']))
     art_extractor.extract_and_save_pending_articles()
+    article_storage.close()
+    seed_storage.close()
 
 if __name__ == '__main__':
-    run_extractor()
\ No newline at end of file
+    # Continue an interrupted run from its checkpoint with --resume
+    # Profile the first pages with --profile or --profile=sampling, see profiler
+    run_extractor(resume='--resume' in sys.argv[1:], profile=profile_flag(sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,103 @@
+import time
+import itertools
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_scan, async_streaming_bulk
+from elasticsearch.exceptions import ConflictError
+import conf_parser
+from es_helper import make_bulk_actions, make_update_actions, log_bulk_failure
+from metrics import METRICS, metric_name
+
+import logging
+logger = logging.getLogger(__name__)
+
+class AsyncESHelper():
+    """asyncio counterpart of ESHelper on the AsyncElasticsearch client (needs aiohttp).
+    Must be created and used from within a running event loop"""
+    def __init__(self, elastic_conf):
+        self.elastic_conf = elastic_conf
+        self.es = AsyncElasticsearch([{'host': elastic_conf['host'], 'port': elastic_conf['port']}])
+        self.index = elastic_conf['index']
+        self.doc_type = self.index # use the index name itself
+
+    def get_index_name(self):
+        return self.index
+
+    async def index_exists(self):
+        """Check if index exists or not"""
+        return await self.es.indices.exists(index=self.index)
+
+    async def index_doc(self, doc, update_if_exists=False):
+        op_type = "index" if update_if_exists else "create"
+        try:
+            return await self.es.index(index=self.index, doc_type=self.doc_type, id=doc['id'], body=doc, op_type=op_type)
+        except ConflictError:
+            conf_parser.error_logger.error("Indexing failed! Duplicate document: {}".format(doc))
+        return None
+
+    async def __bulk_write(self, actions):
+        """Send the actions to the _bulk API in chunks and check the response of each item.
+        The items rejected with 429 are retried bulk_max_retries times.
+        Returns the number of items that failed and the ids of those that failed to be written(not the duplicates)"""
+        start = time.perf_counter()
+        fail_count = 0
+        failed_ids = []
+        async for ok, item in async_streaming_bulk(self.es, actions,
+            chunk_size=self.elastic_conf.get('bulk_chunk_size', 500),
+            max_chunk_bytes=self.elastic_conf.get('bulk_max_chunk_bytes', 100 * 1024 * 1024),
+            max_retries=self.elastic_conf.get('bulk_max_retries', 3),
+            initial_backoff=self.elastic_conf.get('bulk_initial_backoff', 2),
+            raise_on_error=False, raise_on_exception=False):
+            if ok:
+                continue
+            fail_count += 1
+            failed_id = log_bulk_failure(item)
+            if failed_id is not None:
+                failed_ids.append(failed_id)
+        METRICS.observe(metric_name('bulk_write', self.index), time.perf_counter() - start)
+        return fail_count, failed_ids
+
+    async def index_documents(self, documents, update_if_exists=False):
+        op_type = "index" if update_if_exists else "create"
+        skipped = []
+        fail_count, failed_ids = await self.__bulk_write(make_bulk_actions(self.index, self.doc_type, documents, op_type, skipped))
+        drop_count = len(skipped) + fail_count
+        logger.info('## Indexed {0} Dropped {1}'.format(len(documents)-drop_count, drop_count))
+        return len(documents)-drop_count, drop_count, failed_ids
+
+    async def update_documents(self, documents, upsert=False):
+        skipped = []
+        fail_count, failed_ids = await self.__bulk_write(make_update_actions(self.index, self.doc_type, documents, upsert, skipped))
+        drop_count = len(skipped) + fail_count
+        logger.info('## Updated {0} Dropped {1}'.format(len(documents)-drop_count, drop_count))
+        return len(documents)-drop_count, drop_count, failed_ids
+
+    async def create_and_upsert_documents(self, documents, upsert_documents):
+        skipped = []
+        actions = itertools.chain(make_bulk_actions(self.index, self.doc_type, documents, "create", skipped),
+            make_update_actions(self.index, self.doc_type, upsert_documents, True, skipped))
+        fail_count, failed_ids = await self.__bulk_write(actions)
+        total_count = len(documents) + len(upsert_documents)
+        drop_count = len(skipped) + fail_count
+        logger.info('## Created/Upserted {0} Dropped {1}'.format(total_count-drop_count, drop_count))
+        return total_count-drop_count, drop_count, failed_ids
+
+    async def count(self, json_query):
+        if not await self.index_exists():
+            return 0
+        res = await self.es.count(index=self.index, body={'query': json_query.get('query', {'match_all': {}})})
+        return res['count']
+
+    async def doc_by_id(self, id):
+        return await self.es.get(index=self.index, doc_type=self.doc_type, id=id)
+
+    async def search(self, json_query):
+        res = await self.es.search(index=self.index, doc_type=self.doc_type, body=json_query)
+        return [src['_source'] for src in res['hits']['hits']]
+
+    def bulk_scroll(self, json_query):
+        """Async iterator over all the documents of the query"""
+        return async_scan(self.es, index=self.index, doc_type=self.doc_type, query=json_query, scroll='15m', \
+            size=self.elastic_conf.get('scroll_page_size', 1000))
+
+    async def close(self):
+        await self.es.close()
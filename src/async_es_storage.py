@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import concurrent.futures
+from storage import StorageI
+from async_es_helper import AsyncESHelper
+from metrics import METRICS, metric_name
+
+import logging
+logger = logging.getLogger(__name__)
+
+class AsyncESStorage(StorageI):
+    """Elasticsearch storage whose bulk writes are sent in the background, on an asyncio event loop of its own.
+    The caller goes on reading and parsing the pages while the writes are in flight. At most
+    bulk_max_in_flight(index conf) bulk writes are pending, the next one waits for a free slot.
+    flush() waits for the pending writes, the other calls wait for their own result."""
+    writes_in_background = True
+
+    # Num of docs handed over from the event loop at a time, while scrolling
+    SCROLL_HANDOVER_SIZE = 1000
+
+    def __init__(self, es_index_conf, read_only=False):
+        self.read_only = read_only
+        self.in_flight = threading.BoundedSemaphore(es_index_conf.get('bulk_max_in_flight', 4))
+        self.pending_writes = set()
+        self.write_errors = []
+        self.failed_ids = []
+        self.indexed_count = 0
+        self.dropped_count = 0
+        self.lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        # The client must be created on its event loop
+        self.eshelper = self.__run(self.__make_helper(es_index_conf))
+        logger.warning('Connected to {0} index asynchronously. Read only:{1}'\
+            .format(self.eshelper.get_index_name(), self.read_only))
+
+    @staticmethod
+    async def __make_helper(es_index_conf):
+        return AsyncESHelper(es_index_conf)
+
+    def __run(self, coroutine):
+        """Run the coroutine on the event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def __check_writeability(self):
+        """Exit if the index is not write-able"""
+        if self.read_only:
+            logger.error('Cannot write to index {}. Opened in read-only mode!'.format(self.eshelper.get_index_name()))
+            exit()
+
+    def __submit_write(self, coroutine):
+        self.in_flight.acquire()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        with self.lock:
+            self.pending_writes.add(future)
+        future.add_done_callback(self.__write_done)
+
+    def __write_done(self, future):
+        with self.lock:
+            self.pending_writes.discard(future)
+            if future.exception() is not None:
+                logger.error('Bulk write to {0} failed: {1}'.format(self.eshelper.get_index_name(), future.exception()))
+                self.write_errors.append(future.exception())
+            else:
+                indexed, dropped, failed_ids = future.result()
+                self.indexed_count += indexed
+                self.dropped_count += dropped
+                self.failed_ids.extend(failed_ids)
+        self.in_flight.release()
+
+    def flush(self):
+        """Wait for the pending writes. Raises the error of a failed write, so that the caller
+        does not take the documents of that write as saved"""
+        with self.lock:
+            pending_writes = list(self.pending_writes)
+        concurrent.futures.wait(pending_writes)
+        with self.lock:
+            write_errors, self.write_errors = self.write_errors, []
+        if len(write_errors) > 0:
+            raise write_errors[0]
+
+    def take_failed_ids(self):
+        with self.lock:
+            failed_ids, self.failed_ids = self.failed_ids, []
+        return failed_ids
+
+    def storage_exists(self):
+        return self.__run(self.eshelper.index_exists())
+
+    def save_doc(self, doc, update_if_exists=False):
+        """Index the doc, waiting for the result"""
+        self.__check_writeability()
+        return self.__run(self.eshelper.index_doc(doc, update_if_exists))
+
+    def save_documents(self, documents, update_if_exists=False):
+        """Index multile documents in the background"""
+        self.__check_writeability()
+        self.__submit_write(self.eshelper.index_documents(documents, update_if_exists))
+
+    def update_documents(self, documents, upsert=False):
+        """Partially update multiple documents in the background"""
+        self.__check_writeability()
+        self.__submit_write(self.eshelper.update_documents(documents, upsert))
+
+    def save_and_upsert(self, documents, upsert_documents):
+        """Create the absent documents and upsert the partial upsert_documents in the background"""
+        self.__check_writeability()
+        self.__submit_write(self.eshelper.create_and_upsert_documents(documents, upsert_documents))
+
+    def get_doc_by_id(self, id):
+        return self.__run(self.eshelper.doc_by_id(id))
+
+    def get_documents(self, query, bulk_scroll=False):
+        if bulk_scroll:
+            return self.__iterate(self.eshelper.bulk_scroll(query))
+        else:
+            return self.__run(self.eshelper.search(query))
+
+    def count_documents(self, query):
+        return self.__run(self.eshelper.count(query))
+
+    def __iterate(self, async_itr):
+        """Iterate over the async iterator from this thread, handing over the docs in chunks"""
+        async def next_chunk():
+            chunk = []
+            try:
+                while len(chunk) < self.SCROLL_HANDOVER_SIZE:
+                    chunk.append(await async_itr.__anext__())
+            except StopAsyncIteration:
+                pass
+            return chunk
+
+        scroll_metric = metric_name('scroll_page', self.eshelper.get_index_name())
+        while True:
+            with METRICS.timer(scroll_metric):
+                chunk = self.__run(next_chunk())
+            yield from chunk
+            if len(chunk) < self.SCROLL_HANDOVER_SIZE:
+                return
+
+    def close(self):
+        self.flush()
+        logger.info('Async writes to {0}: Indexed {1} Dropped {2}'\
+            .format(self.eshelper.get_index_name(), self.indexed_count, self.dropped_count))
+        self.__run(self.eshelper.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
@@ -0,0 +1,241 @@
+"""Throughput benchmarks of the extraction pipeline on a synthetic corpus (see synthetic_pages).
+Measures pages/sec and MB/sec of the link extraction, the parsing and every field method of the site parsers,
+ArticleParser.extract_article and the write path of the storages: Elasticsearch against a local stand-in
+of the _bulk API, and the embedded SQLite storage.
+
+Every run is appended to benchmarks/results.jl along with the git commit, and compared with the latest run
+of another commit (or the given one), so that the regressions between the commits are visible.
+
+Usage:
+python3 src/benchmark.py [NUM PAGES PER WEBSITE] [BASELINE COMMIT]
+"""
+import os
+import sys
+import time
+import json
+import platform
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+logger = logging.getLogger(__name__)
+
+import conf_parser
+from html_parser import Website, KannadaPrabhaParser, PrajavaniParser, VijayakarnatakaParser
+from article_extractor import ArticleParser
+from link_extractor import LinkExtractor
+from es_storage import ESStorage
+from sqlite_storage import SQLiteStorage
+from synthetic_pages import generate_pages, BASE_URLS
+
+RESULTS_PATH = 'benchmarks/results.jl'
+# Best of these many runs of every benchmark
+REPEAT = 3
+# A drop in pages/sec larger than this, from the baseline run, is reported as a regression
+REGRESSION_THRESHOLD = 0.1
+
+SITE_PARSERS = {
+    Website.KANNADAPRABHA: KannadaPrabhaParser,
+    Website.PRAJAVANI: PrajavaniParser,
+    Website.VIJAYAKARNATAKA: VijayakarnatakaParser,
+}
+FIELD_METHODS = ['is_valid_article_page', 'extract_title', 'extract_description', 'extract_keywords', \
+    'extract_publish_date', 'extract_article_text']
+
+class StandInBulkHandler(BaseHTTPRequestHandler):
+    """Local stand-in of Elasticsearch: answers the ping and acknowledges every item of a _bulk request"""
+    ITEM = b'{"index":{"status":201}}'
+
+    def __reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.__reply(b'')
+
+    def do_GET(self):
+        self.__reply(b'{"version":{"number":"7.6.1"},"tagline":"You Know, for Search"}')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        # Every action of the pipeline is followed by its source line
+        num_items = body.count(b'\n') // 2
+        self.__reply(b'{"took":1,"errors":false,"items":[' + b','.join([self.ITEM] * num_items) + b']}')
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stand_in_es():
+    """Serve the stand-in on a free local port. Returns the server"""
+    server = ThreadingHTTPServer(('localhost', 0), StandInBulkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def measure(pages, run, setup=None):
+    """Time run(pages), the best of REPEAT runs, each after an untimed setup() if given.
+    Returns the throughput over the pages"""
+    best = None
+    for _ in range(REPEAT):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run(pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    num_bytes = sum(len(html_text) for _, html_text in pages)
+    return {'pages': len(pages), 'seconds': round(best, 4), 'pages_per_sec': round(len(pages) / best, 1), \
+        'mb_per_sec': round(num_bytes / best / 1024 / 1024, 2)}
+
+def bench_link_extraction(corpus, results):
+    all_pages = [page for pages in corpus.values() for page in pages]
+    for mode, fast_mode in [('full', False), ('fast', True)]:
+        extractor = LinkExtractor(fast_mode=fast_mode)
+        def run(pages):
+            for url, html_text in pages:
+                extractor.extract(html_text, url, ['kannadaprabha', 'prajavani', 'vijaykarnataka'])
+        results['link_extract/' + mode] = measure(all_pages, run)
+
+def bench_site_parsers(corpus, results):
+    for website, pages in corpus.items():
+        parser_class = SITE_PARSERS[website]
+        def parse(pages):
+            return [parser_class(html_text, url) for url, html_text in pages]
+        results['parse/' + website.value] = measure(pages, parse)
+
+        # The field methods are timed on the already parsed pages
+        for method in FIELD_METHODS:
+            parsers = []
+            def run(pages):
+                for parser in parsers.pop():
+                    getattr(parser, method)()
+            # A fresh set of parsers for every repeat, extract_article_text changes the tree
+            parsers.extend(parse(pages) for _ in range(REPEAT))
+            results['{0}/{1}'.format(website.value, method)] = measure(pages, run)
+
+def bench_article_extraction(corpus, results):
+    for website, pages in corpus.items():
+        article_parser = ArticleParser(website)
+        def run(pages):
+            for url, html_text in pages:
+                article_parser.extract_article(html_text, url)
+        results['extract_article/' + website.value] = measure(pages, run)
+
+def bench_storage_writes(corpus, results, storage_name, url_storage, reset=None, batch_size=200):
+    """The bulk writes of the links of the pages and of their articles, through the storage.
+    reset() empties the storage before every run, if given"""
+    extractor = LinkExtractor(url_storage)
+    all_pages = [page for pages in corpus.values() for page in pages]
+    page_links = [(url, extractor.extract(html_text, url, ['kannadaprabha', 'prajavani', 'vijaykarnataka'])) \
+        for url, html_text in all_pages]
+    def save_links(pages):
+        for start in range(0, len(page_links), batch_size):
+            batch = page_links[start:start + batch_size]
+            links = set().union(*[links for _, links in batch])
+            extractor.save_links(links, [url for url, _ in batch])
+    results['storage_write/{}/links'.format(storage_name)] = measure(all_pages, save_links, reset)
+
+    articles = []
+    for website, pages in corpus.items():
+        article_parser = ArticleParser(website)
+        articles.extend(article_parser.extract_article(html_text, url) for url, html_text in pages)
+    def save_articles(pages):
+        for start in range(0, len(articles), batch_size):
+            url_storage.save_documents(articles[start:start + batch_size])
+    results['storage_write/{}/articles'.format(storage_name)] = measure(all_pages, save_articles, reset)
+    url_storage.close()
+
+def bench_es_writes(corpus, results):
+    server = start_stand_in_es()
+    es_conf = {'index': 'benchmark', 'host': 'localhost', 'port': server.server_address[1]}
+    # Leave out the logging of every bulk write
+    logging.getLogger('es_helper').setLevel(logging.ERROR)
+    bench_storage_writes(corpus, results, 'elasticsearch', ESStorage(es_conf))
+    server.shutdown()
+
+def bench_sqlite_writes(corpus, results):
+    with tempfile.TemporaryDirectory() as db_dir:
+        sqlite_conf = {'index': 'benchmark', 'sqlite_path': os.path.join(db_dir, 'benchmark.db')}
+        sqlite_storage = SQLiteStorage(sqlite_conf)
+        def reset():
+            with sqlite_storage.conn:
+                sqlite_storage.conn.execute('DELETE FROM benchmark')
+        bench_storage_writes(corpus, results, 'sqlite', sqlite_storage, reset)
+
+def get_commit():
+    """(commit id, True if the working tree has changes), None if not in a git repo"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], \
+            stderr=subprocess.DEVNULL).decode().strip()
+        return commit, len(status) > 0
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+def load_runs():
+    try:
+        with open(RESULTS_PATH, 'r') as results_file:
+            return [json.loads(line) for line in results_file if line.strip() != '']
+    except FileNotFoundError:
+        return []
+
+def save_run(run):
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, 'a') as results_file:
+        results_file.write(json.dumps(run) + '\n')
+
+def find_baseline(runs, run, baseline_commit=None):
+    """The latest run of baseline_commit, or of any other commit if not given"""
+    for previous_run in reversed(runs):
+        if baseline_commit is not None:
+            if previous_run['commit'] is not None and previous_run['commit'].startswith(baseline_commit):
+                return previous_run
+        elif previous_run['commit'] != run['commit']:
+            return previous_run
+    return None
+
+def report(run, baseline):
+    """Log the throughput of the run, along with the change from the baseline run"""
+    logger.warning('Commit {0}{1}, {2} pages per website'.format(run['commit'], ' (modified)' if run['dirty'] else '', \
+        run['pages_per_website']))
+    regressions = []
+    for name, result in run['results'].items():
+        line = '{0:45s} {1:10.1f} pages/sec {2:8.2f} MB/sec'.format(name, result['pages_per_sec'], result['mb_per_sec'])
+        if baseline is not None and name in baseline['results']:
+            change = result['pages_per_sec'] / baseline['results'][name]['pages_per_sec'] - 1
+            line += ' {0:+7.1%}'.format(change)
+            if change < -REGRESSION_THRESHOLD:
+                regressions.append(name)
+        logger.warning(line)
+    if baseline is not None:
+        logger.warning('Compared with commit {0} of {1}. Regressions: {2}'.format(baseline['commit'], \
+            baseline['timestamp'], regressions if len(regressions) > 0 else 'None'))
+
+def run_benchmarks(pages_per_website=200, baseline_commit=None):
+    corpus = {website: generate_pages(website, pages_per_website) for website in BASE_URLS}
+    # The extraction errors are expected to be none, do not let the logging dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    bench_link_extraction(corpus, results)
+    bench_site_parsers(corpus, results)
+    bench_article_extraction(corpus, results)
+    bench_es_writes(corpus, results)
+    bench_sqlite_writes(corpus, results)
+
+    commit, dirty = get_commit()
+    run = {'commit': commit, 'dirty': dirty, 'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), \
+        'python': platform.python_version(), 'parser_backend': conf_parser.HTML_PARSER_BACKEND, \
+        'pages_per_website': pages_per_website, 'results': results}
+    baseline = find_baseline(load_runs(), run, baseline_commit)
+    save_run(run)
+    report(run, baseline)
+    return run
+
+if __name__ == '__main__':
+    pages_per_website = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    baseline_commit = sys.argv[2] if len(sys.argv) > 2 else None
+    run_benchmarks(pages_per_website, baseline_commit)
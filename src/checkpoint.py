@@ -0,0 +1,36 @@
+import os
+import json
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+class Checkpoint():
+    """Progress of a long run, kept in a local json file so that an interrupted run can be resumed.
+    The file is replaced atomically, so a crash while saving leaves the previous checkpoint intact."""
+    def __init__(self, checkpoint_dir, name):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.path = os.path.join(checkpoint_dir, name + '.checkpoint.json')
+
+    def load(self):
+        """The saved state, None if there is no checkpoint"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as checkpoint_file:
+            state = json.load(checkpoint_file)
+        logger.warning("Loaded the checkpoint {0} saved at {1}".format(self.path, time.ctime(state['saved_at'])))
+        return state
+
+    def save(self, state):
+        state = dict(state)
+        state['saved_at'] = int(time.time())
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as tmp_file:
+            json.dump(state, tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Remove the checkpoint once the run is complete"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
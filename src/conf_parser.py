@@ -13,6 +13,13 @@ SYS_CONFIG=yaml.load(open('config/vijayakarnataka_sys_config.yml', 'r'))
 
 # Min length of the article text, to be considered as valid
 ARTICLE_TEXT_LEN_LIMIT = 100
+
+# Version of the article extraction logic, recorded on the seed url docs.
+# Bump it when the parsers change, to extract all the downloaded urls again
+PARSER_VERSION = 1
+
+# BeautifulSoup tree builder used to parse the HTML pages. Ex: 'html.parser', 'lxml'
+HTML_PARSER_BACKEND = SYS_CONFIG['run_config'].get('html_parser_backend', 'html.parser')
 #------------------------------
 
 
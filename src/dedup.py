@@ -0,0 +1,219 @@
+"""Streaming near-duplicate detection of the articles, as the same wire story shows up under many urls and sections.
+Every article text gets a MinHash signature over its character shingles (no word segmentation needed, works for Kannada),
+computed with one-permutation hashing: every shingle is hashed once into one of num_perm bins, keeping the min per bin.
+The signatures of the first article of every cluster are kept in an LSH index (bands of rows) on SQLite,
+so the candidates of a new article are found by a few indexed lookups instead of comparing with all the articles.
+A candidate whose estimated Jaccard similarity is at least the threshold is a near-duplicate, and the new article
+joins its cluster. The cluster id is the id (url) of the first article of the cluster.
+
+The index lives on the disk, so the memory stays bounded however many articles go through it. It is kept across
+the runs if index_path is given, otherwise it is a temporary file."""
+import os
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import unicodedata
+from array import array
+from metrics import METRICS
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = ('off', 'mark', 'drop')
+# Field of the article doc having the MinHash signature computed by the extraction worker, removed before saving
+SIGNATURE_FIELD = '_minhash'
+# Value of an empty bin
+EMPTY_BIN = 0xFFFFFFFF
+# Max num of the candidates compared with an article
+MAX_CANDIDATES = 100
+
+class MinHasher():
+    """One-permutation MinHash signatures of num_perm bins over the shingle_size character shingles of a text"""
+    def __init__(self, num_perm=128, shingle_size=5):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, text):
+        """Set of the character shingles of the text, after normalizing the unicode, the case and the whitespace"""
+        text = ' '.join(unicodedata.normalize('NFC', text).lower().split())
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[start:start + self.shingle_size] for start in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        """array of num_perm unsigned 32 bit values"""
+        signature = array('I', [EMPTY_BIN]) * self.num_perm
+        for shingle in self.shingles(text):
+            shingle_hash = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+            # The high bits pick the bin, the low bits are the value
+            bin_num = ((shingle_hash >> 32) * self.num_perm) >> 32
+            value = shingle_hash & 0xFFFFFFFF
+            if value < signature[bin_num]:
+                signature[bin_num] = value
+        self.__densify(signature)
+        return signature
+
+    def __densify(self, signature):
+        """Fill every empty bin from the next non-empty bin on its right (rotation), offset by the distance,
+        so that two texts have the same value in a bin with the probability of their Jaccard similarity"""
+        source = signature.tolist()
+        if EMPTY_BIN not in source or source.count(EMPTY_BIN) == self.num_perm:
+            return
+        for bin_num in range(self.num_perm):
+            if source[bin_num] != EMPTY_BIN:
+                continue
+            distance = 1
+            while source[(bin_num + distance) % self.num_perm] == EMPTY_BIN:
+                distance += 1
+            signature[bin_num] = (source[(bin_num + distance) % self.num_perm] + distance * 0x9E3779B9) & 0xFFFFFFFF
+
+def similarity(signature, other_signature):
+    """Estimated Jaccard similarity of the texts of the two signatures"""
+    same = sum(1 for value, other_value in zip(signature, other_signature) if value == other_value)
+    return same / len(signature)
+
+class Deduplicator():
+    """Assigns every article to a cluster of near-duplicates in the order they come. In 'mark' mode every article
+    gets its cluster_id, in 'drop' mode the near-duplicates are left out as well. An article seen by a previous run
+    (same id) keeps its cluster. The index writes are committed by commit()"""
+    def __init__(self, minhasher: MinHasher, mode='mark', threshold=0.8, bands=32, index_path=None):
+        if mode not in ('mark', 'drop'):
+            raise ValueError("Unknown dedup mode {0}, expected one of {1}".format(mode, DEDUP_MODES))
+        if minhasher.num_perm % bands != 0:
+            raise ValueError("The num of bins {0} must be a multiple of the num of bands {1}"\
+                .format(minhasher.num_perm, bands))
+        self.minhasher = minhasher
+        self.mode = mode
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = minhasher.num_perm // bands
+        self.temp_dir = None
+        if index_path is None:
+            self.temp_dir = tempfile.mkdtemp(prefix='dedup_')
+            index_path = os.path.join(self.temp_dir, 'dedup.db')
+        elif os.path.dirname(index_path) != '':
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self.conn = sqlite3.connect(index_path)
+        self.__create_tables()
+        self.duplicate_count = 0
+        self.cluster_count = 0
+        logger.warning("Near-duplicate detection ({0}) with {1} bins in {2} bands, threshold {3}. Index:{4}"\
+            .format(mode, minhasher.num_perm, bands, threshold, index_path))
+
+    def __create_tables(self):
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS signatures (id TEXT PRIMARY KEY, cluster_id TEXT, signature BLOB)")
+            # The bands of the first article of every cluster
+            self.conn.execute("CREATE TABLE IF NOT EXISTS bands (band_key INTEGER, id TEXT, PRIMARY KEY (band_key, id)) WITHOUT ROWID")
+
+    def __band_keys(self, signature):
+        keys = []
+        for band in range(self.bands):
+            band_bytes = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            digest = hashlib.blake2b(band_bytes, digest_size=8, salt=band.to_bytes(16, 'little')).digest()
+            keys.append(int.from_bytes(digest, 'little', signed=True))
+        return keys
+
+    def __find_cluster(self, signature, band_keys):
+        """Cluster of the most similar candidate, if it is similar enough. None otherwise"""
+        candidate_ids = [id for id, in self.conn.execute("SELECT DISTINCT id FROM bands WHERE band_key IN ({0}) LIMIT {1}"\
+            .format(', '.join(['?'] * len(band_keys)), MAX_CANDIDATES), band_keys)]
+        if len(candidate_ids) == 0:
+            return None
+        best_cluster, best_similarity = None, self.threshold
+        rows = self.conn.execute("SELECT cluster_id, signature FROM signatures WHERE id IN ({})"\
+            .format(', '.join(['?'] * len(candidate_ids))), candidate_ids)
+        for cluster_id, signature_bytes in rows:
+            candidate_similarity = similarity(signature, array('I', signature_bytes))
+            if candidate_similarity >= best_similarity:
+                best_cluster, best_similarity = cluster_id, candidate_similarity
+        return best_cluster
+
+    def assign(self, id, signature):
+        """Cluster id of the article and True if it is a near-duplicate of an earlier one"""
+        row = self.conn.execute("SELECT cluster_id FROM signatures WHERE id = ?", (id,)).fetchone()
+        if row is not None:
+            return row[0], row[0] != id
+        band_keys = self.__band_keys(signature)
+        cluster_id = self.__find_cluster(signature, band_keys)
+        is_duplicate = cluster_id is not None
+        if is_duplicate:
+            self.duplicate_count += 1
+        else:
+            # A new cluster, the first article stands for it in the bands
+            cluster_id = id
+            self.cluster_count += 1
+            self.conn.executemany("INSERT OR IGNORE INTO bands VALUES (?, ?)", [(key, id) for key in band_keys])
+        self.conn.execute("INSERT INTO signatures VALUES (?, ?, ?)", (id, cluster_id, signature.tobytes()))
+        return cluster_id, is_duplicate
+
+    def process(self, article_doc):
+        """Set the cluster_id of the article doc. Returns False if it is to be dropped as a near-duplicate.
+        The signature is taken from the SIGNATURE_FIELD of the doc if the extraction worker computed it"""
+        signature = article_doc.pop(SIGNATURE_FIELD, None)
+        with METRICS.timer('dedup'):
+            if signature is None:
+                signature = self.minhasher.signature(article_doc['article_text'])
+            cluster_id, is_duplicate = self.assign(article_doc['id'], signature)
+        article_doc['cluster_id'] = cluster_id
+        if is_duplicate:
+            METRICS.count('dedup/duplicates')
+        return not (is_duplicate and self.mode == 'drop')
+
+    def commit(self, failed_ids=()):
+        """Commit the index writes. The articles of failed_ids were not saved, they are taken out of the index
+        so that they are clustered again when they are extracted next. The near-duplicates of a failed first article
+        must not point at it: in 'mark' mode the earliest of them becomes the first article of the cluster,
+        in 'drop' mode they were not saved either, so they are taken out of the index as well.
+        Returns {id: new cluster id} of those near-duplicates, the cluster id being None for the ones taken out"""
+        orphan_cluster_ids = []
+        for id in failed_ids:
+            row = self.conn.execute("SELECT cluster_id, signature FROM signatures WHERE id = ?", (id,)).fetchone()
+            if row is None:
+                continue
+            cluster_id, signature_bytes = row
+            if cluster_id == id:
+                self.conn.executemany("DELETE FROM bands WHERE band_key = ? AND id = ?", \
+                    [(key, id) for key in self.__band_keys(array('I', signature_bytes))])
+                orphan_cluster_ids.append(id)
+            self.conn.execute("DELETE FROM signatures WHERE id = ?", (id,))
+
+        reclustered = {}
+        for cluster_id in orphan_cluster_ids:
+            members = self.conn.execute("SELECT id, signature FROM signatures WHERE cluster_id = ? ORDER BY rowid", \
+                (cluster_id,)).fetchall()
+            if len(members) == 0:
+                continue
+            if self.mode == 'drop':
+                self.conn.execute("DELETE FROM signatures WHERE cluster_id = ?", (cluster_id,))
+                reclustered.update((id, None) for id, _ in members)
+                continue
+            new_cluster_id, signature_bytes = members[0]
+            self.conn.execute("UPDATE signatures SET cluster_id = ? WHERE cluster_id = ?", (new_cluster_id, cluster_id))
+            self.conn.executemany("INSERT OR IGNORE INTO bands VALUES (?, ?)", \
+                [(key, new_cluster_id) for key in self.__band_keys(array('I', signature_bytes))])
+            reclustered.update((id, new_cluster_id) for id, _ in members)
+        self.conn.commit()
+        return reclustered
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+        logger.warning("Near-duplicates: {0} in {1} new clusters".format(self.duplicate_count, self.cluster_count))
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+def make_deduplicator(run_config, index_name):
+    """Deduplicator as per the dedup_* keys of the run_config. None if dedup is off"""
+    mode = run_config.get('dedup', 'off')
+    # YAML reads an unquoted off as False
+    if mode == 'off' or mode is False:
+        return None
+    minhasher = MinHasher(run_config.get('dedup_num_perm', 128), run_config.get('dedup_shingle_size', 5))
+    # Kept across the runs under dedup_dir, a temporary one if not set
+    index_path = None
+    if run_config.get('dedup_dir') is not None:
+        index_path = os.path.join(run_config['dedup_dir'], index_name + '_dedup.db')
+    return Deduplicator(minhasher, mode, threshold=run_config.get('dedup_threshold', 0.8), \
+        bands=run_config.get('dedup_bands', 32), index_path=index_path)
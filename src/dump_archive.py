@@ -0,0 +1,152 @@
+import os
+import time
+import mmap
+import sqlite3
+import logging
+logger = logging.getLogger(__name__)
+
+from dump_walker import walk_html_files, DEFAULT_HTML_EXTENSIONS
+from metrics import METRICS
+
+# Max size of a single pack file. A page larger than this gets a pack of its own
+PACK_SIZE_LIMIT = 1024 * 1024 * 1024
+# Num of index rows written in one go while packing
+INDEX_BATCH_SIZE = 10000
+
+def _index_path(archive_path):
+    return archive_path + '.index.db'
+
+def _pack_path(archive_path, pack_num):
+    return '{0}.{1}.pack'.format(archive_path, pack_num)
+
+def pack_website_dump(website_base_dir, archive_path, html_extensions=DEFAULT_HTML_EXTENSIONS, \
+    pack_size_limit=PACK_SIZE_LIMIT):
+    """Pack the HTML files under website_base_dir into a few large pack files (<archive_path>.<n>.pack),
+    with a SQLite index (<archive_path>.index.db) of path -> (pack, offset, length), path being relative to
+    website_base_dir. The directories with an HTML extension are indexed as well, in the order of the walk.
+    Returns the num of files packed"""
+    if os.path.exists(_index_path(archive_path)):
+        raise FileExistsError("Archive {} exists already".format(archive_path))
+    archive_dir = os.path.dirname(archive_path)
+    if archive_dir != '':
+        os.makedirs(archive_dir, exist_ok=True)
+
+    conn = sqlite3.connect(_index_path(archive_path) + '.tmp')
+    conn.execute("""CREATE TABLE pages (path TEXT PRIMARY KEY, walk_order INTEGER, is_dir INTEGER,
+        pack INTEGER, offset INTEGER, length INTEGER, mtime_ns INTEGER)""")
+    pack_num = 0
+    pack_file = open(_pack_path(archive_path, pack_num), 'wb')
+    offset = 0
+    file_count = 0
+    rows = []
+    try:
+        for walk_order, (path, is_dir) in enumerate(walk_html_files(website_base_dir, html_extensions)):
+            relative_path = os.path.relpath(path, website_base_dir)
+            if is_dir:
+                rows.append((relative_path, walk_order, 1, None, None, None, None))
+            else:
+                with open(path, 'rb') as html_file:
+                    html_text = html_file.read()
+                if offset > 0 and offset + len(html_text) > pack_size_limit:
+                    pack_file.close()
+                    pack_num += 1
+                    pack_file = open(_pack_path(archive_path, pack_num), 'wb')
+                    offset = 0
+                pack_file.write(html_text)
+                rows.append((relative_path, walk_order, 0, pack_num, offset, len(html_text), os.stat(path).st_mtime_ns))
+                offset += len(html_text)
+                file_count += 1
+
+            if len(rows) >= INDEX_BATCH_SIZE:
+                conn.executemany("INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                rows = []
+                logger.info("Packed {} files".format(file_count))
+        conn.executemany("INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("CREATE INDEX pages_walk_order ON pages (walk_order)")
+        conn.commit()
+    finally:
+        pack_file.close()
+        conn.close()
+    # The archive is usable only once the index is complete
+    os.replace(_index_path(archive_path) + '.tmp', _index_path(archive_path))
+    logger.info("Packed {0} files of {1} into {2} pack files".format(file_count, website_base_dir, pack_num + 1))
+    return file_count
+
+class DumpArchive():
+    """Read-only access to a website dump packed by pack_website_dump. The pages are memory-mapped slices
+    of the pack files (zero-copy memoryview). The pages are referred to by their paths under website_base_dir,
+    as they were in the packed tree, so that the archive can stand in for the files on the disk.
+    The index and the packs are opened on the first use, so the archive can be created before forking workers."""
+    def __init__(self, archive_path, website_base_dir):
+        if not os.path.exists(_index_path(archive_path)):
+            raise FileNotFoundError("Archive {} does not exist".format(archive_path))
+        self.archive_path = archive_path
+        self.website_base_dir = website_base_dir
+        self.conn = None
+        self.packs = {}
+
+    def __get_conn(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(_index_path(self.archive_path))
+        return self.conn
+
+    def __get_pack(self, pack_num):
+        if pack_num not in self.packs:
+            with open(_pack_path(self.archive_path, pack_num), 'rb') as pack_file:
+                if os.fstat(pack_file.fileno()).st_size == 0:
+                    # Every file of the pack is empty, and an empty file can not be mapped
+                    self.packs[pack_num] = b''
+                else:
+                    # The mapping stays valid after closing the file
+                    self.packs[pack_num] = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.packs[pack_num]
+
+    def count_entries(self, html_extensions=DEFAULT_HTML_EXTENSIONS):
+        """Num of the entries walk gives"""
+        extensions = tuple(html_extensions)
+        rows = self.__get_conn().execute("SELECT path FROM pages")
+        return sum(1 for relative_path, in rows if relative_path.endswith(extensions))
+
+    def walk(self, html_extensions=DEFAULT_HTML_EXTENSIONS):
+        """Yields (path, is_dir, (size, mtime_ns)) of the packed entries in the order they were walked.
+        The file stat is None for the directories"""
+        extensions = tuple(html_extensions)
+        rows = self.__get_conn().execute("SELECT path, is_dir, length, mtime_ns FROM pages ORDER BY walk_order")
+        for relative_path, is_dir, length, mtime_ns in rows:
+            if not relative_path.endswith(extensions):
+                continue
+            path = os.path.join(self.website_base_dir, relative_path)
+            yield path, bool(is_dir), None if is_dir else (length, mtime_ns)
+
+    def read(self, path):
+        """Content of the page as a memoryview, None if the archive does not have it as a file"""
+        start = time.perf_counter()
+        relative_path = os.path.relpath(path, self.website_base_dir)
+        row = self.__get_conn().execute("SELECT pack, offset, length FROM pages WHERE path = ? AND is_dir = 0", \
+            (relative_path,)).fetchone()
+        if row is None:
+            return None
+        pack_num, offset, length = row
+        content = memoryview(self.__get_pack(pack_num))[offset:offset + length]
+        METRICS.observe('read/archive', time.perf_counter() - start)
+        METRICS.count('read_bytes', length)
+        return content
+
+    def read_ahead(self, keyed_paths):
+        """Same as Prefetcher.read_ahead. The pages are already in memory-mapped files, so there is nothing to read ahead"""
+        for key, path in keyed_paths:
+            yield key, self.read(path)
+
+    def close(self):
+        for pack in self.packs.values():
+            if not isinstance(pack, mmap.mmap):
+                continue
+            try:
+                pack.close()
+            except BufferError:
+                # A page read from it is still in use(Ex: by a parser), the pack is unmapped along with the last one
+                logger.debug("Pack of {} is still in use, leaving it to be unmapped later".format(self.archive_path))
+        self.packs = {}
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,36 @@
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+# Used when the site config does not list the extensions of the HTML files
+DEFAULT_HTML_EXTENSIONS = ['.html', '.cms']
+
+def walk_html_files(website_base_dir, extensions=DEFAULT_HTML_EXTENSIONS):
+    """Walk the website dump under website_base_dir in a single pass using os.scandir.
+    Yields (path, is_dir) for every entry whose name ends with any of the extensions,
+    in the order of their names. Directories with a matching extension are yielded with
+    is_dir=True and are walked as well. Hidden files and directories are skipped, like glob does."""
+    extensions = tuple(extensions)
+    dir_stack = [website_base_dir]
+    while len(dir_stack) > 0:
+        current_dir = dir_stack.pop()
+        sub_dirs = []
+        try:
+            # Sorted by name, so that the position of an entry is the same on every walk of the same tree
+            with os.scandir(current_dir) as entries:
+                for entry in sorted(entries, key=lambda entry: entry.name):
+                    if entry.name.startswith('.'):
+                        continue
+                    is_dir = entry.is_dir()
+                    if entry.name.endswith(extensions):
+                        yield entry.path, is_dir
+                    if is_dir:
+                        sub_dirs.append(entry.path)
+        except (FileNotFoundError, NotADirectoryError):
+            # The directory was moved/replaced by the consumer after it was yielded
+            logger.debug('Directory {} is gone, skipping it'.format(current_dir))
+        except OSError as os_error:
+            logger.warning('Could not read the directory {0}: {1}'.format(current_dir, os_error))
+
+        # Walk the sub-directories in the order they were found
+        dir_stack.extend(reversed(sub_dirs))
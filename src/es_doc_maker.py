@@ -1,5 +1,6 @@
 """Define the schema of various types of documents that should be stored.
 If you want to know the schema of extracted information, this is the place!"""
+import time
 
 def make_url_doc(link, downloaded=False):
    doc = {} 
@@ -8,15 +9,29 @@ def make_url_doc(link, downloaded=False):
    doc['downloaded'] = downloaded
    return doc
 
+def make_extraction_state_doc(url, parser_version):
+   """Partial seed url doc, marking that the url has been processed by the article extractor"""
+   doc = {}
+   doc['id'] = url
+   doc['extracted'] = True
+   doc['extracted_at'] = int(time.time())
+   doc['parser_version'] = parser_version
+   return doc
+
+def plain_str(value):
+   """The value as a plain str. A bs4 NavigableString drags its whole tree along when pickled (to a worker process)"""
+   return str(value) if value is not None else None
+
 def make_article_doc(url, title, description, keywords, publish_date, article_text):
    doc = {}
    doc['id'] = url
    doc['url'] = url
-   doc['title'] = title
-   doc['description'] = description
-   doc['keywords'] = keywords
-   doc['publish_date'] = publish_date
-   doc['article_text'] = article_text
+   doc['title'] = plain_str(title)
+   doc['description'] = plain_str(description)
+   doc['keywords'] = plain_str(keywords)
+   doc['publish_date'] = plain_str(publish_date)
+   doc['article_text'] = plain_str(article_text)
    doc['text_len'] = len(article_text) # For filtering on length of article text
+   doc['extracted_at'] = int(time.time()) # Epoch seconds, for syncing the url lookup index
 
    return doc
\ No newline at end of file
@@ -1,15 +1,53 @@
-import elasticsearch
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import scan
+from elasticsearch.helpers import scan, streaming_bulk, parallel_bulk
 from elasticsearch.client import IndicesClient
 from elasticsearch.exceptions import ConflictError
 import json
+import itertools
+import queue
+import threading
+import time
 import conf_parser
-import traceback
+from metrics import METRICS, metric_name, timed_scroll
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Marks the end of a slice in the merged scroll queue
+_SLICE_DONE = object()
+
+def make_bulk_actions(index, doc_type, documents, op_type, skipped):
+    """Wrap the docs into bulk actions with the doc specific ids. The docs without an 'id' are added to skipped"""
+    for doc in documents:
+        if 'id' not in doc:
+            # Doc without an 'id' can not be indexed
+            skipped.append(doc)
+            conf_parser.error_logger.error("Indexing failed! Document without id: {}".format(doc))
+            continue
+        yield {'_op_type': op_type, '_index': index, '_type': doc_type,
+            '_id': doc['id'], '_source': doc}
+
+def make_update_actions(index, doc_type, documents, upsert, skipped):
+    """Wrap the partial docs into bulk update actions. The docs without an 'id' are added to skipped"""
+    for doc in documents:
+        if 'id' not in doc:
+            skipped.append(doc)
+            conf_parser.error_logger.error("Update failed! Document without id: {}".format(doc))
+            continue
+        yield {'_op_type': 'update', '_index': index, '_type': doc_type,
+            '_id': doc['id'], 'doc': doc, 'doc_as_upsert': upsert}
+
+def log_bulk_failure(item):
+    """Log a failed item of a _bulk response.
+    Returns the id of the doc if it failed to be written, None if it is a duplicate(409) that exists already"""
+    op_type, result = item.popitem()
+    if result.get('status') == 409:
+        conf_parser.error_logger.error("Indexing failed! Duplicate document: {}".format(result.get('_id')))
+        return None
+    conf_parser.error_logger.error("Indexing failed! {0} of {1}: {2}".format(
+        op_type, result.get('_id'), result.get('error', result.get('exception'))))
+    return result.get('_id')
+
 class ESHelper():
     def __init__(self, elastic_conf):
         # Initialize the connection
@@ -47,35 +85,104 @@ class ESHelper():
         
         return None
 
+    def __bulk_write(self, actions):
+        """Send the actions to the _bulk API in chunks and check the response of each item.
+        The items rejected with 429 are retried bulk_max_retries times, except by the parallel bulk.
+        Returns the number of items that failed and the ids of those that failed to be written(not the duplicates)"""
+        chunk_size = self.elastic_conf.get('bulk_chunk_size', 500)
+        max_chunk_bytes = self.elastic_conf.get('bulk_max_chunk_bytes', 100 * 1024 * 1024)
+        thread_count = self.elastic_conf.get('bulk_thread_count', 1)
+
+        if thread_count > 1:
+            result_itr = parallel_bulk(self.es, actions, thread_count=thread_count,
+                chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                raise_on_error=False, raise_on_exception=False)
+        else:
+            result_itr = streaming_bulk(self.es, actions,
+                chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                max_retries=self.elastic_conf.get('bulk_max_retries', 3),
+                initial_backoff=self.elastic_conf.get('bulk_initial_backoff', 2),
+                raise_on_error=False, raise_on_exception=False)
+
+        start = time.perf_counter()
+        fail_count = 0
+        failed_ids = []
+        for ok, item in result_itr:
+            if ok:
+                continue
+            fail_count += 1
+            failed_id = log_bulk_failure(item)
+            if failed_id is not None:
+                failed_ids.append(failed_id)
+        METRICS.observe(metric_name('bulk_write', self.index), time.perf_counter() - start)
+        return fail_count, failed_ids
+
     def index_documents(self, documents, update_if_exists=False):
         """
-        Indexes the given list of documents onto the configured index
+        Indexes the given list of documents onto the configured index using the _bulk API.
+        Returns the num of docs indexed, the num dropped and the ids of the docs that failed to be written
         """
-        drop_count = 0
-        for doc in documents:
-            try:
-                resp_doc = self.index_doc(doc, update_if_exists=update_if_exists)
-                if resp_doc is None:
-                    drop_count += 1
-            except KeyError:
-                drop_count += 1
-                traceback.print_exc()
-            except elasticsearch.exceptions.RequestError:
-                drop_count += 1
-                traceback.print_exc()
+        if update_if_exists:
+            OP_TYPE = "index" # Create or update
+        else:
+            OP_TYPE = "create" # Create only if absent
+
+        skipped = []
+        fail_count, failed_ids = self.__bulk_write(make_bulk_actions(self.index, self.doc_type, documents, OP_TYPE, skipped))
+        drop_count = len(skipped) + fail_count
 
         logger.warning('## Indexed {0} Dropped {1}'.format(len(documents)-drop_count, drop_count))
-        logger.info('Current index size {0}'.format(self.get_index_size()))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Current index size {0}'.format(self.get_index_size()))
+        return len(documents)-drop_count, drop_count, failed_ids
+
+    def update_documents(self, documents, upsert=False):
+        """
+        Partially updates the given documents (by their 'id') using the _bulk API.
+        If upsert is True, the absent documents are created with the given fields
+        """
+        skipped = []
+        actions = make_update_actions(self.index, self.doc_type, documents, upsert, skipped)
+        # The actions are generated lazily, count the skipped docs after the write
+        fail_count, failed_ids = self.__bulk_write(actions)
+        drop_count = len(skipped) + fail_count
+
+        logger.info('## Updated {0} Dropped {1}'.format(len(documents)-drop_count, drop_count))
+        return len(documents)-drop_count, drop_count, failed_ids
+
+    def create_and_upsert_documents(self, documents, upsert_documents):
+        """
+        Creates the documents absent in the index and upserts the partial upsert_documents,
+        all together in the same _bulk requests. The creates go first.
+        """
+        skipped = []
+        actions = itertools.chain(make_bulk_actions(self.index, self.doc_type, documents, "create", skipped),
+            make_update_actions(self.index, self.doc_type, upsert_documents, True, skipped))
+        total_count = len(documents) + len(upsert_documents)
+        # The actions are generated lazily, count the skipped docs after the write
+        fail_count, failed_ids = self.__bulk_write(actions)
+        drop_count = len(skipped) + fail_count
+
+        logger.info('## Created/Upserted {0} Dropped {1}'.format(total_count-drop_count, drop_count))
+        return total_count-drop_count, drop_count, failed_ids
 
     def get_index_size(self):
         """
         Return the total number of docs present in the index
         """
         if self.index_exists():
-            return self.es.indices.stats()['indices'][self.index]['total']['docs']['count']
+            return self.es.count(index=self.index)['count']
         else:
             return 0
 
+    def count(self, json_query):
+        """
+        Return the number of docs matching the query of json_query
+        """
+        if not self.index_exists():
+            return 0
+        return self.es.count(index=self.index, body={'query': json_query.get('query', {'match_all': {}})})['count']
+
     def doc_by_id(self, id):
         """
         Get the doc with the given id
@@ -92,12 +199,79 @@ class ESHelper():
         documents = [src['_source'] for src in res['hits']['hits']]
         return documents
 
-    def bulk_scroll(self, json_query):
+    def bulk_scroll(self, json_query, slices=None):
         """Fetch all the documents from the index using a scroll option.
+        With more than one slice (scroll_slices of the index conf), the slices are scrolled in parallel
+        threads and merged in no particular order.
         Returns an iterator which gives out all the documents! Becareful about this guy!"""
+        slice_itrs = self.sliced_scroll(json_query, slices)
+        if len(slice_itrs) == 1:
+            return slice_itrs[0]
+        return self.__merge_slices(slice_itrs)
+
+    def sliced_scroll(self, json_query, slices=None):
+        """Split the scroll of the query into independent slices (sliced scroll).
+        Returns one iterator per slice, to be consumed by parallel consumers"""
+        if slices is None:
+            slices = self.elastic_conf.get('scroll_slices', 1)
+        page_size = self.elastic_conf.get('scroll_page_size', 1000)
+        scroll_metric = metric_name('scroll_page', self.index)
         # TODO Wait for 15 mins max before cleaning the scroll
-        result_itr = scan(self.es, index=self.index, doc_type=self.doc_type, query=json_query, scroll='15m', size=1000)
-        return result_itr
+        if slices <= 1:
+            return [timed_scroll(scan(self.es, index=self.index, doc_type=self.doc_type, query=json_query, \
+                scroll='15m', size=page_size), page_size, scroll_metric)]
+
+        slice_itrs = []
+        for slice_id in range(slices):
+            slice_query = dict(json_query)
+            slice_query['slice'] = {'id': slice_id, 'max': slices}
+            slice_itrs.append(timed_scroll(scan(self.es, index=self.index, doc_type=self.doc_type, query=slice_query, \
+                scroll='15m', size=page_size), page_size, scroll_metric))
+        return slice_itrs
+
+    def __merge_slices(self, slice_itrs):
+        """Consume the slice iterators in threads, through a bounded queue"""
+        page_size = self.elastic_conf.get('scroll_page_size', 1000)
+        doc_queue = queue.Queue(maxsize=2 * page_size * len(slice_itrs))
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    doc_queue.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def consume(slice_itr):
+            try:
+                for doc in slice_itr:
+                    if stop.is_set():
+                        return
+                    put(doc)
+                put(_SLICE_DONE)
+            except Exception as ex:
+                put(ex)
+
+        threads = [threading.Thread(target=consume, args=(slice_itr,), daemon=True) for slice_itr in slice_itrs]
+        for thread in threads:
+            thread.start()
+
+        try:
+            pending_slices = len(threads)
+            while pending_slices > 0:
+                item = doc_queue.get()
+                if item is _SLICE_DONE:
+                    pending_slices -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # Let the threads go, even if the consumer stopped early
+            stop.set()
+            for thread in threads:
+                thread.join()
 
     def delete_index(self):
         """Deletes the given index! Use with caution!"""
@@ -12,6 +12,7 @@ class ESStorage(StorageI):
     def __init__(self, es_index_conf, read_only=False):
         self.eshelper = ESHelper(es_index_conf)
         self.read_only = read_only
+        self.failed_ids = []
         logger.warning('Connected to {0} index. Read only:{1}'\
             .format(self.eshelper.get_index_name(), self.read_only))
     
@@ -32,10 +33,30 @@ class ESStorage(StorageI):
         self.__check_writeability()
         return self.eshelper.index_doc(doc, update_if_exists)
 
+    def __track_failures(self, result):
+        """Keep the failed ids of the bulk write result, for take_failed_ids()"""
+        indexed, dropped, failed_ids = result
+        self.failed_ids.extend(failed_ids)
+        return indexed, dropped
+
     def save_documents(self, documents, update_if_exists=False):
         """Index multile documents"""
         self.__check_writeability()
-        self.eshelper.index_documents(documents, update_if_exists)
+        return self.__track_failures(self.eshelper.index_documents(documents, update_if_exists))
+
+    def update_documents(self, documents, upsert=False):
+        """Partially update multiple documents"""
+        self.__check_writeability()
+        return self.__track_failures(self.eshelper.update_documents(documents, upsert))
+
+    def save_and_upsert(self, documents, upsert_documents):
+        """Create the absent documents and upsert the partial upsert_documents in one bulk write"""
+        self.__check_writeability()
+        return self.__track_failures(self.eshelper.create_and_upsert_documents(documents, upsert_documents))
+
+    def take_failed_ids(self):
+        failed_ids, self.failed_ids = self.failed_ids, []
+        return failed_ids
 
     def get_doc_by_id(self, id):
         """Get a document by id"""
@@ -50,5 +71,14 @@ class ESStorage(StorageI):
         else:
             return self.eshelper.search(query)
 
+    def count_documents(self, query):
+        """Num of documents matching the query"""
+        return self.eshelper.count(query)
+
+    def get_document_slices(self, query, slices=None):
+        """Get the documents for the given query as one scroll iterator per slice.
+        slices defaults to scroll_slices of the index conf"""
+        return self.eshelper.sliced_scroll(query, slices)
+
     def close(self):
         self.eshelper.close()
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""Declarative extraction rules of the news websites.
+The rules of a website are declared in a YAML file next to its sys config
+(Ex: config/kannadaprabha_extraction_rules.yml) and are compiled once into matcher objects.
+A new website can be onboarded by writing such a file and setting `extraction_rules` in its run_config.
+
+Every field (title, description, keywords, publish_date, article_text) is a fallback chain of steps.
+The first step giving a value wins. A step looks like:
+
+    - find: {tag: div, class: div_article_headline}   # or id, class_regex, id_regex
+      path: [{tag: span}]          # Optional: first matching descendant, one after the other
+      clear: [{tag: div, class: x}] # Optional: descendants to be cleared before reading the value
+      get: string                  # string, text, attr:<name> or extractor:<name>
+      separator: " "               # Optional: separator for get: text
+      strip: true                  # Optional: strip the value
+    - find: {meta: property, value: og:title}          # or value_regex
+      in_head: true                # Optional: look only inside <head>
+      get: attr:content
+    - longest: [<step>, <step>]    # Longest non-empty value among the steps
+
+The validity rules use the same steps, with `equals`, `min_len` and `unique` checks.
+"""
+import re
+import yaml
+import logging
+logger = logging.getLogger(__name__)
+
+import conf_parser
+from html_parser import HtmlParserI, SoupIndex, make_soup, \
+    get_paragraphs_text, get_story_children_text, get_normal_div_text
+
+# Text extractors for the layouts that can not be declared, referred as get: extractor:<name>
+TEXT_EXTRACTORS = {
+    'paragraphs': get_paragraphs_text,
+    'story_children': get_story_children_text,
+    'normal_div_children': get_normal_div_text
+}
+
+# Fields in the order they are extracted. The article text goes first, as its extraction may clear tags
+ARTICLE_FIELDS = ['article_text', 'title', 'description', 'keywords', 'publish_date']
+
+class RuleError(Exception):
+    pass
+
+class TagMatcher():
+    """Matches a tag by name and id/class or a meta tag by property/name/itemprop, with exact or regex values"""
+    def __init__(self, spec):
+        self.meta_key = spec.get('meta')
+        if self.meta_key is not None:
+            self.name = 'meta'
+            self.meta_value = self.__value(spec, 'value')
+            self.id = self.class_ = None
+        else:
+            self.name = spec['tag']
+            self.id = self.__value(spec, 'id')
+            self.class_ = self.__value(spec, 'class')
+
+    @staticmethod
+    def __value(spec, key):
+        if key + '_regex' in spec:
+            return re.compile(spec[key + '_regex'])
+        return spec.get(key)
+
+    def describe(self):
+        """The matcher as a selector. Ex: 'div.pj-article__content', 'meta[name=keywords]'"""
+        def pattern(value):
+            return value if isinstance(value, str) else value.pattern
+        if self.meta_key is not None:
+            return 'meta[{0}={1}]'.format(self.meta_key, pattern(self.meta_value))
+        if self.id is not None:
+            return '{0}#{1}'.format(self.name, pattern(self.id))
+        if self.class_ is not None:
+            return '{0}.{1}'.format(self.name, pattern(self.class_))
+        return self.name
+
+    def find_all_in_index(self, index: SoupIndex, in_head=False):
+        if self.meta_key is not None:
+            return index.find_all_meta(self.meta_key, self.meta_value, in_head=in_head)
+        tags = index.find_all(self.name, id=self.id, class_=self.class_)
+        if in_head:
+            tags = [tag for tag in tags if any(parent is index.head for parent in tag.parents)]
+        return tags
+
+    def find_in_tag(self, tag):
+        if self.meta_key is not None:
+            return tag.find('meta', attrs={self.meta_key: self.meta_value})
+        kwargs = {}
+        if self.id is not None:
+            kwargs['id'] = self.id
+        if self.class_ is not None:
+            kwargs['class_'] = self.class_
+        return tag.find(self.name, **kwargs)
+
+class Step():
+    """One step of a fallback chain. value() gives None if the step does not apply to the page"""
+    def __init__(self, spec):
+        self.longest = None
+        if 'longest' in spec:
+            self.longest = [Step(sub_spec) for sub_spec in spec['longest']]
+            return
+
+        if 'find' not in spec:
+            raise RuleError("A step needs 'find' or 'longest': {}".format(spec))
+        self.matcher = TagMatcher(spec['find'])
+        self.in_head = spec.get('in_head', False)
+        self.unique = spec.get('unique', False)
+        self.path = [TagMatcher(path_spec) for path_spec in spec.get('path', [])]
+        self.clear = [TagMatcher(clear_spec) for clear_spec in spec.get('clear', [])]
+        self.separator = spec.get('separator')
+        self.strip = spec.get('strip', False)
+        self.equals = spec.get('equals')
+        self.min_len = spec.get('min_len')
+
+        get = spec.get('get', 'text')
+        self.attr = self.extractor = None
+        if get.startswith('attr:'):
+            self.get = 'attr'
+            self.attr = get[len('attr:'):]
+        elif get.startswith('extractor:'):
+            self.get = 'extractor'
+            self.extractor = TEXT_EXTRACTORS.get(get[len('extractor:'):])
+            if self.extractor is None:
+                raise RuleError("Unknown text extractor: {}".format(get))
+        elif get in ('string', 'text'):
+            self.get = get
+        else:
+            raise RuleError("Unknown value type: {}".format(get))
+
+    def __read(self, tag):
+        if self.get == 'string':
+            return tag.string
+        if self.get == 'text':
+            return tag.text if self.separator is None else tag.get_text(self.separator)
+        if self.get == 'attr':
+            return tag.attrs.get(self.attr)
+        return self.extractor(tag)
+
+    def value(self, index: SoupIndex):
+        return self.branch_value(index)[0]
+
+    def branch_value(self, index: SoupIndex):
+        """(value, branch) of the step, the branch being the selector of the step that gave the value"""
+        if self.longest is not None:
+            branch_values = [step.branch_value(index) for step in self.longest]
+            branch_values = [(val, branch) for val, branch in branch_values if val is not None and len(val) > 0]
+            return max(branch_values, key=lambda branch_value: len(branch_value[0])) if len(branch_values) > 0 \
+                else (None, None)
+        return self.__find_value(index), self.matcher.describe()
+
+    def __find_value(self, index: SoupIndex):
+        if self.in_head and index.head is None:
+            return None
+        tags = self.matcher.find_all_in_index(index, in_head=self.in_head)
+        if len(tags) == 0 or (self.unique and len(tags) != 1):
+            return None
+
+        tag = tags[0]
+        for matcher in self.path:
+            tag = matcher.find_in_tag(tag)
+            if tag is None:
+                return None
+        for matcher in self.clear:
+            to_clear = matcher.find_in_tag(tag)
+            if to_clear is not None:
+                to_clear.clear()
+
+        val = self.__read(tag)
+        if val is None:
+            return None
+        if self.strip:
+            val = val.strip()
+        if self.equals is not None and val != self.equals:
+            return None
+        if self.min_len is not None and len(val) < self.min_len:
+            return None
+        return val
+
+class SiteRules():
+    """Compiled extraction rules of a website"""
+    def __init__(self, rules):
+        self.name = rules.get('name')
+        validity = rules.get('validity', {})
+        self.reject_url_contains = validity.get('reject_url_contains', [])
+        self.accept = [Step(spec) for spec in validity.get('accept', [])]
+        self.fields = {}
+        for field in ARTICLE_FIELDS:
+            self.fields[field] = [Step(spec) for spec in rules['fields'].get(field, [])]
+
+# Compiled rules by the file path, so that they are compiled once per process
+_compiled_rules = {}
+
+def load_site_rules(rules_path) -> SiteRules:
+    if rules_path not in _compiled_rules:
+        with open(rules_path, 'r') as rules_file:
+            _compiled_rules[rules_path] = SiteRules(yaml.safe_load(rules_file))
+        logger.info("Compiled the extraction rules {}".format(rules_path))
+    return _compiled_rules[rules_path]
+
+class RuleBasedParser(HtmlParserI):
+    """HtmlParserI implementation driven by the compiled SiteRules of a website"""
+    def __init__(self, site_rules: SiteRules, html_text, url, parser_backend=None):
+        self.site_rules = site_rules
+        self.website_name = site_rules.name
+        self.soup = make_soup(html_text, url, parser_backend)
+        self.index = SoupIndex(self.soup)
+        self.url = url
+
+    def is_valid_article_page(self):
+        str_url = str(self.url)
+        for url_part in self.site_rules.reject_url_contains:
+            if url_part in str_url:
+                logger.info("Ignoring {0} as its url has {1}!".format(self.url, url_part))
+                return False
+
+        for step in self.site_rules.accept:
+            if step.value(self.index) is not None:
+                return True
+
+        if self.index.head is None:
+            conf_parser.error_logger.error("Invalid Article! Couldn't detect article validity:{}".format(self.url))
+        else:
+            # For debugging these pages
+            conf_parser.error_logger.error("Invalid Article! {}".format(self.url))
+        return False
+
+    def extract_field(self, field):
+        for step in self.site_rules.fields[field]:
+            val, branch = step.branch_value(self.index)
+            if val is not None:
+                return self.branch(branch, val)
+        return None
+
+    def extract_title(self):
+        return self.extract_field('title')
+
+    def extract_description(self):
+        return self.extract_field('description')
+
+    def extract_keywords(self):
+        return self.extract_field('keywords')
+
+    def extract_publish_date(self):
+        return self.extract_field('publish_date')
+
+    def extract_article_text(self):
+        return self.extract_field('article_text')
+
+    def extract_fields(self):
+        """Evaluate the rules of all the fields together on the index of the page"""
+        fields = {}
+        for field in ARTICLE_FIELDS:
+            fields[field] = self.timed_field(field)
+            if field == 'article_text':
+                art_text = fields[field]
+                if art_text is None or len(art_text) <= conf_parser.ARTICLE_TEXT_LEN_LIMIT:
+                    return None
+        return fields
@@ -0,0 +1,53 @@
+import os
+import time
+import sqlite3
+from collections import namedtuple
+import logging
+logger = logging.getLogger(__name__)
+
+ManifestRecord = namedtuple('ManifestRecord', ['path', 'size', 'mtime_ns', 'content_hash', 'link_count'])
+
+class FileManifest():
+    """Local SQLite manifest of the processed HTML files: size, mtime, content hash and num of extracted links.
+    The paths are relative to the website base directory, so that the manifest carries over
+    the snapshots of a website (run1, run2, ...). The records are kept per url index, in a table of their own,
+    since the links of a file are only in the url index it was processed for. A new url index starts
+    with no records, so all of its files are parsed. The new records are written by commit(), once the links
+    of those files are saved."""
+    def __init__(self, manifest_path, url_index):
+        manifest_dir = os.path.dirname(manifest_path)
+        if manifest_dir != '':
+            os.makedirs(manifest_dir, exist_ok=True)
+        self.url_index = url_index
+        self.table = '"files_{}"'.format(url_index.replace('"', '""'))
+        self.conn = sqlite3.connect(manifest_path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS {} (
+            path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, content_hash TEXT,
+            link_count INTEGER, processed_at INTEGER)""".format(self.table))
+        self.conn.commit()
+        self.pending_records = []
+
+    def get(self, path) -> ManifestRecord:
+        """The record of the file, None if it was never processed"""
+        row = self.conn.execute("SELECT path, size, mtime_ns, content_hash, link_count FROM {} WHERE path = ?"\
+            .format(self.table), (path,)).fetchone()
+        return ManifestRecord(*row) if row is not None else None
+
+    def add(self, path, size, mtime_ns, content_hash, link_count):
+        self.pending_records.append((path, size, mtime_ns, content_hash, link_count, int(time.time())))
+
+    def commit(self):
+        if len(self.pending_records) == 0:
+            return
+        self.conn.executemany("INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?, ?, ?)".format(self.table), \
+            self.pending_records)
+        self.conn.commit()
+        self.pending_records = []
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM {}".format(self.table)).fetchone()[0]
+
+    def close(self):
+        self.commit()
+        logger.info("File manifest has {0} files of the url index {1}".format(len(self), self.url_index))
+        self.conn.close()
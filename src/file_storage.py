@@ -1,24 +1,162 @@
+import os
+import re
+import glob
+import gzip
+import json
 from storage import StorageI
 
 import logging
 logger = logging.getLogger(__name__)
 
+try:
+    # Faster JSON encoder, optional
+    import orjson
+except ImportError:
+    orjson = None
+
+# File name suffix of every compression
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+WRITE_MODES = ('overwrite', 'append')
+
+def encode_doc(doc, ensure_ascii=True) -> bytes:
+    """One JSON line of the doc. A str doc is taken as already encoded.
+    With ensure_ascii, the non-ASCII characters are escaped as json.dumps does by default,
+    otherwise they are written as UTF-8, by orjson if it is installed"""
+    if isinstance(doc, str):
+        return doc.encode('utf-8') + b'\n'
+    if ensure_ascii:
+        return json.dumps(doc).encode('ascii') + b'\n'
+    if orjson is not None:
+        return orjson.dumps(doc) + b'\n'
+    return json.dumps(doc, ensure_ascii=False).encode('utf-8') + b'\n'
+
 class FileStorage(StorageI):
-    def __init__(self, file_path):
-        self.file_out = open(file_path, "w+")
-        logger.warning('Going to write/append the results to {} file.'.format(file_path))
-    
-    def save_doc(self, doc: str):
-        """Write/append a doc to file"""
-        line_to_write = doc + '\n'
-        self.file_out.write(line_to_write)
-        logger.debug('Saved:', doc)
-
-    def save_documents(self, documents):
+    """Writes the docs as JSON lines to the file, optionally compressed (gzip or zstd) and sharded.
+    The lines of write_buffer_docs docs are written in one go.
+    With shard_max_docs or shard_max_bytes(uncompressed), the docs are written to the shards
+    <file_path>.<n><compression suffix>, the next shard is started once a shard reaches either limit.
+    The mode 'overwrite' replaces the existing file (or shards), 'append' adds to them.
+    ensure_ascii=False writes the docs as UTF-8 instead of escaping the non-ASCII characters, see encode_doc."""
+    def __init__(self, file_path, mode='overwrite', compression=None, compress_level=None, \
+        shard_max_docs=0, shard_max_bytes=0, write_buffer_docs=1000, ensure_ascii=True):
+        if mode not in WRITE_MODES:
+            raise ValueError("Unknown write mode {0}, expected one of {1}".format(mode, WRITE_MODES))
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError("Unknown compression {0}, expected one of {1}".format(compression, \
+                list(COMPRESSION_SUFFIXES)))
+        if compression == 'zstd':
+            # Needed only for the zstd dumps
+            import zstandard
+            self.zstd_compressor = zstandard.ZstdCompressor(level=compress_level or 3)
+        self.file_path = file_path
+        self.mode = mode
+        self.compression = compression
+        self.compress_level = compress_level
+        self.shard_max_docs = shard_max_docs
+        self.shard_max_bytes = shard_max_bytes
+        self.sharded = shard_max_docs > 0 or shard_max_bytes > 0
+        self.write_buffer_docs = write_buffer_docs
+        self.ensure_ascii = ensure_ascii
+
+        file_dir = os.path.dirname(file_path)
+        if file_dir != '':
+            os.makedirs(file_dir, exist_ok=True)
+        self.shard_num = self.__first_shard_num()
+        self.file_out = None
+        if not self.sharded:
+            # Overwrites the file even if there is no doc to write
+            self.file_out = self.__open(self.__shard_path(0))
+        self.buffer = []
+        self.shard_docs = 0
+        self.shard_bytes = 0
+        self.doc_count = 0
+        logger.warning('Going to {0} the results to {1} file. Compression:{2} Sharded:{3}'\
+            .format(mode, file_path, compression, self.sharded))
+
+    def __shard_path(self, shard_num):
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        if not self.sharded:
+            return self.file_path if self.file_path.endswith(suffix) else self.file_path + suffix
+        return '{0}.{1:05d}{2}'.format(self.file_path, shard_num, suffix)
+
+    def __existing_shards(self):
+        """Shard num -> path of the shards already on the disk"""
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        pattern = re.compile(re.escape(self.file_path) + r'\.(\d{5})' + re.escape(suffix) + '$')
+        shards = {}
+        for path in glob.glob(glob.escape(self.file_path) + '.*'):
+            match = pattern.match(path)
+            if match is not None:
+                shards[int(match.group(1))] = path
+        return shards
+
+    def __first_shard_num(self):
+        """Shard to start with. Appending continues after the existing shards, overwriting removes them"""
+        if not self.sharded:
+            return 0
+        shards = self.__existing_shards()
+        if self.mode == 'append':
+            return max(shards) + 1 if len(shards) > 0 else 0
+        for path in shards.values():
+            os.remove(path)
+        if len(shards) > 0:
+            logger.warning('Removed {0} existing shards of {1}'.format(len(shards), self.file_path))
+        return 0
+
+    def __open(self, path):
+        file_mode = 'ab' if self.mode == 'append' else 'wb'
+        if self.compression == 'gzip':
+            # Appending adds a gzip member, still read as one stream
+            return gzip.open(path, file_mode, compresslevel=self.compress_level or 6)
+        if self.compression == 'zstd':
+            # Appending adds a zstd frame, still read as one stream
+            return self.zstd_compressor.stream_writer(open(path, file_mode))
+        return open(path, file_mode)
+
+    def __write_buffer(self):
+        if len(self.buffer) == 0:
+            return
+        if self.file_out is None:
+            self.file_out = self.__open(self.__shard_path(self.shard_num))
+        self.file_out.write(b''.join(self.buffer))
+        self.buffer = []
+
+    def __next_shard(self):
+        self.__write_buffer()
+        if self.file_out is not None:
+            self.file_out.close()
+            self.file_out = None
+        logger.info('Completed the shard {}'.format(self.__shard_path(self.shard_num)))
+        self.shard_num += 1
+        self.shard_docs = 0
+        self.shard_bytes = 0
+
+    def save_doc(self, doc, update_if_exists=False):
+        """Write/append a doc (dict, or an already encoded JSON str) to the file"""
+        line = encode_doc(doc, self.ensure_ascii)
+        if self.shard_docs > 0 and \
+            ((self.shard_max_docs > 0 and self.shard_docs >= self.shard_max_docs) or \
+            (self.shard_max_bytes > 0 and self.shard_bytes + len(line) > self.shard_max_bytes)):
+            self.__next_shard()
+        self.buffer.append(line)
+        self.shard_docs += 1
+        self.shard_bytes += len(line)
+        self.doc_count += 1
+        if len(self.buffer) >= self.write_buffer_docs:
+            self.__write_buffer()
+
+    def save_documents(self, documents, update_if_exists=False):
         for doc in documents:
             self.save_doc(doc)
-            
-    def close(self):
-        self.file_out.flush()
-        self.file_out.close()
 
+    def flush(self):
+        self.__write_buffer()
+        if self.file_out is not None:
+            self.file_out.flush()
+
+    def close(self):
+        self.__write_buffer()
+        if self.file_out is not None:
+            self.file_out.close()
+            self.file_out = None
+        logger.warning('Wrote {0} docs to {1}'.format(self.doc_count, self.file_path))
@@ -1,36 +1,57 @@
-from es_storage import ESStorage
+from storage_factory import make_storage
 from file_storage import FileStorage
 from storage import StorageI
 import conf_parser
-import json
+from profiler import PageProfiler, make_profiler, profile_flag, profile_page
+import os
+import sys
 
 import logging
 logger = logging.getLogger(__name__)
 
 class IndexDumper():
-    def __init__(self, index_storage: StorageI, target_storage: StorageI, json_query: dict):
+    def __init__(self, index_storage: StorageI, target_storage: StorageI, json_query: dict, save_batch_size=1000, \
+        profiler: PageProfiler = None):
         self.index_storage = index_storage
         self.target_storage = target_storage
         self.json_query = json_query
+        # Num of docs handed over to target_storage in one go
+        self.save_batch_size = save_batch_size
+        # Profiles the fetch and the save of every doc, if given
+        self.profiler = profiler
         logger.info("Source: {}".format(str(self.index_storage)))
         logger.info("Target: {}".format(str(self.target_storage)))
         logger.warning("Dump Query: {}".format(self.json_query))
 
     def fetch_and_save_dump(self):
-        res_itr = self.index_storage.get_documents(self.json_query, bulk_scroll=True)
+        if self.profiler is not None:
+            self.profiler.start()
+        res_itr = iter(self.index_storage.get_documents(self.json_query, bulk_scroll=True))
         cnt=0
-        for doc in res_itr:
-            doc = doc["_source"]
-            doc = json.dumps(doc)
-            self.target_storage.save_doc(doc)
-            cnt += 1
+        doc_batch = []
+        while True:
+            # A doc is fetched and saved (along with its batch) within its page of the profile
+            with profile_page(self.profiler):
+                doc = next(res_itr, None)
+                if doc is None:
+                    break
+                # The target storage encodes the docs
+                doc_batch.append(doc["_source"])
+                if len(doc_batch) >= self.save_batch_size:
+                    self.target_storage.save_documents(doc_batch)
+                    cnt += len(doc_batch)
+                    doc_batch = []
+        self.target_storage.save_documents(doc_batch)
+        cnt += len(doc_batch)
         logger.warning("Fetched and saved {} docs".format(cnt))
+        if self.profiler is not None:
+            self.profiler.finish()
 
     def close(self):
         self.index_storage.close()
         self.target_storage.close()
 
-def runner(dump_json_query=None):
+def runner(dump_json_query=None, profile=None):
     # The default json query
     if dump_json_query is None:
         dump_json_query = {
@@ -38,24 +59,38 @@ def runner(dump_json_query=None):
                 "url", "title",
                 "description", "keywords",
                 "publish_date", "article_text",
-                "text_len"],
+                "text_len", "cluster_id"],
             "query":{"bool":{"must":[{"range":{"text_len":{"gt":"20"}}}]}}
         }
 
     # Source index
     article_index_conf = conf_parser.SYS_CONFIG['article_index']
-    source_index = ESStorage(article_index_conf, read_only=True)
+    source_index = make_storage(article_index_conf, read_only=True)
 
     # Target storage
     index_dump_conf = conf_parser.SYS_CONFIG['index_dump_conf']
     dump_file_path = index_dump_conf['dump_file_path']
-    file_storage = FileStorage(dump_file_path)
+    if index_dump_conf.get('dump_format', 'jsonl') == 'parquet':
+        # Columnar dump, partitioned by the source. Needs pyarrow
+        from parquet_storage import ParquetStorage
+        file_name = os.path.splitext(os.path.basename(dump_file_path))[0]
+        target_storage = ParquetStorage(index_dump_conf['parquet_dir'], file_name, \
+            conf_parser.SYS_CONFIG['run_config']['website_enum'], dump_json_query['_source'], \
+            row_group_size=index_dump_conf.get('parquet_row_group_size', 10000), \
+            row_group_max_bytes=index_dump_conf.get('parquet_row_group_max_bytes', 64 * 1024 * 1024))
+    else:
+        target_storage = FileStorage(dump_file_path, mode=index_dump_conf.get('write_mode', 'overwrite'), \
+            compression=index_dump_conf.get('compression'), compress_level=index_dump_conf.get('compress_level'), \
+            shard_max_docs=index_dump_conf.get('shard_max_docs', 0), shard_max_bytes=index_dump_conf.get('shard_max_bytes', 0), \
+            write_buffer_docs=index_dump_conf.get('write_buffer_docs', 1000), ensure_ascii=index_dump_conf.get('ensure_ascii', True))
 
     # Fetch and save
-    index_dumper = IndexDumper(source_index, file_storage, dump_json_query)
+    profiler = make_profiler(conf_parser.SYS_CONFIG['run_config'], article_index_conf['index'] + '_dump', profile)
+    index_dumper = IndexDumper(source_index, target_storage, dump_json_query, profiler=profiler)
     index_dumper.fetch_and_save_dump()
     index_dumper.close()
 
 
 if __name__ == "__main__":
-    runner()
\ No newline at end of file
+    # Profile the first docs with --profile or --profile=sampling, see profiler
+    runner(profile=profile_flag(sys.argv[1:]))
\ No newline at end of file
@@ -1,7 +1,8 @@
 from enum import Enum
 import re
-from bs4 import BeautifulSoup
-from bs4.element import NavigableString, Comment
+import time
+from bs4 import BeautifulSoup, FeatureNotFound
+from bs4.element import NavigableString, Comment, Tag
 
 import logging
 logger = logging.getLogger(__name__)
@@ -9,9 +10,149 @@ bs4_logger = logging.getLogger("bs4.dammit")
 bs4_logger.setLevel(logging.INFO)
 
 import conf_parser
+from metrics import METRICS, metric_name
+
+# Tree builder that ships with python, used when the configured one fails
+FALLBACK_PARSER_BACKEND = "html.parser"
+# Backends found to be not installed, to avoid retrying them on every page
+_missing_parser_backends = set()
+
+def make_soup(html_text, url, parser_backend=None):
+    """Parse the html_text with the given BeautifulSoup tree builder (the configured one by default).
+    Falls back to html.parser if the backend is not installed, fails or gives an empty tree"""
+    if parser_backend is None:
+        parser_backend = conf_parser.HTML_PARSER_BACKEND
+    if isinstance(html_text, memoryview):
+        # A page of a packed dump
+        html_text = bytes(html_text)
+
+    if parser_backend != FALLBACK_PARSER_BACKEND and parser_backend not in _missing_parser_backends:
+        try:
+            soup = BeautifulSoup(html_text, parser_backend)
+            if soup.find(True) is not None:
+                return soup
+            conf_parser.error_logger.error("Parser {0} gave an empty tree for {1}".format(parser_backend, url))
+        except FeatureNotFound:
+            _missing_parser_backends.add(parser_backend)
+            logger.error("Parser {0} is not installed! Using {1}".format(parser_backend, FALLBACK_PARSER_BACKEND))
+        except Exception:
+            conf_parser.error_logger.error("Parser {0} failed on {1}".format(parser_backend, url))
+
+    return BeautifulSoup(html_text, FALLBACK_PARSER_BACKEND)
+
+class SoupIndex():
+    """Index of all the tags of a soup by name, id, class and meta property/name/itemprop,
+    built in a single traversal of the tree. The lookups give the same tag as soup.find
+    would, i.e. the first match in document order, without scanning the tree again."""
+    META_KEYS = ('property', 'name', 'itemprop')
+
+    def __init__(self, soup):
+        self.soup = soup
+        self.by_name = {}
+        self.by_id = {}
+        self.by_class = {}
+        self.by_meta = {}
+        pos = 0
+        for node in soup.descendants:
+            if not isinstance(node, Tag):
+                continue
+            entry = (pos, node)
+            pos += 1
+            self.by_name.setdefault(node.name, []).append(entry)
+            attrs = node.attrs
+            if 'id' in attrs:
+                self.by_id.setdefault(attrs['id'], []).append(entry)
+            if 'class' in attrs:
+                for cls in attrs['class']:
+                    self.by_class.setdefault(cls, []).append(entry)
+            if node.name == 'meta':
+                for key in self.META_KEYS:
+                    if key in attrs:
+                        self.by_meta.setdefault((key, attrs[key]), []).append(entry)
+
+        head = self.by_name.get('head')
+        self.head = head[0][1] if head else None
+
+    def __is_attached(self, tag):
+        """False if the tag was removed from the tree after indexing, e.g. by clear()"""
+        while tag.parent is not None:
+            tag = tag.parent
+        return tag is self.soup
+
+    def __is_in_head(self, tag):
+        return self.head is not None and any(parent is self.head for parent in tag.parents)
+
+    @staticmethod
+    def __class_matches(tag, matcher):
+        # Same as bs4: match any of the classes or the whole class string
+        classes = tag.attrs.get('class')
+        if classes is None:
+            return False
+        if isinstance(matcher, str):
+            return matcher in classes or ' '.join(classes) == matcher
+        return any(matcher.search(cls) for cls in classes) or matcher.search(' '.join(classes)) is not None
+
+    @staticmethod
+    def __entries_for(table, matcher):
+        """Index entries for an exact key, or for all the keys matching a compiled regex"""
+        if isinstance(matcher, str):
+            return table.get(matcher, [])
+        entries = []
+        for key, key_entries in table.items():
+            if matcher.search(key):
+                entries.extend(key_entries)
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def find_all(self, name, id=None, class_=None):
+        """All the attached tags with the given name, and id/class_ (a string or a compiled regex)"""
+        if id is not None:
+            entries = self.__entries_for(self.by_id, id)
+        elif class_ is not None and isinstance(class_, str) and ' ' not in class_:
+            entries = self.by_class.get(class_, [])
+        else:
+            entries = self.by_name.get(name, [])
+
+        tags = []
+        for _, tag in entries:
+            if tag.name != name:
+                continue
+            if class_ is not None and not self.__class_matches(tag, class_):
+                continue
+            if self.__is_attached(tag):
+                tags.append(tag)
+        return tags
+
+    def find(self, name, id=None, class_=None):
+        """First tag in document order with the given name, and id/class_. None if absent"""
+        tags = self.find_all(name, id=id, class_=class_)
+        return tags[0] if len(tags) > 0 else None
+
+    def find_all_meta(self, key, value, in_head=False):
+        """All the <meta> tags whose attribute key ('property', 'name' or 'itemprop')
+        matches value (a string or a compiled regex). in_head=True looks only inside <head>"""
+        if isinstance(value, str):
+            entries = self.by_meta.get((key, value), [])
+        else:
+            entries = sorted([entry for (k, v), meta_entries in self.by_meta.items() \
+                if k == key and value.search(v) for entry in meta_entries], key=lambda entry: entry[0])
+
+        tags = [tag for _, tag in entries if self.__is_attached(tag)]
+        if in_head:
+            tags = [tag for tag in tags if self.__is_in_head(tag)]
+        return tags
+
+    def find_meta(self, key, value, in_head=False):
+        tags = self.find_all_meta(key, value, in_head=in_head)
+        return tags[0] if len(tags) > 0 else None
 
 class HtmlParserI():
     """Interface that declares various extraction methods"""
+    # Name of the website in the metrics
+    website_name = None
+    # Fallback branch that gave the value of the latest extract_<field> call, see branch()
+    last_branch = None
+
     def is_valid_article_page():
         pass
     def extract_title():
@@ -25,6 +166,165 @@ class HtmlParserI():
     def extract_article_text():
         pass
 
+    def extract_fields(self):
+        """Extract all the article fields in one go, as a dict of make_article_doc arguments.
+        Returns None if the page does not have a valid article text"""
+        art_text = self.timed_field('article_text')
+        if art_text is None or len(art_text) <= conf_parser.ARTICLE_TEXT_LEN_LIMIT:
+            return None
+        return {
+            'article_text': art_text,
+            'title': self.timed_field('title'),
+            'description': self.timed_field('description'),
+            'keywords': self.timed_field('keywords'),
+            'publish_date': self.timed_field('publish_date')
+        }
+
+    def branch(self, label, value):
+        """Return the value of a field, recording the fallback branch that gave it as a selector.
+        Ex: 'div.pj-article__content', 'meta[name=keywords]'"""
+        self.last_branch = label
+        return value
+
+    def timed_field(self, field):
+        """Extract the field by its extract_<field> method, recording the latency and the fallback branch that
+        gave the value (reported by the method with branch()) in the metrics"""
+        self.last_branch = None
+        start = time.perf_counter()
+        value = getattr(self, 'extract_' + field)()
+        METRICS.observe(metric_name('extract', self.website_name, field), time.perf_counter() - start)
+        if value is None:
+            branch = 'none'
+        else:
+            branch = self.last_branch if self.last_branch is not None else 'unknown'
+        METRICS.count(metric_name('branch', self.website_name, field, branch))
+        return value
+
+# Patterns used by the site parsers, compiled once
+KP_ARTICLE_PUBLISH_PATTERN = re.compile("ArticlePublish.*")
+PJ_ARTICLE_TAGS_PATTERN = re.compile("pj-article__tags.*")
+PJ_DATE_PUBLISHED_PATTERN = re.compile("pj-article__detail__date-published.*")
+PJ_FIELD_BODY_PATTERN = re.compile("field field-name-body")
+VK_CONTENT_AREA_PATTERN = re.compile("contentarea_*")
+VK_KEYWORDS_PATTERN = re.compile("[kK]eywords")
+
+def get_paragraphs_text(body):
+    """Text of all the <p> in body, leaving out the link-only paragraphs and the 'read also' links"""
+    article_text = ""
+    for ps in body.find_all("p"):
+        para_text = ps.get_text(" ")
+        # Empty string, ignore
+        if len(str(para_text).strip()) == 0:
+            continue
+
+        # If the text in this ps is same as that of first <a>, then this 'ps'
+        #  does not contain anything else, so ignore it
+        first_a = ps.find("a")
+        if first_a is not None and len(para_text) <= len(first_a.text):
+            continue
+
+        # Clear the intermediate links
+        if "ಇದನ್ನೂ ಓದಿ" in para_text or "ಇನ್ನಷ್ಟು..." in para_text:
+            all_a = ps.find_all("a")
+            for a in all_a:
+                # Remove the anchor text
+                a.clear()
+            # Recapture the whole text
+            para_text = ps.get_text(" ")
+            # Remove special texts
+            para_text = para_text.replace("ಇದನ್ನೂ ಓದಿ:", "") \
+                .replace("ಇದನ್ನೂ ಓದಿ...", "") \
+                .replace("ಇದನ್ನೂ ಓದಿ", "") \
+                .replace("ಇನ್ನಷ್ಟು...", "")
+
+        article_text = article_text + para_text + "\n"
+    return article_text
+
+def is_line_break(element):
+    return (element == '\n' or element.name == 'br')
+
+def get_story_children_text(article_body):
+    """Text of the direct children of article_body, leaving out the ads, images and the
+    links placed between line breaks"""
+    children = list(article_body.children)
+    article_text = ""
+    for i,ch in enumerate(children):
+        # Ignore ad and br tags
+        if ch.name == 'ad' or ch.name == 'br':
+            #print(str(ch))
+            pass
+        # If it is a plain text
+        elif type(ch) is NavigableString:
+            txt = str(ch)
+            if len(txt) >= 1:
+                article_text = article_text + ' ' + txt
+        else:
+            # It could be a <br/> or <a/>
+            # if it is an <a/>, check previous and next tags
+            if ch.name == 'a':
+                # Starts with <a/>
+                if i == 0:
+                    article_text = article_text + ch.text
+                # Ends with <a/>
+                elif i == len(children)-1:
+                    pass
+                # In-between <br/> tags
+                else:
+                    # A <a> tag surrounded by <br/>
+                    if is_line_break(children[i-1]) and is_line_break(children[i+1]):
+                        pass
+                    else:
+                        article_text = article_text + ch.text
+            # Div tag with image or ad, ignore it
+            elif ch.name == 'div':
+                if "class" in ch.attrs:
+                    cls_str = ' '.join(ch["class"])
+                else:
+                    cls_str = None
+                if cls_str is not None and ('img' in cls_str or 'ad' in cls_str):
+                    pass
+                else:
+                    article_text = article_text + ch.text
+
+            # Any other tag, just add the text
+            else:
+                article_text = article_text + ch.text
+
+    # End of for
+    return article_text
+
+def get_normal_div_text(norm_div):
+    """Text of the direct children of norm_div, leaving out the child divs, comments and
+    the links placed between line breaks"""
+    children = list(norm_div.children)
+    article_text = ""
+    for i,child in enumerate(children):
+        # Ignore the div children
+        if child.name == "div" or type(child) == Comment:
+            pass
+        else:
+            if type(child) is NavigableString:
+                article_text = article_text + str(child)
+            # if it is an <a/>, check previous and next tags
+            elif child.name == 'a':
+                # Starts with <a/>
+                if i == 0:
+                    article_text = article_text + child.text
+                # Ends with <a/>
+                elif i == len(children)-1:
+                    pass
+                # In-between <br/> tags
+                else:
+                    # A <a> tag surrounded by <br/>
+                    if is_line_break(children[i-1]) and is_line_break(children[i+1]):
+                        pass
+                    else:
+                        article_text = article_text + child.get_text(" ").strip()
+            else:
+                article_text = article_text + child.get_text(" ").strip()
+    # End of for
+    return article_text
+
 class Website(Enum):
     KANNADAPRABHA='kannadaprabha'
     PRAJAVANI='prajavani'
@@ -32,18 +332,21 @@ class Website(Enum):
     # TODO Other websites go here
 
 class KannadaPrabhaParser(HtmlParserI):
-    def __init__(self, html_text, url):
-        self.soup = BeautifulSoup(html_text, "html.parser")
+    website_name = Website.KANNADAPRABHA.value
+
+    def __init__(self, html_text, url, parser_backend=None):
+        self.soup = make_soup(html_text, url, parser_backend)
+        self.index = SoupIndex(self.soup)
         self.url = url
         # For verifying
         # logger.debug('Valid article page: {}'.format(self.is_valid_article_page()))
 
     def is_valid_article_page(self):
-        if self.soup.head is None:
+        if self.index.head is None:
             conf_parser.error_logger.error("Invalid Article! Couldn't detect article validity:{}".format(self.url))
             return False
 
-        page_type = self.soup.head.find_all('meta', attrs={"property": "og:type"})
+        page_type = self.index.find_all_meta("property", "og:type", in_head=True)
         if len(page_type) == 1:
             page_type = page_type[0]
             og_type = page_type['content']
@@ -64,74 +367,74 @@ class KannadaPrabhaParser(HtmlParserI):
 
     def extract_title(self):
         # Most commonly found title
-        div_article_headline = self.soup.find("div", attrs={"class": "div_article_headline"})
+        div_article_headline = self.index.find("div", class_="div_article_headline")
         if div_article_headline is not None:
             span = div_article_headline.find("span")
-            return span.string
+            return self.branch('div.div_article_headline', span.string)
 
         # Alternate way 1 
-        article_head = self.soup.find("h1", attrs={"class": "ArticleHead"})
+        article_head = self.index.find("h1", class_="ArticleHead")
         if article_head is not None:
-            return article_head.string
+            return self.branch('h1.ArticleHead', article_head.string)
 
         # Alternate way 2
-        div_headline = self.soup.find('div', class_="article_headline")
+        div_headline = self.index.find('div', class_="article_headline")
         if div_headline is not None:
             span = div_headline.find("span")
-            return span.string
+            return self.branch('div.article_headline', span.string)
 
         # Alternate way 3
-        meta = self.soup.find("meta", attrs={"property": "og:title"})
+        meta = self.index.find_meta("property", "og:title")
         if meta is not None and "content" in meta.attrs:
-            return meta["content"]
+            return self.branch('meta[property=og:title]', meta["content"])
         
         # Last option
-        return self.soup.find("title").string
+        return self.branch('title', self.index.find("title").string)
         
     def extract_keywords(self):
         # Most commonly found in meta
-        news_keywords = self.soup.find("meta", attrs={"name": "news_keywords"})
+        news_keywords = self.index.find_meta("name", "news_keywords")
         if news_keywords is not None and "content" in news_keywords.attrs:
-            return news_keywords["content"]
+            return self.branch('meta[name=news_keywords]', news_keywords["content"])
         
         # Alternate way
-        keyword = self.soup.find('div', class_="article_topic")
+        keyword = self.index.find('div', class_="article_topic")
         if keyword is not None and keyword.span is not None:
-            return keyword.span.string
+            return self.branch('div.article_topic', keyword.span.string)
         
         # Last option
         return None
 
     def extract_description(self):
         # Most commonly found in meta
-        meta_desc = self.soup.find("meta", attrs={"property": "og:description"})
+        meta_desc = self.index.find_meta("property", "og:description")
         if meta_desc is not None and "content" in meta_desc.attrs:
-            return meta_desc["content"]
+            return self.branch('meta[property=og:description]', meta_desc["content"])
         
         # Last option
         return None
 
     def extract_publish_date(self):
         # Most commonly found
-        div_article_dateline = self.soup.find("div", class_="div_article_dateline")
+        div_article_dateline = self.index.find("div", class_="div_article_dateline")
         if div_article_dateline is not None:
             spans = div_article_dateline.find_all("span")
             if spans is not None and len(spans) > 0:
-                return spans[0].string
+                return self.branch('div.div_article_dateline', spans[0].string)
 
         # Alternate way 1: Find p with class="ArticlePublish margin-bottom-10"
-        article_publish = self.soup.find("p", class_=re.compile("ArticlePublish.*"))
+        article_publish = self.index.find("p", class_=KP_ARTICLE_PUBLISH_PATTERN)
         if article_publish is not None:
             spans = article_publish.find_all("span")
             if spans is not None and len(spans) > 0:
-                return spans[0].string
+                return self.branch('p.ArticlePublish.*', spans[0].string)
         
         # Alternate way 2
-        dateline = self.soup.find('div', class_="article_dateline")
+        dateline = self.index.find('div', class_="article_dateline")
         if dateline is not None:
             spans = dateline.find_all("span")
             if spans is not None and len(spans) > 0:
-                return spans[0].string
+                return self.branch('div.article_dateline', spans[0].string)
 
         # Last option
         return None
@@ -140,7 +443,7 @@ class KannadaPrabhaParser(HtmlParserI):
         # WARN:: Returns the plain text, AFTER REMOVING all the children tags and paragraph layouts
 
         # Most commonly found
-        div_article_text = self.soup.find("div", class_="div_article_text")
+        div_article_text = self.index.find("div", class_="div_article_text")
         text_1 = ""
         if div_article_text is not None:
             span = div_article_text.find("span")
@@ -148,7 +451,7 @@ class KannadaPrabhaParser(HtmlParserI):
                 text_1 = span.get_text(" ").strip()
         
         # Alternate way 1
-        story_content = self.soup.find("div", id="storyContent")
+        story_content = self.index.find("div", id="storyContent")
         text_2 = ""
         if story_content is not None:
             # Remove the divs with class="author_txt" and class="agency_txt"
@@ -165,33 +468,36 @@ class KannadaPrabhaParser(HtmlParserI):
         # If one of these have some non-empty text, return the longest one
         if len(text_1) != 0 or len(text_2) != 0:
             if len(text_1) > len(text_2):
-                return text_1
+                return self.branch('div.div_article_text', text_1)
             else:
-                return text_2
+                return self.branch('div#storyContent', text_2)
 
         # Alternate way 2
-        article_text = self.soup.find('div', class_="article_text")
+        article_text = self.index.find('div', class_="article_text")
         if article_text is not None:
             span = article_text.find('span')
             if span is not None and span.text is not None:
-                return span.get_text(" ")
+                return self.branch('div.article_text', span.get_text(" "))
             
         # Last option
         return None
 
-class PrajavaniParser():
+class PrajavaniParser(HtmlParserI):
     """Interface that declares various extraction methods"""
-    def __init__(self, html_text, url):
-        self.soup = BeautifulSoup(html_text, "html.parser")
+    website_name = Website.PRAJAVANI.value
+
+    def __init__(self, html_text, url, parser_backend=None):
+        self.soup = make_soup(html_text, url, parser_backend)
+        self.index = SoupIndex(self.soup)
         self.url = url
 
     def is_valid_article_page(self):
-        if self.soup.head is None:
+        if self.index.head is None:
             conf_parser.error_logger.error("Invalid Article! Couldn't detect article validity:{}".format(self.url))
             return False
 
         # Alternate way 1
-        page_type = self.soup.head.find_all('meta', attrs={"property": "og:type"})
+        page_type = self.index.find_all_meta("property", "og:type", in_head=True)
         if len(page_type) == 1:
             page_type = page_type[0]
             og_type = page_type['content']
@@ -203,7 +509,7 @@ class PrajavaniParser():
                 logger.debug("Og Type is not 'article' for this url!")
 
         # Alternate way 2 (A bit hacky way)
-        article_title = self.soup.find("div", class_="pj-article__title")
+        article_title = self.index.find("div", class_="pj-article__title")
         if article_title is not None and len(str(article_title.text).strip()) > 5:
             return True
 
@@ -215,121 +521,92 @@ class PrajavaniParser():
 
     def extract_title(self):
         # Most commonly found title
-        pj_article_title = self.soup.find("div", attrs={"class": "pj-article__title"})
+        pj_article_title = self.index.find("div", class_="pj-article__title")
         if pj_article_title is not None:
             h1 = pj_article_title.find("h1")
             if h1 is not None:
-                return h1.text
+                return self.branch('div.pj-article__title', h1.text)
             else:
-                return pj_article_title.text
+                return self.branch('div.pj-article__title', pj_article_title.text)
 
         # Alternate way 1
-        meta = self.soup.find("meta", attrs={"property": "og:title"})
+        meta = self.index.find_meta("property", "og:title")
         if meta is not None and "content" in meta.attrs:
-            return meta["content"]
+            return self.branch('meta[property=og:title]', meta["content"])
         
         # Last option
-        return self.soup.find("title").string
+        return self.branch('title', self.index.find("title").string)
 
     def extract_description(self):
         # Most commonly found in meta
-        meta_desc = self.soup.find("meta", attrs={"name": "description"})
+        meta_desc = self.index.find_meta("name", "description")
         if meta_desc is not None and "content" in meta_desc.attrs:
-            return meta_desc["content"]
+            return self.branch('meta[name=description]', meta_desc["content"])
 
         # Alternate way 1
-        meta_desc = self.soup.find("meta", attrs={"property": "og:description"})
+        meta_desc = self.index.find_meta("property", "og:description")
         if meta_desc is not None and "content" in meta_desc.attrs:
-            return meta_desc["content"]        
+            return self.branch('meta[property=og:description]', meta_desc["content"])        
         
         # Last option
         return None
 
     def extract_keywords(self):
         # Most commonly found
-        div_article_tags = self.soup.find("div", class_=re.compile("pj-article__tags.*"))
+        div_article_tags = self.index.find("div", class_=PJ_ARTICLE_TAGS_PATTERN)
         if div_article_tags is not None:
-            return div_article_tags.get_text(",")
+            return self.branch('div.pj-article__tags.*', div_article_tags.get_text(","))
 
         # Alternate way 1
-        news_keywords = self.soup.find("meta", attrs={"name": "keywords"})
+        news_keywords = self.index.find_meta("name", "keywords")
         if news_keywords is not None and "content" in news_keywords.attrs:
-            return news_keywords["content"]
+            return self.branch('meta[name=keywords]', news_keywords["content"])
 
         return None
 
     def extract_publish_date(self):
         # Most commonly found
-        authors_date_section = self.soup.find("div", class_="pj-article__detail__authors__date-section")
+        authors_date_section = self.index.find("div", class_="pj-article__detail__authors__date-section")
         if authors_date_section is not None:
             time_tag = authors_date_section.find("time")
             if time_tag is not None:
-                return time_tag.string
+                return self.branch('div.pj-article__detail__authors__date-section', time_tag.string)
 
         # Alternate way 1
-        article_date_published = self.soup.find("div", class_=re.compile("pj-article__detail__date-published.*"))
+        article_date_published = self.index.find("div", class_=PJ_DATE_PUBLISHED_PATTERN)
         if article_date_published is not None:
             time_tag = article_date_published.find("time")
             if time_tag is not None:
-                return time_tag.string
+                return self.branch('div.pj-article__detail__date-published.*', time_tag.string)
 
         # Last option
-        meta_publish_time = self.soup.find("meta", attrs={"property": "article:published_time"})
+        meta_publish_time = self.index.find_meta("property", "article:published_time")
         if meta_publish_time is not None and "content" in meta_publish_time.attrs:
-            return meta_publish_time["content"]
+            return self.branch('meta[property=article:published_time]', meta_publish_time["content"])
 
         return None
 
     def extract_article_text(self):
-        # Extract text from all <p>
-        def __get_article_text(body):
-            article_text = ""
-            for ps in body.find_all("p"):
-                para_text = ps.get_text(" ")
-                # Empty string, ignore
-                if len(str(para_text).strip()) == 0:
-                    continue
-
-                # If the text in this ps is same as that of first <a>, then this 'ps'
-                #  does not contain anything else, so ignore it
-                first_a = ps.find("a")
-                if first_a is not None and len(para_text) <= len(first_a.text):
-                    continue
-
-                # Clear the intermediate links
-                if "ಇದನ್ನೂ ಓದಿ" in para_text or "ಇನ್ನಷ್ಟು..." in para_text:
-                    all_a = ps.find_all("a")
-                    for a in all_a:
-                        # Remove the anchor text
-                        a.clear()
-                    # Recapture the whole text
-                    para_text = ps.get_text(" ")
-                    # Remove special texts
-                    para_text = para_text.replace("ಇದನ್ನೂ ಓದಿ:", "") \
-                        .replace("ಇದನ್ನೂ ಓದಿ...", "") \
-                        .replace("ಇದನ್ನೂ ಓದಿ", "") \
-                        .replace("ಇನ್ನಷ್ಟು...", "")
-
-                article_text = article_text + para_text + "\n"
-            return article_text
-
         # Most commonly found and found only in this!
-        article_content = self.soup.find("div", class_="pj-article__content")
+        article_content = self.index.find("div", class_="pj-article__content")
         if article_content is not None:
-            return __get_article_text(article_content)
+            return self.branch('div.pj-article__content', get_paragraphs_text(article_content))
         
         # Alternate way 1
-        article_field = self.soup.find("div", class_=re.compile("field field-name-body"))
+        article_field = self.index.find("div", class_=PJ_FIELD_BODY_PATTERN)
         if article_field is not None:
-            return __get_article_text(article_field)
+            return self.branch('div.field field-name-body', get_paragraphs_text(article_field))
 
         # Last option
         return None
 
-class VijayakarnatakaParser():
+class VijayakarnatakaParser(HtmlParserI):
     """Interface that declares various extraction methods"""
-    def __init__(self, html_text, url):
-        self.soup = BeautifulSoup(html_text, "html.parser")
+    website_name = Website.VIJAYAKARNATAKA.value
+
+    def __init__(self, html_text, url, parser_backend=None):
+        self.soup = make_soup(html_text, url, parser_backend)
+        self.index = SoupIndex(self.soup)
         self.url = url
 
     def is_valid_article_page(self):
@@ -339,7 +616,7 @@ class VijayakarnatakaParser():
             logger.info("Ignoring {} as it is a tech/video article!".format(self.url)) 
             return False
 
-        article_div = self.soup.find("div", class_="article")
+        article_div = self.index.find("div", class_="article")
         if article_div is not None:
             article_div = article_div.find("div", class_="section1")
             if article_div is not None:
@@ -347,12 +624,12 @@ class VijayakarnatakaParser():
                 if len(article_div.text) > 99:
                     return True
 
-        if self.soup.head is None:
+        if self.index.head is None:
             conf_parser.error_logger.error("Invalid Article! Couldn't detect article validity:{}".format(self.url))
             return False
 
         # Alternate way 1
-        page_type = self.soup.head.find('meta', attrs={"name": "og:type"})
+        page_type = self.index.find_meta("name", "og:type", in_head=True)
         if page_type is not None:
             og_type = page_type['content']
             logger.debug('Og Type: {}'.format(og_type))
@@ -360,7 +637,7 @@ class VijayakarnatakaParser():
             if og_type == 'article':
                 return True
         # Alternative way 2
-        page_type = self.soup.head.find('meta', attrs={"property": "og:type"})
+        page_type = self.index.find_meta("property", "og:type", in_head=True)
         if page_type is not None:
             og_type = page_type['content']
             logger.debug('Og Type: {}'.format(og_type))
@@ -376,55 +653,55 @@ class VijayakarnatakaParser():
 
     def extract_title(self):
         # Most commonly found title
-        story_article = self.soup.find("div", attrs={"class": "story-article"})
+        story_article = self.index.find("div", class_="story-article")
         if story_article is not None:
             h1 = story_article.find("h1")
             if h1 is not None:
-                return h1.text
+                return self.branch('div.story-article', h1.text)
 
-        content_area = self.soup.find("div", id=re.compile("contentarea_*"))
+        content_area = self.index.find("div", id=VK_CONTENT_AREA_PATTERN)
         if content_area is not None:
             h1 = content_area.find("h1")
             if h1 is not None:
-                return h1.text
+                return self.branch('div#contentarea_*', h1.text)
 
         # Alternate way 1
-        meta = self.soup.find("meta", attrs={"property": "og:title"})
+        meta = self.index.find_meta("property", "og:title")
         if meta is not None and "content" in meta.attrs:
-            return meta["content"]
+            return self.branch('meta[property=og:title]', meta["content"])
 
         # Last option
-        ttl = self.soup.find("title")
+        ttl = self.index.find("title")
         if ttl is not None:
-            return ttl.string
+            return self.branch('title', ttl.string)
         else:
             # Blindly return the first <h1>
-            return self.soup.find("h1").text
+            return self.branch('h1', self.index.find("h1").text)
 
     def extract_description(self):
         # Most commonly found in meta
-        enable_read_more_div = self.soup.find("div", attrs={"class": "enable-read-more"})
+        enable_read_more_div = self.index.find("div", class_="enable-read-more")
         if enable_read_more_div is not None:
             h2 = enable_read_more_div.find("h2")
             if h2 is not None:
-                return h2.text
+                return self.branch('div.enable-read-more', h2.text)
 
         # Alternate way 1
-        content_area = self.soup.find("div", id=re.compile("contentarea_*"))
+        content_area = self.index.find("div", id=VK_CONTENT_AREA_PATTERN)
         if content_area is not None:
             h2 = content_area.find("h2")
             if h2 is not None:
-                return h2.text
+                return self.branch('div#contentarea_*', h2.text)
 
         # Alternate way 2
-        meta_desc = self.soup.find("meta", attrs={"name": "description"})
+        meta_desc = self.index.find_meta("name", "description")
         if meta_desc is not None and "content" in meta_desc.attrs:
-            return meta_desc["content"]
+            return self.branch('meta[name=description]', meta_desc["content"])
 
         # Alternate way 3
-        meta_desc = self.soup.find("meta", attrs={"property": "og:description"})
+        meta_desc = self.index.find_meta("property", "og:description")
         if meta_desc is not None and "content" in meta_desc.attrs:
-            return meta_desc["content"]
+            return self.branch('meta[property=og:description]', meta_desc["content"])
 
         # Last option
         return None
@@ -444,147 +721,71 @@ class VijayakarnatakaParser():
                 return None
 
         # Most commonly found
-        div_keywords = self.soup.find("div", class_="keywords")
+        div_keywords = self.index.find("div", class_="keywords")
         if div_keywords is not None:
             keys = get_keywords_from_links(div_keywords)
             if keys is not None:
-                return keys
+                return self.branch('div.keywords', keys)
 
-        div_keywords = self.soup.find("div", class_="keywords_wrap")
+        div_keywords = self.index.find("div", class_="keywords_wrap")
         if div_keywords is not None:
             keys = get_keywords_from_links(div_keywords)
             if keys is not None:
-                return keys
+                return self.branch('div.keywords_wrap', keys)
 
         # Alternate way 1
-        news_keywords = self.soup.find("meta", attrs={"name": re.compile("[kK]eywords")})
+        news_keywords = self.index.find_meta("name", VK_KEYWORDS_PATTERN)
         if news_keywords is not None and "content" in news_keywords.attrs:
-            return news_keywords["content"]
+            return self.branch('meta[name=[kK]eywords]', news_keywords["content"])
 
         return None
 
     def extract_publish_date(self):
         # Most commonly found
-        datePublished_meta = self.soup.find("meta", attrs={"itemprop": "datePublished"})
+        datePublished_meta = self.index.find_meta("itemprop", "datePublished")
         if datePublished_meta is not None and "content" in datePublished_meta.attrs:
-            return datePublished_meta["content"]
+            return self.branch('meta[itemprop=datePublished]', datePublished_meta["content"])
 
         # Alternate way 1
-        time_span = self.soup.find("span", class_="time")
+        time_span = self.index.find("span", class_="time")
         if time_span is not None:
-            return time_span.text
+            return self.branch('span.time', time_span.text)
 
         # Alternate way 2
-        datetime_div = self.soup.find("div", class_="article_datetime")
+        datetime_div = self.index.find("div", class_="article_datetime")
         if datetime_div is not None:
             time_tag = datetime_div.find("time")
             if time_tag is not None:
-                return time_tag.text
+                return self.branch('div.article_datetime', time_tag.text)
             else:
                 # Remove the <span>
                 dtsp = datetime_div.find("span")
                 if dtsp is not None:
                     dtsp.clear()
-                return datetime_div.text
+                return self.branch('div.article_datetime', datetime_div.text)
 
         return None
 
     def is_line_break(self, element):
-        return (element == '\n' or element.name == 'br')
+        return is_line_break(element)
 
     def extract_article_text(self):
-        # Extract text from all <p>
-        def __get_article_text(article_body):
-            children = list(article_body.children)
-            article_text = ""
-            for i,ch in enumerate(children):
-                # Ignore ad and br tags
-                if ch.name == 'ad' or ch.name == 'br':
-                    #print(str(ch))
-                    pass
-                # If it is a plain text
-                elif type(ch) is NavigableString:
-                    txt = str(ch)
-                    if len(txt) >= 1:
-                        article_text = article_text + ' ' + txt
-                else:
-                    # It could be a <br/> or <a/>
-                    # if it is an <a/>, check previous and next tags
-                    if ch.name == 'a':
-                        # Starts with <a/>
-                        if i == 0:
-                            article_text = article_text + ch.text
-                        # Ends with <a/>
-                        elif i == len(children)-1:
-                            pass
-                        # In-between <br/> tags
-                        else:
-                            # A <a> tag surrounded by <br/>
-                            if self.is_line_break(children[i-1]) and self.is_line_break(children[i+1]):
-                                pass
-                            else:
-                                article_text = article_text + ch.text
-                    # Div tag with image or ad, ignore it
-                    elif ch.name == 'div':
-                        if "class" in ch.attrs:
-                            cls_str = ' '.join(ch["class"])
-                        else:
-                            cls_str = None
-                        if cls_str is not None and ('img' in cls_str or 'ad' in cls_str):
-                            pass
-                        else:
-                            article_text = article_text + ch.text
-
-                    # Any other tag, just add the text
-                    else:
-                        article_text = article_text + ch.text
-
-            # End of for
-            return article_text
-
         # Most commonly found and found only in this!
-        article_content = self.soup.find("article", class_="story-content")
+        article_content = self.index.find("article", class_="story-content")
         if article_content is not None:
-            return __get_article_text(article_content)
+            return self.branch('article.story-content', get_story_children_text(article_content))
 
         # Alternate way 1
-        article_div = self.soup.find("div", class_="article")
+        article_div = self.index.find("div", class_="article")
         if article_div is not None:
             article_div = article_div.find("div", class_="section1")
             if article_div is not None:
                 norm_div = article_div.find("div", class_="Normal")
                 if norm_div is not None:
-                    children = list(norm_div.children)
-                    article_text = ""
-                    for i,child in enumerate(children):
-                        # Ignore the div children
-                        if child.name == "div" or type(child) == Comment:
-                            pass
-                        else:
-                            if type(child) is NavigableString:
-                                article_text = article_text + str(child)
-                            # if it is an <a/>, check previous and next tags
-                            elif child.name == 'a':
-                                # Starts with <a/>
-                                if i == 0:
-                                    article_text = article_text + child.text
-                                # Ends with <a/>
-                                elif i == len(children)-1:
-                                    pass
-                                # In-between <br/> tags
-                                else:
-                                    # A <a> tag surrounded by <br/>
-                                    if self.is_line_break(children[i-1]) and self.is_line_break(children[i+1]):
-                                        pass
-                                    else:
-                                        article_text = article_text + child.get_text(" ").strip()
-                            else:
-                                article_text = article_text + child.get_text(" ").strip()
-                    # End of for
-                    return article_text
+                    return self.branch('div.article', get_normal_div_text(norm_div))
                 # If no "Normal" div is found 
                 else:
-                    return article_div.get_text(" ").strip()
+                    return self.branch('div.article', article_div.get_text(" ").strip())
 
         # Last option
         return None
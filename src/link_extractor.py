@@ -1,14 +1,84 @@
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
+import re
+import html
+from bs4.dammit import UnicodeDammit
 import logging
 logger = logging.getLogger(__name__)
     
 from es_doc_maker import make_url_doc
 from storage import StorageI
+from html_parser import make_soup
+
+# Link-bearing tags other than <a>, and the attribute holding the link
+LINK_TAG_ATTRS = {'area': 'href', 'iframe': 'src', 'frame': 'src'}
+# <link rel=...> values pointing to other versions of the page
+LINK_RELS = {'canonical', 'amphtml', 'alternate'}
+# <meta property/name=...> values holding the url of the page
+META_URL_NAMES = {'og:url', 'twitter:url'}
+
+def get_tag_link(tag, attrs):
+    """Return the link carried by the tag with the given attrs dict, None if it has none"""
+    if tag == 'a' or tag in LINK_TAG_ATTRS:
+        return attrs.get(LINK_TAG_ATTRS.get(tag, 'href'))
+    if tag == 'link':
+        rel = attrs.get('rel')
+        # bs4 gives the multi-valued rel as a list
+        rels = rel.split() if isinstance(rel, str) else (rel or [])
+        if LINK_RELS.intersection(rels):
+            return attrs.get('href')
+    elif tag == 'meta':
+        if attrs.get('property') in META_URL_NAMES or attrs.get('name') in META_URL_NAMES:
+            return attrs.get('content')
+    return None
+
+# Link-bearing tags, collected by the fast mode
+LINK_TAGS = {'a', 'link', 'meta'}.union(LINK_TAG_ATTRS.keys())
+# Attributes of a start tag. A quoted value may have a '>' in it
+TAG_ATTRS = r'''[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*'''
+# Precompiled pattern used by the fast mode to tokenize the markup. A comment, or a <script>/<style> element
+# along with its raw text, is matched as a whole and skipped. Otherwise the start tag is matched
+TOKEN_PATTERN = re.compile(r'<!--.*?-->|<(script|style)\b' + TAG_ATTRS + r'>.*?</\1\s*>|<([a-z][^\s/>]*)(' + TAG_ATTRS + r')>', \
+    re.I | re.S)
+ATTR_PATTERN = re.compile(r'''([^\s"'=<>/]+)\s*=\s*("[^"]*"|'[^']*'|[^\s>]+)''')
+
+def tokenize_links(html_text):
+    """Collect the links from the start tags of html_text, without building a tree"""
+    link_set = set()
+    for token_match in TOKEN_PATTERN.finditer(html_text):
+        tag = token_match.group(2)
+        if tag is None:
+            continue
+        tag = tag.lower()
+        if tag not in LINK_TAGS:
+            continue
+        attrs = {}
+        for name, value in ATTR_PATTERN.findall(token_match.group(3)):
+            if value[:1] in ('"', "'"):
+                value = value[1:-1]
+            if '&' in value:
+                value = html.unescape(value)
+            attrs.setdefault(name.lower(), value)
+        link = get_tag_link(tag, attrs)
+        if link is not None:
+            link_set.add(link)
+    return link_set
+
+def to_unicode(html_text):
+    """Decode the raw html bytes (or a memoryview of them), guessing the encoding only if it is not utf-8"""
+    if not isinstance(html_text, (bytes, memoryview)):
+        return html_text
+    try:
+        return str(html_text, 'utf-8')
+    except UnicodeDecodeError:
+        return UnicodeDammit(bytes(html_text), is_html=True).unicode_markup
 
 class LinkExtractor:
-    def __init__(self, storage: StorageI=None):
+    def __init__(self, storage: StorageI=None, parser_backend=None, fast_mode=False):
+        """If fast_mode is True, the links are collected by only tokenizing the tags,
+        otherwise from a full BeautifulSoup tree"""
         self.storage = storage
+        self.parser_backend = parser_backend
+        self.fast_mode = fast_mode
     
     def __extract_from_anchors(self, html_doc):
         link_set = set()
@@ -16,15 +86,30 @@ class LinkExtractor:
             if 'href' in anc.attrs:
                 link_set.add(anc.attrs['href'])
         return link_set
-                
+
+    def __extract_from_other_tags(self, html_doc):
+        link_set = set()
+        for tag in html_doc.find_all(['link', 'meta'] + list(LINK_TAG_ATTRS.keys())):
+            link = get_tag_link(tag.name, tag.attrs)
+            if link is not None:
+                link_set.add(link)
+        return link_set
+
+    def __extract_from_tokens(self, html_text):
+        return tokenize_links(to_unicode(html_text))
+
     def extract(self, html_text, base_url, filter_domains=[]):
         """Extract all the possible links from the given html text
         and return a set of unique links. If filter_domain is given, only those URLs 
         which has any of the filter_domains string in their domain will be returned"""
-        html_doc = BeautifulSoup(html_text, "html.parser")
-        # Extract links from anchors
-        links = self.__extract_from_anchors(html_doc)
-        # TODO Extract links from other tags here
+        if self.fast_mode:
+            links = self.__extract_from_tokens(html_text)
+        else:
+            html_doc = make_soup(html_text, base_url, self.parser_backend)
+            # Extract links from anchors
+            links = self.__extract_from_anchors(html_doc)
+            # Extract links from canonical, og:url, amphtml, iframe etc
+            links.update(self.__extract_from_other_tags(html_doc))
         
         # Convert if required
         links = self.__to_absolute_links(links, base_url)
@@ -34,8 +119,12 @@ class LinkExtractor:
 
         return links
 
-    def save_links(self, links):
-        """Saves the links to the pre-configured storage"""
+    def save_links(self, links, page_urls=None):
+        """Saves the links to the pre-configured storage.
+        The page_urls, whose HTML is available, are marked downloaded in the same bulk write,
+        whether their docs exist or not"""
+        if page_urls is None:
+            page_urls = []
 
         if not self.storage:
             logger.error('No Storage object defined!')
@@ -43,9 +132,13 @@ class LinkExtractor:
         
         # Prepare a doc to be saved
         documents = [make_url_doc(ln, downloaded=False) for ln in links]
-        # Save
-        self.storage.save_documents(documents)
-        logger.info('Stored {} links successfully'.format(len(links)))
+        if len(page_urls) == 0:
+            # Save
+            self.storage.save_documents(documents)
+        else:
+            page_documents = [make_url_doc(page_url, downloaded=True) for page_url in page_urls]
+            self.storage.save_and_upsert(documents, page_documents)
+        logger.info('Stored {0} links and {1} pages successfully'.format(len(links), len(page_urls)))
 
     def __filter_links(self, links, filter_domains):
         """Return only those URLs haivng matching filter_domains strings"""
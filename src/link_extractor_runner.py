@@ -1,5 +1,9 @@
-import glob
 import os
+import sys
+import time
+import hashlib
+import multiprocessing
+from collections import deque, namedtuple
 from urllib.parse import urljoin
 import logging
 logger = logging.getLogger(__name__)
@@ -8,7 +12,15 @@ from link_extractor import LinkExtractor
 from es_doc_maker import make_url_doc
 from storage import StorageI
 import conf_parser
-from es_storage import ESStorage
+from storage_factory import make_storage
+from dump_walker import walk_html_files, DEFAULT_HTML_EXTENSIONS
+from checkpoint import Checkpoint
+from file_manifest import FileManifest
+from seen_url_cache import SeenURLCache
+from prefetcher import Prefetcher
+from dump_archive import DumpArchive
+from metrics import METRICS, metrics_path, ProgressReporter
+from profiler import PageProfiler, make_profiler, profile_flag, profile_page
 
 def test():
     # Load a sample HTML file
@@ -22,23 +34,267 @@ def test():
     for lnk in links:
         logger.info(lnk)
 
-def get_all_html_file_paths(website_base_dir):
-    html_files = list(glob.glob(website_base_dir+'/**/*.html',recursive = True))
-    cms_files = list(glob.glob(website_base_dir+'/**/*.cms',recursive = True))
-    return html_files + cms_files
 
+def save_html_directory(url_storage: StorageI, html_url, html_file_path):
+    """A directory with '.html' extension is simply saved as a undownloaded-HTML url"""
+    doc = make_url_doc(html_url, downloaded=False)
+    url_storage.save_doc(doc)
+    conf_parser.error_logger.error("Directory with '.html' extension found: {}".format(html_file_path))
+
+def save_pages(extractor: LinkExtractor, seen_urls: SeenURLCache, links, page_urls):
+    """Save the links and mark the page_urls (whose HTML is available) downloaded, in one bulk write.
+    If seen_urls is given, only the links not seen before in this run are saved,
+    the repeats would just be rejected by the storage"""
+    if seen_urls is not None:
+        links = seen_urls.filter_unseen(links)
+        # The page urls are saved already, no need to save them again as links
+        for page_url in page_urls:
+            seen_urls.add(page_url)
+    if len(links) > 0 or len(page_urls) > 0:
+        extractor.save_links(links, page_urls)
+    forget_failed_urls(extractor.storage, seen_urls)
+
+def forget_failed_urls(url_storage: StorageI, seen_urls: SeenURLCache):
+    """The urls whose write has failed (found out at the flush with async_storage) are not seen,
+    so that they are saved again when they show up next"""
+    failed_urls = url_storage.take_failed_ids()
+    if seen_urls is not None and len(failed_urls) > 0:
+        seen_urls.forget(failed_urls)
+
+def mark_seen(seen_urls: SeenURLCache, html_url):
+    """The url is saved already, no need to save it again as a link"""
+    if seen_urls is not None:
+        seen_urls.add(html_url)
+
+# An HTML file to be parsed, with what the manifest knows about its previous version (None if new)
+PageFile = namedtuple('PageFile', ['path', 'url', 'relative_path', 'size', 'mtime_ns', 'known_hash', 'known_link_count'])
+
+def make_page_file(html_file_path, html_url, relative_path, manifest: FileManifest, full_rescan, file_stat=None):
+    """PageFile of the HTML file. None if the manifest has the same size and mtime for it, i.e. it is unchanged.
+    file_stat is (size, mtime_ns) of the file, taken from the disk if None"""
+    if file_stat is None:
+        stat = os.stat(html_file_path)
+        file_stat = (stat.st_size, stat.st_mtime_ns)
+    size, mtime_ns = file_stat
+    record = None
+    if manifest is not None and not full_rescan:
+        record = manifest.get(relative_path)
+    if record is not None and record.size == size and record.mtime_ns == mtime_ns:
+        return None
+    return PageFile(html_file_path, html_url, relative_path, size, mtime_ns, \
+        record.content_hash if record is not None else None, record.link_count if record is not None else None)
+
+def extract_page_links(extractor: LinkExtractor, page_file: PageFile, html_text, base_url, filter_domains):
+    """Extract the links of the HTML file. Returns (links, content_hash).
+    links is None if the content is the same as the one in the manifest(only the mtime changed)"""
+    content_hash = hashlib.blake2b(html_text, digest_size=16).hexdigest()
+    if content_hash == page_file.known_hash:
+        return None, content_hash
+    return extractor.extract(html_text, base_url, filter_domains), content_hash
+
+def record_page_file(manifest: FileManifest, page_file: PageFile, content_hash, link_count):
+    if manifest is None:
+        return
+    if link_count is None:
+        link_count = page_file.known_link_count
+    manifest.add(page_file.relative_path, page_file.size, page_file.mtime_ns, content_hash, link_count)
+
+def extract_file_batch(extractor: LinkExtractor, file_batch, base_url, filter_domains, reader, \
+    profiler: PageProfiler = None):
+    """Extracts the links from the given batch of PageFile, read by the reader: a Prefetcher reading the next
+    files ahead, or the DumpArchive of the website. The extraction of every page is profiled by the profiler, if given.
+    Returns the set of unique links of the whole batch and (content_hash, link_count) of every file,
+    where link_count is None if the content of the file is unchanged and both are None if it could not be read"""
+    batch_links = set()
+    file_results = []
+    for page_file, html_text in reader.read_ahead((page_file, page_file.path) for page_file in file_batch):
+        if html_text is None:
+            conf_parser.error_logger.error("Could not read the html file {}".format(page_file.path))
+            file_results.append((None, None))
+            continue
+        with profile_page(profiler):
+            start = time.perf_counter()
+            links, content_hash = extract_page_links(extractor, page_file, html_text, base_url, filter_domains)
+            elapsed = time.perf_counter() - start
+        METRICS.observe('link_extract', elapsed)
+        METRICS.observe_url(page_file.url, elapsed)
+        if links is None:
+            file_results.append((content_hash, None))
+            continue
+        batch_links.update(links)
+        file_results.append((content_hash, len(links)))
+    return batch_links, file_results
+
+def save_file_batch(extractor: LinkExtractor, seen_urls: SeenURLCache, manifest: FileManifest, progress, \
+    file_batch, batch_result, unchanged_urls):
+    """Save the links of the batch along with its page urls, then record the files in the manifest.
+    The pages unchanged since the previous runs(unchanged_urls and the files with the same content) are not parsed,
+    but they are still marked downloaded, in case their docs were lost from the url index"""
+    batch_links, file_results = batch_result
+    page_urls = unchanged_urls + [page_file.url for page_file, (content_hash, _) in zip(file_batch, file_results) \
+        if content_hash is not None]
+    save_pages(extractor, seen_urls, batch_links, page_urls)
+    progress['pages'] += sum(1 for _, link_count in file_results if link_count is not None)
+    for page_file, (content_hash, link_count) in zip(file_batch, file_results):
+        if content_hash is None:
+            # Unreadable, to be tried again on the next run
+            continue
+        if link_count is None:
+            progress['unchanged'] += 1
+        record_page_file(manifest, page_file, content_hash, link_count)
+
+# State of a link extraction worker process, set once by _init_link_worker
+_worker_state = {}
+
+def _init_link_worker(base_url, filter_domains, fast_mode, prefetch_threads, prefetch_depth, \
+    archive_path, website_base_dir, slowest_urls):
+    # A forked worker starts with a copy of the METRICS of the main process, which are counted there already
+    METRICS.reset()
+    METRICS.slowest_n = slowest_urls
+    _worker_state['extractor'] = LinkExtractor(fast_mode=fast_mode)
+    if archive_path is not None:
+        _worker_state['reader'] = DumpArchive(archive_path, website_base_dir)
+    else:
+        _worker_state['reader'] = Prefetcher(prefetch_threads, prefetch_depth)
+    _worker_state['base_url'] = base_url
+    _worker_state['filter_domains'] = filter_domains
+
+def _extract_file_batch(file_batch):
+    """Runs in the worker process. Returns the batch result along with the metrics recorded for it"""
+    batch_result = extract_file_batch(_worker_state['extractor'], file_batch, \
+        _worker_state['base_url'], _worker_state['filter_domains'], _worker_state['reader'])
+    return batch_result, METRICS.take_snapshot()
+
+def load_run_progress(checkpoint: Checkpoint, resume):
+    """Progress of the run: num of walker entries saved so far and the counters.
+    Loaded from the checkpoint if resuming, from scratch otherwise"""
+    progress = {'position': 0, 'last_path': None, 'checkpointed_position': 0, 'pages': 0, 'unchanged': 0, 'directories': 0}
+    if checkpoint is None or not resume:
+        return progress
+    saved_progress = checkpoint.load()
+    if saved_progress is None:
+        logger.warning("No checkpoint to resume from, starting from scratch")
+        return progress
+    progress.update(saved_progress)
+    logger.warning("Resuming after {0} walked entries, pages:{1} directories:{2}"\
+        .format(progress['position'], progress['pages'], progress['directories']))
+    return progress
+
+def walk_from(website_base_dir, html_extensions, progress, archive: DumpArchive = None):
+    """walk_html_files (or the same walk of the packed dump, if archive is given), skipping the entries already saved
+    as per the progress. Yields (position, path, is_dir, file_stat) where position is the 1-based num of the entry
+    in the walk and file_stat is (size, mtime_ns) from the archive, None otherwise"""
+    if archive is not None:
+        entries = archive.walk(html_extensions)
+    else:
+        entries = ((path, is_dir, None) for path, is_dir in walk_html_files(website_base_dir, html_extensions))
+    skip = progress['position']
+    found_path = None
+    for position, (path, is_dir, file_stat) in enumerate(entries, 1):
+        if position < skip:
+            continue
+        if position == skip:
+            found_path = path
+            if path != progress['last_path']:
+                break
+            continue
+        yield position, path, is_dir, file_stat
+    if skip > 0 and found_path != progress['last_path']:
+        # The entries skipped are not the ones saved, the positions can not be trusted
+        raise RuntimeError("The website dump has changed after the checkpoint! Expected {0} at {1}, found {2}. "\
+            "Run again without --resume, the file manifest(if configured) skips the files already processed"\
+            .format(progress['last_path'], skip, found_path))
+
+def commit_progress(url_storage: StorageI, manifest: FileManifest, checkpoint: Checkpoint, progress, \
+    position, path, checkpoint_every, reporter: ProgressReporter, seen_urls: SeenURLCache):
+    """Record that the walker entries up to position are sent to the storage, and report it.
+    Every checkpoint_every entries, wait for the writes to be saved, then commit the manifest and save a checkpoint"""
+    progress['position'] = position
+    progress['last_path'] = path
+    reporter.update(position)
+    if position - progress['checkpointed_position'] < checkpoint_every:
+        return
+    progress['checkpointed_position'] = position
+    url_storage.flush()
+    forget_failed_urls(url_storage, seen_urls)
+    if manifest is not None:
+        manifest.commit()
+    if checkpoint is not None:
+        checkpoint.save(progress)
 
 def run_full(run_name, base_url, website_base_dir, extractor: LinkExtractor, \
-    url_storage: StorageI, filter_domains=[]):
+    url_storage: StorageI, filter_domains=[], num_workers=1, worker_batch_size=200, \
+    html_extensions=DEFAULT_HTML_EXTENSIONS, checkpoint: Checkpoint = None, resume=False, checkpoint_every=1000, \
+    manifest: FileManifest = None, full_rescan=False, seen_urls: SeenURLCache = None, prefetcher: Prefetcher = None, \
+    archive: DumpArchive = None, reporter: ProgressReporter = None, profiler: PageProfiler = None):
     """ Fetch all the HTML pages under website_base_dir recursively,
     Extract and clean all the URLs from those HTML pages,
     Filter the URLs with matching domain strings in filter_domains,
-    Save those links to a storage """
+    Save those links to a storage.
+    If num_workers > 1, the HTML pages are parsed in batches on a pool of processes
+    and this process alone writes the results to the storage.
+    If checkpoint is given, the progress is saved to it every checkpoint_every walked entries
+    and resume=True continues after the entries saved by the interrupted run.
+    If manifest is given, only the new or changed HTML files are parsed, unless full_rescan=True.
+    If seen_urls is given, the links already saved in this run are not sent to the storage again.
+    The HTML files are read ahead of the parsing by the prefetcher(of every process), by default 4 threads 32 files ahead.
+    If archive is given, the pages are walked and read from the packed dump instead.
+    The progress over the walked entries and the METRICS are reported by the reporter, a default one if None.
+    If profiler is given, the pages are profiled by it in this process, without the worker processes """
 
     logger.info("####{}####".format(run_name))
+    progress = load_run_progress(checkpoint, resume)
+
+    if full_rescan:
+        logger.warning("Full rescan, parsing all the HTML files")
+    if prefetcher is None:
+        prefetcher = Prefetcher()
+    if reporter is None:
+        reporter = ProgressReporter(run_name)
+    # Only the packed dump knows the num of entries to be walked upfront
+    if reporter.total is None and archive is not None:
+        reporter.total = archive.count_entries(html_extensions)
+    if profiler is not None:
+        if num_workers > 1:
+            logger.warning("Profiling in this process, instead of {} worker processes".format(num_workers))
+            num_workers = 1
+        profiler.start()
+    if num_workers > 1:
+        run_full_parallel(base_url, website_base_dir, extractor, url_storage, \
+            filter_domains, num_workers, worker_batch_size, html_extensions, progress, checkpoint, checkpoint_every, \
+            manifest, full_rescan, seen_urls, prefetcher, archive, reporter)
+    else:
+        run_full_serial(base_url, website_base_dir, extractor, url_storage, \
+            filter_domains, worker_batch_size, html_extensions, progress, checkpoint, checkpoint_every, \
+            manifest, full_rescan, seen_urls, prefetcher, archive, reporter, profiler)
+    prefetcher.close()
+    if archive is not None:
+        archive.close()
 
-    all_html_paths = get_all_html_file_paths(website_base_dir)
-    for html_file_path in all_html_paths:
+    # The manifest must not run ahead of the saved links
+    url_storage.flush()
+    forget_failed_urls(url_storage, seen_urls)
+    if manifest is not None:
+        manifest.close()
+    if seen_urls is not None:
+        seen_urls.log_stats()
+    if checkpoint is not None:
+        checkpoint.clear()
+    logger.info("Completed {0}. Pages:{1} Unchanged pages:{2} Directories:{3}"\
+        .format(run_name, progress['pages'], progress['unchanged'], progress['directories']))
+    reporter.finish()
+    if profiler is not None:
+        profiler.finish()
+
+def run_full_serial(base_url, website_base_dir, extractor: LinkExtractor, url_storage: StorageI, \
+    filter_domains, worker_batch_size, html_extensions, progress, checkpoint, checkpoint_every, \
+    manifest, full_rescan, seen_urls, prefetcher, archive, reporter, profiler):
+    """Parse the HTML pages in this process, saving the links and the page urls of every
+    worker_batch_size pages in one go. The progress is committed once a batch is saved"""
+    reader = archive if archive is not None else prefetcher
+    file_batch = []
+    unchanged_urls = []
+    for position, html_file_path, is_dir, file_stat in walk_from(website_base_dir, html_extensions, progress, archive):
         logger.debug('-'*20)
         logger.debug(html_file_path)
 
@@ -47,29 +303,94 @@ def run_full(run_name, base_url, website_base_dir, extractor: LinkExtractor, \
         html_url = urljoin(base_url, relative_path)
 
         # if html_file_path is a directory, then simply save it as a undownloaded-HTML url
-        if os.path.isdir(html_file_path):
-            # Prepare and save the URL doc
-            doc = make_url_doc(html_url, downloaded=False)
-            url_storage.save_doc(doc)
-            conf_parser.error_logger.error("Directory with '.html' extension found: {}".format(html_file_path))
+        if is_dir:
+            save_html_directory(url_storage, html_url, html_file_path)
+            mark_seen(seen_urls, html_url)
+            progress['directories'] += 1
+            continue
+
+        page_file = make_page_file(html_file_path, html_url, relative_path, manifest, full_rescan, file_stat)
+        if page_file is None:
+            unchanged_urls.append(html_url)
+            progress['unchanged'] += 1
         else:
-            # Extract links
-            html_file = open(html_file_path, 'rb')
-            html_text = html_file.read()
-            links = extractor.extract(html_text, base_url, filter_domains)
-            extractor.save_links(links)
-
-            # Prepare and save the URL doc(Do this at the end, so that we over-write downloaded=True)
-            doc = make_url_doc(html_url, downloaded=True)
-            resp_doc = url_storage.save_doc(doc)
-            if resp_doc is None:
-                # That means doc with id already exists, 
-                # So overwrite it if original doc's downloaded is False, because
-                # we have found the HTML for it now
-                url_storage.save_doc(doc, update_if_exists=True)
-
-    
-    logger.info("Completed {}".format(run_name))
+            file_batch.append(page_file)
+        if len(file_batch) + len(unchanged_urls) >= worker_batch_size:
+            batch_result = extract_file_batch(extractor, file_batch, base_url, filter_domains, reader, profiler)
+            save_file_batch(extractor, seen_urls, manifest, progress, file_batch, batch_result, unchanged_urls)
+            commit_progress(url_storage, manifest, checkpoint, progress, position, html_file_path, checkpoint_every, \
+                reporter, seen_urls)
+            file_batch = []
+            unchanged_urls = []
+
+    if len(file_batch) + len(unchanged_urls) > 0:
+        batch_result = extract_file_batch(extractor, file_batch, base_url, filter_domains, reader, profiler)
+        save_file_batch(extractor, seen_urls, manifest, progress, file_batch, batch_result, unchanged_urls)
+        commit_progress(url_storage, manifest, checkpoint, progress, position, html_file_path, checkpoint_every, \
+            reporter, seen_urls)
+
+def run_full_parallel(base_url, website_base_dir, extractor: LinkExtractor, \
+    url_storage: StorageI, filter_domains, num_workers, worker_batch_size, html_extensions, \
+    progress, checkpoint, checkpoint_every, manifest, full_rescan, seen_urls, prefetcher, archive, reporter):
+    """Parse the HTML pages in batches on num_workers processes, while this process alone writes
+    the links and the page urls of each batch to the storage in one go.
+    The progress is committed up to the last walked file of a batch once the batch is saved"""
+    def submit_batch(file_batch, unchanged_urls, last_position, last_path):
+        # A batch of the unchanged pages alone has nothing to parse
+        async_result = pool.apply_async(_extract_file_batch, (file_batch,)) if len(file_batch) > 0 else None
+        in_flight.append((async_result, file_batch, unchanged_urls, last_position, last_path))
+
+    def save_oldest_batch():
+        async_result, file_batch, unchanged_urls, last_position, last_path = in_flight.popleft()
+        batch_result = (set(), [])
+        if async_result is not None:
+            batch_result, metrics_snapshot = async_result.get()
+            METRICS.merge(metrics_snapshot)
+        save_file_batch(extractor, seen_urls, manifest, progress, file_batch, batch_result, unchanged_urls)
+        commit_progress(url_storage, manifest, checkpoint, progress, last_position, last_path, checkpoint_every, \
+            reporter, seen_urls)
+
+    # The background writes of the storage run on a thread, which must not be forked along with its locks
+    context = multiprocessing.get_context('forkserver' if url_storage.writes_in_background else None)
+    pool = context.Pool(num_workers, initializer=_init_link_worker, \
+        initargs=(base_url, filter_domains, extractor.fast_mode, prefetcher.num_threads, prefetcher.depth, \
+            archive.archive_path if archive is not None else None, website_base_dir, METRICS.slowest_n))
+    in_flight = deque()
+    try:
+        file_batch = []
+        unchanged_urls = []
+        for position, html_file_path, is_dir, file_stat in walk_from(website_base_dir, html_extensions, progress, archive):
+            relative_path = html_file_path.replace(website_base_dir, '')
+            html_url = urljoin(base_url, relative_path)
+
+            if is_dir:
+                save_html_directory(url_storage, html_url, html_file_path)
+                mark_seen(seen_urls, html_url)
+                progress['directories'] += 1
+                continue
+
+            page_file = make_page_file(html_file_path, html_url, relative_path, manifest, full_rescan, file_stat)
+            if page_file is None:
+                unchanged_urls.append(html_url)
+                progress['unchanged'] += 1
+            else:
+                file_batch.append(page_file)
+            if len(file_batch) + len(unchanged_urls) >= worker_batch_size:
+                submit_batch(file_batch, unchanged_urls, position, html_file_path)
+                file_batch = []
+                unchanged_urls = []
+            # Keep the workers busy, but do not run ahead of the writer
+            if len(in_flight) >= 2 * num_workers:
+                save_oldest_batch()
+
+        if len(file_batch) + len(unchanged_urls) > 0:
+            submit_batch(file_batch, unchanged_urls, position, html_file_path)
+        while len(in_flight) > 0:
+            save_oldest_batch()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
 
 if __name__ == '__main__':
     ##TEST case 
@@ -84,9 +405,43 @@ if __name__ == '__main__':
     base_url = run_config['base_url']
     website_base_dir = run_config['website_base_dir']
     filter_domains = run_config['filter_domains']
+    num_workers = run_config.get('link_workers', 1)
+    worker_batch_size = run_config.get('link_worker_batch_size', 200)
+    html_extensions = run_config.get('html_extensions', DEFAULT_HTML_EXTENSIONS)
+    # Continue an interrupted run from its checkpoint with --resume
+    resume = '--resume' in sys.argv[1:]
+    # Parse all the HTML files, even the ones unchanged since the previous runs, with --full-rescan
+    full_rescan = '--full-rescan' in sys.argv[1:]
+    # Profile the first pages with --profile or --profile=sampling, see profiler
+    profiler = make_profiler(run_config, run_name + '_links', profile_flag(sys.argv[1:]))
+    manifest = None
+    if run_config.get('file_manifest_path') is not None:
+        # Scoped to the url index, which has the links of the files recorded
+        manifest = FileManifest(run_config['file_manifest_path'], conf_parser.SYS_CONFIG['url_index']['index'])
+    # Packed website dump, read instead of the files under website_base_dir
+    archive = None
+    if run_config.get('dump_archive') is not None:
+        archive = DumpArchive(run_config['dump_archive'], website_base_dir)
+    seen_urls = None
+    if run_config.get('seen_url_cache_size', 0) > 0:
+        seen_urls = SeenURLCache(run_config['seen_url_cache_size'], \
+            run_config.get('seen_url_bloom_capacity', 10000000), run_config.get('seen_url_bloom_error_rate', 0.001))
+    checkpoint = None
+    if run_config.get('checkpoint_dir') is not None:
+        checkpoint = Checkpoint(run_config['checkpoint_dir'], run_name + '_links')
 
-    # The ElasticSearch storage indices
-    url_storage = ESStorage(conf_parser.SYS_CONFIG['url_index'])
-    extractor = LinkExtractor(url_storage)
+    # The storage of the urls. With async_storage, the links are written in the background while parsing the next pages
+    url_storage = make_storage(conf_parser.SYS_CONFIG['url_index'], async_writes=run_config.get('async_storage', False))
+    METRICS.slowest_n = run_config.get('slowest_urls', 20)
+    reporter = ProgressReporter(run_name, every_seconds=run_config.get('progress_every_seconds', 30), \
+        metrics_path=metrics_path(run_config, run_name + '_links'))
+    fast_mode = run_config.get('link_extract_mode', 'full') == 'fast'
+    extractor = LinkExtractor(url_storage, fast_mode=fast_mode)
     # Start the full run
-    run_full(run_name, base_url, website_base_dir, extractor, url_storage, filter_domains)
\ No newline at end of file
+    run_full(run_name, base_url, website_base_dir, extractor, url_storage, filter_domains, \
+        num_workers=num_workers, worker_batch_size=worker_batch_size, html_extensions=html_extensions, \
+        checkpoint=checkpoint, resume=resume, checkpoint_every=run_config.get('checkpoint_every', 1000), \
+        manifest=manifest, full_rescan=full_rescan, seen_urls=seen_urls, \
+        prefetcher=Prefetcher(run_config.get('prefetch_threads', 4), run_config.get('prefetch_depth', 32)), \
+        archive=archive, reporter=reporter, profiler=profiler)
+    url_storage.close()
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""Counters and latency histograms of the pipeline stages, per process.
+The stages record into the module level METRICS. The worker processes send their snapshot along with
+every batch result, to be merged into the METRICS of the main process.
+
+The metric names are '/' separated, Ex: 'parse/kannadaprabha', 'branch/prajavani/title/meta[property=og:title]'."""
+import os
+import time
+import json
+import heapq
+import bisect
+import threading
+from contextlib import contextmanager
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets in seconds, 0.1ms to ~13s doubling every bucket, and one more for the rest
+BUCKET_BOUNDS = [0.0001 * 2 ** i for i in range(18)]
+
+def metric_name(*parts):
+    return '/'.join(str(part) for part in parts)
+
+def metrics_path(run_config, run_name):
+    """Path of the metrics file of the run, under metrics_dir of the run_config. None if it is not set"""
+    if run_config.get('metrics_dir') is None:
+        return None
+    return os.path.join(run_config['metrics_dir'], run_name + '_metrics.json')
+
+class Histogram():
+    """Latency histogram with fixed buckets, mergeable across the processes"""
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, snapshot):
+        for bucket, count in enumerate(snapshot['buckets']):
+            self.buckets[bucket] += count
+        self.count += snapshot['count']
+        self.total += snapshot['total']
+        self.max = max(self.max, snapshot['max'])
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket having the given fraction of the observations, at most the max"""
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count > 0:
+                return min(BUCKET_BOUNDS[bucket], self.max) if bucket < len(BUCKET_BOUNDS) else self.max
+        return 0.0
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'count': self.count, 'total': self.total, 'max': self.max}
+
+    def summary(self):
+        mean = self.total / self.count if self.count > 0 else 0.0
+        return {'count': self.count, 'total_sec': round(self.total, 3), 'mean_ms': round(mean * 1000, 3), \
+            'p50_ms': round(self.percentile(0.5) * 1000, 3), 'p90_ms': round(self.percentile(0.9) * 1000, 3), \
+            'p99_ms': round(self.percentile(0.99) * 1000, 3), 'max_ms': round(self.max * 1000, 3)}
+
+class Metrics():
+    """Counters, latency histograms and the slowest_n slowest urls. Safe to record from multiple threads"""
+    def __init__(self, slowest_n=20):
+        self.slowest_n = slowest_n
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            # Min-heap of (seconds, url), the slowest urls
+            self.slowest = []
+
+    def count(self, name, num=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + num
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe_url(self, url, seconds):
+        """Keep the url if it is one of the slowest"""
+        if self.slowest_n <= 0:
+            return
+        with self.lock:
+            if len(self.slowest) < self.slowest_n:
+                heapq.heappush(self.slowest, (seconds, url))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, url))
+
+    def take_snapshot(self):
+        """Snapshot of the metrics recorded since the previous one, for merging into another process"""
+        with self.lock:
+            snapshot = {'counters': self.counters, \
+                'histograms': {name: hist.to_dict() for name, hist in self.histograms.items()}, \
+                'slowest': self.slowest}
+            self.counters, self.histograms, self.slowest = {}, {}, []
+        return snapshot
+
+    def merge(self, snapshot):
+        for name, num in snapshot['counters'].items():
+            self.count(name, num)
+        with self.lock:
+            for name, hist_dict in snapshot['histograms'].items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram()
+                self.histograms[name].merge(hist_dict)
+        for seconds, url in snapshot['slowest']:
+            self.observe_url(url, seconds)
+
+    def to_dict(self):
+        with self.lock:
+            return {'counters': dict(sorted(self.counters.items())), \
+                'histograms': {name: hist.summary() for name, hist in sorted(self.histograms.items())}, \
+                'slowest_urls': [{'url': url, 'seconds': round(seconds, 4)} for seconds, url in sorted(self.slowest, reverse=True)]}
+
+    def write(self, metrics_path, extra=None):
+        """Write the metrics as JSON, replacing the previous ones"""
+        metrics = self.to_dict()
+        if extra is not None:
+            metrics.update(extra)
+        with open(metrics_path + '.tmp', 'w') as metrics_file:
+            json.dump(metrics, metrics_file, indent=1, ensure_ascii=False)
+        os.replace(metrics_path + '.tmp', metrics_path)
+
+    def log_report(self):
+        """Log the latency of every stage, the counters and the slowest urls"""
+        metrics = self.to_dict()
+        for name, summary in metrics['histograms'].items():
+            logger.warning('{0:60s} n={1} mean={2}ms p50={3}ms p90={4}ms p99={5}ms max={6}ms total={7}s'.format(name, \
+                summary['count'], summary['mean_ms'], summary['p50_ms'], summary['p90_ms'], summary['p99_ms'], \
+                summary['max_ms'], summary['total_sec']))
+        for name, num in metrics['counters'].items():
+            logger.warning('{0:60s} {1}'.format(name, num))
+        for rank, slow_url in enumerate(metrics['slowest_urls'], 1):
+            logger.warning('Slowest {0}: {1}s {2}'.format(rank, slow_url['seconds'], slow_url['url']))
+
+# The metrics of this process
+METRICS = Metrics()
+
+def timed_scroll(doc_itr, page_size, name):
+    """Pass the docs of a scroll through, recording the time spent fetching every page of page_size docs"""
+    waited = 0.0
+    num_docs = 0
+    doc_itr = iter(doc_itr)
+    while True:
+        start = time.perf_counter()
+        try:
+            doc = next(doc_itr)
+        except StopIteration:
+            break
+        waited += time.perf_counter() - start
+        num_docs += 1
+        if num_docs == page_size:
+            METRICS.observe(name, waited)
+            waited, num_docs = 0.0, 0
+        yield doc
+    if num_docs > 0:
+        METRICS.observe(name, waited)
+
+class ProgressReporter():
+    """Logs a progress line with the throughput and the ETA (if the total is known) at most every every_seconds,
+    and writes the METRICS to metrics_path (if given) along with the progress"""
+    def __init__(self, name, total=None, every_seconds=30, metrics_path=None):
+        self.name = name
+        self.total = total
+        self.every_seconds = every_seconds
+        self.metrics_path = metrics_path
+        if metrics_path is not None and os.path.dirname(metrics_path) != '':
+            os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+        self.start_time = time.time()
+        self.last_report = self.start_time
+        self.done = 0
+
+    def progress(self):
+        elapsed = time.time() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        progress = {'name': self.name, 'done': self.done, 'total': self.total, 'elapsed_sec': round(elapsed, 1), \
+            'per_sec': round(rate, 2), 'eta_sec': None}
+        if self.total is not None and rate > 0:
+            progress['eta_sec'] = round(max(self.total - self.done, 0) / rate, 1)
+        return progress
+
+    def update(self, done, force=False):
+        """Report the num of items done so far, if it is time to"""
+        self.done = done
+        now = time.time()
+        if not force and now - self.last_report < self.every_seconds:
+            return
+        self.last_report = now
+        progress = self.progress()
+        eta = ''
+        if progress['eta_sec'] is not None:
+            eta = ' ETA {}'.format(time.strftime('%H:%M:%S', time.gmtime(progress['eta_sec'])))
+        total = '/{}'.format(self.total) if self.total is not None else ''
+        logger.warning('{0}: {1}{2} done, {3}/sec{4}'.format(self.name, self.done, total, progress['per_sec'], eta))
+        if self.metrics_path is not None:
+            METRICS.write(self.metrics_path, {'progress': progress})
+
+    def finish(self, done=None):
+        """Log the final progress and the report of the METRICS"""
+        self.update(self.done if done is None else done, force=True)
+        METRICS.log_report()
@@ -0,0 +1,78 @@
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from storage import StorageI
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Integer fields of the article docs, the other fields are written as strings
+INT_FIELDS = ('text_len', 'extracted_at', 'parser_version')
+
+class ParquetStorage(StorageI):
+    """Writes the docs to Parquet files, one per source, partitioned as <base_dir>/source=<source>/<file_name>.parquet
+    (readable as a single dataset, Ex: pandas.read_parquet(base_dir, columns=['text_len'])).
+    Only the given fields are written. The docs of a source are buffered until row_group_size docs or
+    row_group_max_bytes bytes of text, and then written as a row group, so that the memory use stays bounded.
+    The source of a doc is its 'source' field, default_source if it has none.
+    An existing file of the same name is overwritten, a dump with another file_name is added next to it."""
+    def __init__(self, base_dir, file_name, default_source, fields, row_group_size=10000, \
+        row_group_max_bytes=64 * 1024 * 1024, compression='zstd'):
+        self.base_dir = base_dir
+        self.file_name = file_name
+        self.default_source = default_source
+        self.fields = [field for field in fields if field != 'source']
+        self.schema = pa.schema([(field, pa.int64() if field in INT_FIELDS else pa.string()) for field in self.fields])
+        self.row_group_size = row_group_size
+        self.row_group_max_bytes = row_group_max_bytes
+        self.compression = compression
+        # source -> ParquetWriter, buffered columns and their approx size
+        self.writers = {}
+        self.buffers = {}
+        self.buffer_bytes = {}
+        self.doc_count = 0
+        logger.warning('Going to write the results to {0} as Parquet. Fields:{1}'.format(base_dir, self.fields))
+
+    def __file_path(self, source):
+        return os.path.join(self.base_dir, 'source={}'.format(source), self.file_name + '.parquet')
+
+    def __write_row_group(self, source):
+        columns = self.buffers[source]
+        if len(columns[self.fields[0]]) == 0:
+            return
+        if source not in self.writers:
+            file_path = self.__file_path(source)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            self.writers[source] = pq.ParquetWriter(file_path, self.schema, compression=self.compression)
+        table = pa.Table.from_pydict(columns, schema=self.schema)
+        self.writers[source].write_table(table, row_group_size=self.row_group_size)
+        self.buffers[source] = {field: [] for field in self.fields}
+        self.buffer_bytes[source] = 0
+
+    def save_doc(self, doc, update_if_exists=False):
+        source = doc.get('source') or self.default_source
+        if source not in self.buffers:
+            self.buffers[source] = {field: [] for field in self.fields}
+            self.buffer_bytes[source] = 0
+        columns = self.buffers[source]
+        for field in self.fields:
+            value = doc.get(field)
+            if isinstance(value, str):
+                self.buffer_bytes[source] += len(value)
+            elif value is not None and field not in INT_FIELDS:
+                value = str(value)
+            columns[field].append(value)
+        self.doc_count += 1
+        if len(columns[self.fields[0]]) >= self.row_group_size or self.buffer_bytes[source] >= self.row_group_max_bytes:
+            self.__write_row_group(source)
+
+    def save_documents(self, documents, update_if_exists=False):
+        for doc in documents:
+            self.save_doc(doc)
+
+    def close(self):
+        for source in self.buffers:
+            self.__write_row_group(source)
+        for writer in self.writers.values():
+            writer.close()
+        logger.warning('Wrote {0} docs of {1} sources to {2}'.format(self.doc_count, len(self.writers), self.base_dir))
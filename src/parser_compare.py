@@ -0,0 +1,111 @@
+"""Shadow/compare mode for the HTML parser backends.
+Runs the article extraction with two BeautifulSoup tree builders on a random sample of
+the website dump and reports every page where the extracted fields differ.
+
+It can also compare the built-in site parser with the declarative extraction rules,
+by giving 'rules' as BACKEND B (the rules use the configured backend).
+
+Usage:
+python3 src/parser_compare.py [SAMPLE SIZE] [BACKEND A] [BACKEND B]
+"""
+import random
+import sys
+import json
+import traceback
+from urllib.parse import urljoin
+import logging
+logger = logging.getLogger(__name__)
+
+import conf_parser
+from html_parser import Website
+from article_extractor import ArticleParser
+from dump_walker import walk_html_files, DEFAULT_HTML_EXTENSIONS
+
+# Article fields compared between the backends
+COMPARED_FIELDS = ['title', 'description', 'keywords', 'publish_date', 'article_text']
+
+def sample_html_files(website_base_dir, html_extensions, sample_size, seed=None):
+    """Reservoir sample of sample_size HTML files from the website dump"""
+    rand = random.Random(seed)
+    sample = []
+    for seen, (html_file_path, is_dir) in enumerate(walk_html_files(website_base_dir, html_extensions)):
+        if is_dir:
+            continue
+        if len(sample) < sample_size:
+            sample.append(html_file_path)
+        else:
+            pos = rand.randint(0, seen)
+            if pos < sample_size:
+                sample[pos] = html_file_path
+    return sample
+
+def extract_with_parser(article_parser, html_text, url):
+    """Returns the article doc (None if not an article) or the traceback string if the extraction failed"""
+    try:
+        return article_parser.extract_article(html_text, url)
+    except:
+        return traceback.format_exc()
+
+def make_article_parser(website, backend, rules_path):
+    """'rules' means the declarative rules with the configured backend"""
+    if backend == 'rules':
+        return ArticleParser(website, rules_path=rules_path)
+    return ArticleParser(website, backend)
+
+def compare_backends(website, base_url, website_base_dir, html_files, backend_a, backend_b, \
+    report_file=None, rules_path=None):
+    """Extract the articles of html_files with both the backends and compare the fields.
+    Returns a dict with the num of differences per field"""
+    parser_a = make_article_parser(website, backend_a, rules_path)
+    parser_b = make_article_parser(website, backend_b, rules_path)
+    diff_counts = {field: 0 for field in COMPARED_FIELDS}
+    diff_counts['validity'] = 0
+    diff_pages = 0
+
+    for html_file_path in html_files:
+        relative_path = html_file_path.replace(website_base_dir, '')
+        url = urljoin(base_url, relative_path)
+        with open(html_file_path, 'rb') as html_file:
+            html_text = html_file.read()
+
+        doc_a = extract_with_parser(parser_a, html_text, url)
+        doc_b = extract_with_parser(parser_b, html_text, url)
+
+        diffs = {}
+        if not isinstance(doc_a, dict) or not isinstance(doc_b, dict):
+            # One of them is not an article or failed
+            if doc_a != doc_b:
+                diffs['validity'] = [doc_a, doc_b]
+        else:
+            for field in COMPARED_FIELDS:
+                if doc_a[field] != doc_b[field]:
+                    diffs[field] = [doc_a[field], doc_b[field]]
+
+        if len(diffs) > 0:
+            diff_pages += 1
+            for field in diffs:
+                diff_counts[field] += 1
+            logger.warning("Fields {0} differ for {1}".format(list(diffs.keys()), url))
+            if report_file is not None:
+                report_file.write(json.dumps({'url': url, backend_a: {f: d[0] for f, d in diffs.items()}, \
+                    backend_b: {f: d[1] for f, d in diffs.items()}}, ensure_ascii=False) + '\n')
+
+    logger.warning("Compared {0} vs {1} on {2} pages. {3} pages differ. Differences per field: {4}"\
+        .format(backend_a, backend_b, len(html_files), diff_pages, diff_counts))
+    return diff_counts
+
+if __name__ == '__main__':
+    run_config = conf_parser.SYS_CONFIG['run_config']
+    website_enum = Website(run_config['website_enum'])
+    website_base_dir = run_config['website_base_dir']
+    base_url = run_config['base_url']
+    html_extensions = run_config.get('html_extensions', DEFAULT_HTML_EXTENSIONS)
+
+    sample_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    backend_a = sys.argv[2] if len(sys.argv) > 2 else 'html.parser'
+    backend_b = sys.argv[3] if len(sys.argv) > 3 else conf_parser.HTML_PARSER_BACKEND
+
+    html_files = sample_html_files(website_base_dir, html_extensions, sample_size)
+    with open('logs/parser_compare_report.jl', 'w') as report_file:
+        compare_backends(website_enum, base_url, website_base_dir, html_files, backend_a, backend_b, \
+            report_file, run_config.get('extraction_rules'))
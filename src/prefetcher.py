@@ -0,0 +1,59 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
+from metrics import METRICS
+import logging
+logger = logging.getLogger(__name__)
+
+def read_file(file_path):
+    """Read the whole file. Returns None if it is not a readable file"""
+    start = time.perf_counter()
+    try:
+        with open(file_path, 'rb') as input_file:
+            content = input_file.read()
+        METRICS.observe('read/file', time.perf_counter() - start)
+        METRICS.count('read_bytes', len(content))
+        return content
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+    except OSError as os_error:
+        logger.error("Could not read {0}: {1}".format(file_path, os_error))
+        return None
+
+class Prefetcher():
+    """Reads the upcoming files on a pool of threads, at most depth files ahead of the consumer,
+    so that the consumer parses a page while the next ones are being read.
+    depth 0 reads every file only when it is consumed."""
+    def __init__(self, num_threads=4, depth=32):
+        self.num_threads = num_threads
+        self.depth = depth
+        self.executor = None
+        if depth > 0:
+            self.executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='prefetch')
+
+    def read_ahead(self, keyed_paths):
+        """For the (key, file_path) items, yield (key, file content) in the same order.
+        The content is None if the file could not be read"""
+        if self.executor is None:
+            for key, file_path in keyed_paths:
+                yield key, read_file(file_path)
+            return
+
+        window = deque()
+        try:
+            for key, file_path in keyed_paths:
+                window.append((key, self.executor.submit(read_file, file_path)))
+                if len(window) > self.depth:
+                    key, future = window.popleft()
+                    yield key, future.result()
+            while len(window) > 0:
+                key, future = window.popleft()
+                yield key, future.result()
+        finally:
+            # The consumer stopped early, the reads already queued are not needed
+            for key, future in window:
+                future.cancel()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,229 @@
+"""On-demand profiling of the runners over a part of the pages.
+The first profile_pages pages are profiled, or a random profile_sample_rate fraction of the pages up to
+profile_pages of them. The profiler is either cProfile (deterministic) or a stack sampler on SIGPROF,
+which costs much less per call and so keeps the timings of the small functions (Ex: the bs4 internals) realistic.
+
+The profile is written to profile_dir as <name>.prof (cProfile, readable with pstats/snakeviz) or <name>.folded
+(sampler, collapsed stacks for flamegraph.pl/speedscope), along with <name>_summary.txt: the time by module
+(the modules of this project, the bs4 internals by submodule, the other packages, the stdlib) and the top functions.
+Only the thread running the pages is profiled, not the prefetch or the bulk write threads."""
+import os
+import time
+import pstats
+import random
+import signal
+import cProfile
+import sysconfig
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+import logging
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cprofile', 'sampling')
+# Directory of the modules of this project
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+STDLIB_DIR = os.path.abspath(sysconfig.get_paths()['stdlib'])
+# Num of functions listed in the summary
+TOP_FUNCTIONS = 40
+
+def dotted_name(relative_path):
+    parts = os.path.splitext(relative_path)[0].split(os.sep)
+    return '.'.join(part for part in parts if part != '__init__')
+
+def module_name(file_path):
+    """(kind, module) of the file. kind is 'project', 'package', 'stdlib', 'builtins' (implemented in C) or 'other'"""
+    if file_path == '~' or file_path.startswith('<'):
+        return 'builtins', 'builtins'
+    file_path = os.path.abspath(file_path)
+    if file_path.startswith(SRC_DIR + os.sep):
+        return 'project', dotted_name(os.path.relpath(file_path, SRC_DIR))
+    for packages_dir in ('site-packages', 'dist-packages'):
+        marker = os.sep + packages_dir + os.sep
+        if marker in file_path:
+            return 'package', dotted_name(file_path.split(marker, 1)[1])
+    if file_path.startswith(STDLIB_DIR + os.sep):
+        return 'stdlib', dotted_name(os.path.relpath(file_path, STDLIB_DIR))
+    return 'other', file_path
+
+def module_group(file_path):
+    """Group of the functions of the file: the module for this project ('html_parser') and for bs4 ('bs4.element'),
+    the top level package for the other packages ('lxml') and for the stdlib ('stdlib.html')"""
+    kind, module = module_name(file_path)
+    if kind in ('project', 'builtins', 'other') or module.startswith('bs4.') or module == 'bs4':
+        return module
+    top_package = module.split('.')[0]
+    return 'stdlib.' + top_package if kind == 'stdlib' else top_package
+
+def function_label(file_path, line, func_name):
+    if file_path == '~':
+        return func_name
+    return '{0}:{1}({2})'.format(module_name(file_path)[1], line, func_name)
+
+class StackSampler():
+    """Records the stack of the main thread every interval seconds of CPU time, on SIGPROF (Unix only).
+    The kernel may deliver the signal less often than asked, so the samples share the CPU time measured while enabled"""
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self.previous_handler = None
+        self.cpu_seconds = 0.0
+        self.enabled_at = None
+
+    def __sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        self.stacks[tuple(reversed(stack))] += 1
+
+    def enable(self):
+        self.previous_handler = signal.signal(signal.SIGPROF, self.__sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.enabled_at = time.process_time()
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler)
+        self.cpu_seconds += time.process_time() - self.enabled_at
+
+    def dump(self, path):
+        """Write the stacks in the collapsed format, one 'func;func;func count' line per stack"""
+        with open(path, 'w') as folded_file:
+            for stack, count in self.stacks.most_common():
+                folded_file.write('{0} {1}\n'.format(';'.join(function_label(*entry) for entry in stack), count))
+
+    def function_times(self):
+        """{(file, line, func): (self seconds, cumulative seconds)} estimated from the samples"""
+        self_samples, cum_samples = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            self_samples[stack[-1]] += count
+            # A recursive function is counted once per stack
+            for entry in set(stack):
+                cum_samples[entry] += count
+        num_samples = sum(self.stacks.values())
+        sample_seconds = self.cpu_seconds / num_samples if num_samples > 0 else self.interval
+        return {entry: (self_samples[entry] * sample_seconds, cum_samples[entry] * sample_seconds) for entry in cum_samples}
+
+def cprofile_function_times(profile: cProfile.Profile):
+    """{(file, line, func): (self seconds, cumulative seconds)} of the cProfile"""
+    stats = pstats.Stats(profile).stats
+    return {entry: (self_time, cum_time) for entry, (_, _, self_time, cum_time, _) in stats.items()}
+
+def make_summary(function_times, title):
+    """Text summary of the function times: the self time by module group and the top functions"""
+    total = sum(self_time for self_time, _ in function_times.values())
+    by_group = Counter()
+    for (file_path, _, _), (self_time, _) in function_times.items():
+        by_group[module_group(file_path)] += self_time
+    lines = [title, '', '== Self time by module ==', '{0:40s} {1:>10s} {2:>7s}'.format('module', 'seconds', 'share')]
+    for group, self_time in by_group.most_common():
+        lines.append('{0:40s} {1:10.3f} {2:7.1%}'.format(group, self_time, self_time / total if total > 0 else 0))
+    for heading, key in [('self', 0), ('cumulative', 1)]:
+        lines.extend(['', '== Top functions by {} time =='.format(heading), \
+            '{0:>10s} {1:>10s}  {2}'.format('self', 'cumulative', 'function')])
+        top = sorted(function_times.items(), key=lambda item: item[1][key], reverse=True)[:TOP_FUNCTIONS]
+        for entry, (self_time, cum_time) in top:
+            lines.append('{0:10.3f} {1:10.3f}  {2}'.format(self_time, cum_time, function_label(*entry)))
+    return '\n'.join(lines) + '\n'
+
+class PageProfiler():
+    """Profiles the pages run inside page(). With sample_rate 0 the profiler runs from start() until num_pages
+    pages are done, so the scroll and the bulk writes in between are profiled too. Otherwise only the
+    sampled pages themselves are profiled. The profile is saved once num_pages pages are profiled, or by finish()"""
+    def __init__(self, name, output_dir='profiles/', mode='cprofile', num_pages=1000, sample_rate=0, \
+        interval=0.001, seed=0):
+        if mode not in PROFILE_MODES:
+            raise ValueError("Unknown profile mode {0}, expected one of {1}".format(mode, PROFILE_MODES))
+        self.name = name
+        self.output_dir = output_dir
+        self.mode = mode
+        self.num_pages = num_pages
+        self.sample_rate = sample_rate
+        self.rand = random.Random(seed)
+        self.profiler = cProfile.Profile() if mode == 'cprofile' else StackSampler(interval)
+        self.seen_pages = 0
+        self.profiled_pages = 0
+        self.profiled_seconds = 0.0
+        self.enabled_at = None
+        self.done = False
+
+    def __enable(self):
+        self.enabled_at = time.perf_counter()
+        self.profiler.enable()
+
+    def __disable(self):
+        self.profiler.disable()
+        self.profiled_seconds += time.perf_counter() - self.enabled_at
+        self.enabled_at = None
+
+    def start(self):
+        logger.warning("Profiling {0} pages of {1} with {2}{3}".format(self.num_pages, self.name, self.mode, \
+            ', sampled at {}'.format(self.sample_rate) if self.sample_rate > 0 else ''))
+        if self.sample_rate <= 0:
+            self.__enable()
+
+    @contextmanager
+    def page(self):
+        """Profile the page run inside, if it is one of the profiled pages"""
+        if self.done:
+            yield
+            return
+        self.seen_pages += 1
+        sampled = self.sample_rate > 0 and self.rand.random() < self.sample_rate
+        if sampled:
+            self.__enable()
+        try:
+            yield
+        finally:
+            if sampled:
+                self.__disable()
+        if sampled or self.sample_rate <= 0:
+            self.profiled_pages += 1
+            if self.profiled_pages >= self.num_pages:
+                self.finish()
+
+    def finish(self):
+        """Stop profiling and save the profile along with its summary"""
+        if self.done:
+            return
+        self.done = True
+        if self.enabled_at is not None:
+            self.__disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_path = os.path.join(self.output_dir, self.name)
+        if self.mode == 'cprofile':
+            self.profiler.dump_stats(base_path + '.prof')
+            function_times = cprofile_function_times(self.profiler)
+        else:
+            self.profiler.dump(base_path + '.folded')
+            function_times = self.profiler.function_times()
+        title = 'Profile of {0}: {1} of {2} pages with {3}, {4:.3f} seconds profiled'.format(self.name, \
+            self.profiled_pages, self.seen_pages, self.mode, self.profiled_seconds)
+        with open(base_path + '_summary.txt', 'w') as summary_file:
+            summary_file.write(make_summary(function_times, title))
+        logger.warning("{0}. Saved to {1}*".format(title, base_path))
+
+def profile_page(profiler: PageProfiler):
+    """profiler.page(), or nothing if not profiling"""
+    return profiler.page() if profiler is not None else nullcontext()
+
+def profile_flag(args):
+    """Profile mode given on the command line as --profile (cprofile) or --profile=<mode>. None if not given"""
+    for arg in args:
+        if arg == '--profile':
+            return 'cprofile'
+        if arg.startswith('--profile='):
+            return arg.split('=', 1)[1]
+    return None
+
+def make_profiler(run_config, name, mode=None):
+    """PageProfiler as per the profile_* keys of the run_config, if the mode (Ex: from profile_flag) or
+    the profile key of the run_config is set. None otherwise, for the normal runs"""
+    mode = mode if mode is not None else run_config.get('profile')
+    if mode is None:
+        return None
+    return PageProfiler(name, output_dir=run_config.get('profile_dir', 'profiles/'), mode=mode, \
+        num_pages=run_config.get('profile_pages', 1000), sample_rate=run_config.get('profile_sample_rate', 0), \
+        interval=run_config.get('profile_interval', 0.001), seed=run_config.get('profile_seed', 0))
@@ -0,0 +1,86 @@
+import math
+import hashlib
+import logging
+logger = logging.getLogger(__name__)
+
+class BloomFilter():
+    """Fixed size bloom filter of strings, sized for the given capacity and false positive rate"""
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def __bit_positions(self, key):
+        # Double hashing with the two halves of a single digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.__bit_positions(key))
+
+    def add(self, key):
+        for pos in self.__bit_positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+class SeenURLCache():
+    """URLs already sent to the storage in this run, to drop the repeated links before they reach it.
+    The first exact_limit urls are kept in a set, the later ones in a bloom filter.
+    A false positive of the bloom filter drops an unseen url, at the rate of bloom_error_rate.
+    The urls whose write failed are forgotten, so that they are sent again when they show up next."""
+    def __init__(self, exact_limit=1000000, bloom_capacity=10000000, bloom_error_rate=0.001):
+        self.exact_limit = exact_limit
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.exact_urls = set()
+        self.bloom = None
+        # Failed urls in the bloom filter, which can not remove them
+        self.forgotten_urls = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, url):
+        if url in self.exact_urls:
+            return True
+        return self.bloom is not None and url not in self.forgotten_urls and url in self.bloom
+
+    def add(self, url):
+        self.forgotten_urls.discard(url)
+        if len(self.exact_urls) < self.exact_limit:
+            self.exact_urls.add(url)
+            return
+        if self.bloom is None:
+            logger.warning("Seen url cache has {} urls, adding the rest to a bloom filter".format(self.exact_limit))
+            self.bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+        self.bloom.add(url)
+
+    def filter_unseen(self, urls):
+        """Returns the urls not seen before and marks them as seen"""
+        unseen_urls = []
+        for url in urls:
+            if url in self:
+                self.hits += 1
+                continue
+            self.misses += 1
+            self.add(url)
+            unseen_urls.append(url)
+        return unseen_urls
+
+    def forget(self, urls):
+        """Unmark the urls whose write failed"""
+        for url in urls:
+            self.exact_urls.discard(url)
+            if self.bloom is not None and url in self.bloom:
+                self.forgotten_urls.add(url)
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        logger.info("Seen url cache: {0} hits, {1} misses ({2:.1f}% repeats). Exact urls:{3} Bloom filter urls:{4}"\
+            .format(self.hits, self.misses, 100.0 * self.hits / total if total > 0 else 0.0, \
+                len(self.exact_urls), self.bloom.count if self.bloom is not None else 0))
+        if self.bloom is not None and self.bloom.count > self.bloom_capacity:
+            logger.warning("Bloom filter is over its capacity {}, more unseen urls may have been dropped"\
+                .format(self.bloom_capacity))
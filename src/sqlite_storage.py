@@ -0,0 +1,254 @@
+import os
+import json
+import sqlite3
+from storage import StorageI
+import conf_parser
+from metrics import METRICS, metric_name
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Doc fields with an index of their own, for the queries of the extractors and the dump
+INDEXED_FIELDS = ('downloaded', 'text_len')
+RANGE_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+def field_expr(field):
+    """SQL expression of a doc field. The same expression as the indexes of INDEXED_FIELDS"""
+    return "json_extract(doc, '$.{}')".format(field)
+
+def to_sql_value(value):
+    """Term value as stored in the JSON doc. 'true'/'false' are booleans, like on the boolean fields of ES"""
+    if value is True or value == 'true':
+        return 1
+    if value is False or value == 'false':
+        return 0
+    return value
+
+def to_number(value):
+    """ES accepts the numbers of a range as strings"""
+    if isinstance(value, str):
+        return float(value)
+    return value
+
+def make_where(query):
+    """Translate the subset of the ES query DSL used by this project (bool must/filter/must_not/should,
+    match_all, term, terms, range and exists) into an SQL condition and its params"""
+    if len(query) != 1:
+        raise ValueError("Unsupported query {}".format(query))
+    (query_type, body), = query.items()
+
+    if query_type == 'match_all':
+        return '1', []
+    if query_type == 'bool':
+        conditions, params = [], []
+        for clause_type in ('must', 'filter'):
+            for clause in body.get(clause_type, []):
+                sql, clause_params = make_where(clause)
+                conditions.append(sql)
+                params.extend(clause_params)
+        for clause in body.get('must_not', []):
+            sql, clause_params = make_where(clause)
+            # A missing field gives NULL, which does not match, like in ES
+            conditions.append('NOT IFNULL(({}), 0)'.format(sql))
+            params.extend(clause_params)
+        if len(body.get('should', [])) > 0:
+            should_conditions = []
+            for clause in body['should']:
+                sql, clause_params = make_where(clause)
+                should_conditions.append(sql)
+                params.extend(clause_params)
+            conditions.append(' OR '.join(should_conditions))
+        if len(conditions) == 0:
+            return '1', []
+        return ' AND '.join('({})'.format(condition) for condition in conditions), params
+    if query_type == 'term':
+        (field, value), = body.items()
+        if isinstance(value, dict):
+            value = value['value']
+        return '{} = ?'.format(field_expr(field)), [to_sql_value(value)]
+    if query_type == 'terms':
+        (field, values), = body.items()
+        return '{0} IN ({1})'.format(field_expr(field), ', '.join(['?'] * len(values))), [to_sql_value(v) for v in values]
+    if query_type == 'range':
+        (field, bounds), = body.items()
+        conditions, params = [], []
+        for operator, value in bounds.items():
+            if operator not in RANGE_OPERATORS:
+                raise ValueError("Unsupported range operator {}".format(operator))
+            conditions.append('{0} {1} ?'.format(field_expr(field), RANGE_OPERATORS[operator]))
+            params.append(to_number(value))
+        return ' AND '.join(conditions), params
+    if query_type == 'exists':
+        return '{} IS NOT NULL'.format(field_expr(body['field'])), []
+    raise ValueError("Unsupported query type {}".format(query_type))
+
+def filter_source(doc, source):
+    """Apply the _source of the query to the doc: False for none of the fields, a list of fields, or all of them"""
+    if source is False:
+        return {}
+    if isinstance(source, str):
+        source = [source]
+    if isinstance(source, list):
+        return {field: doc[field] for field in source if field in doc}
+    return doc
+
+class SQLiteStorage(StorageI):
+    """Storage on an embedded SQLite database, with the same semantics as ESStorage, for the single node runs.
+    The docs of an index are kept as JSON in the table of the index name, in the database file sqlite_path
+    (index conf). The fields of INDEXED_FIELDS are indexed. The bulk writes go in one transaction each,
+    and the bulk scroll streams the docs page by page (scroll_page_size of the index conf)."""
+    def __init__(self, index_conf, read_only=False):
+        self.index = index_conf['index']
+        self.read_only = read_only
+        self.page_size = index_conf.get('scroll_page_size', 1000)
+        db_dir = os.path.dirname(index_conf['sqlite_path'])
+        if db_dir != '':
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(index_conf['sqlite_path'], timeout=60)
+        self.write_metric = metric_name('bulk_write', self.index)
+        self.scroll_metric = metric_name('scroll_page', self.index)
+        if not read_only:
+            self.__create_table()
+        logger.warning('Connected to {0} table of {1}. Read only:{2}'\
+            .format(self.index, index_conf['sqlite_path'], self.read_only))
+
+    def __create_table(self):
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS "{}" (id TEXT PRIMARY KEY, doc TEXT)'.format(self.index))
+            for field in INDEXED_FIELDS:
+                self.conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ({2})'\
+                    .format(self.index, field, field_expr(field)))
+
+    def __check_writeability(self):
+        """Exit if the index is not write-able"""
+        if self.read_only:
+            logger.error('Cannot write to index {}. Opened in read-only mode!'.format(self.index))
+            exit()
+
+    def __make_rows(self, documents, skipped):
+        for doc in documents:
+            if 'id' not in doc:
+                # Doc without an 'id' can not be saved
+                skipped.append(doc)
+                conf_parser.error_logger.error("Indexing failed! Document without id: {}".format(doc))
+                continue
+            yield doc['id'], json.dumps(doc, ensure_ascii=False)
+
+    def storage_exists(self):
+        row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.index,)).fetchone()
+        return row is not None
+
+    def save_doc(self, doc, update_if_exists=False):
+        """Save the doc. Returns None if it exists already, unless update_if_exists"""
+        self.__check_writeability()
+        verb = 'INSERT OR REPLACE' if update_if_exists else 'INSERT OR IGNORE'
+        with self.conn:
+            cursor = self.conn.execute('{0} INTO "{1}" VALUES (?, ?)'.format(verb, self.index), \
+                (doc['id'], json.dumps(doc, ensure_ascii=False)))
+        if cursor.rowcount == 0:
+            conf_parser.error_logger.error("Indexing failed! Duplicate document: {}".format(doc))
+            return None
+        return {'_id': doc['id'], 'result': 'updated' if update_if_exists else 'created'}
+
+    def __insert_rows(self, documents, update_if_exists, skipped):
+        """Insert the docs one by one, to tell the duplicates(existing docs, unless update_if_exists)
+        like the 409s of ES. Returns the num of duplicates"""
+        verb = 'INSERT OR REPLACE' if update_if_exists else 'INSERT OR IGNORE'
+        sql = '{0} INTO "{1}" VALUES (?, ?)'.format(verb, self.index)
+        duplicate_count = 0
+        for row in self.__make_rows(documents, skipped):
+            if self.conn.execute(sql, row).rowcount == 0:
+                duplicate_count += 1
+                conf_parser.error_logger.error("Indexing failed! Duplicate document: {}".format(row[0]))
+        return duplicate_count
+
+    def save_documents(self, documents, update_if_exists=False):
+        """Save multiple documents in one transaction. The existing docs are left as they are,
+        unless update_if_exists"""
+        self.__check_writeability()
+        skipped = []
+        with METRICS.timer(self.write_metric), self.conn:
+            duplicate_count = self.__insert_rows(documents, update_if_exists, skipped)
+        drop_count = len(skipped) + duplicate_count
+        logger.info('## Saved {0} Dropped {1}'.format(len(documents) - drop_count, drop_count))
+        return len(documents) - drop_count, drop_count
+
+    def __update_rows(self, documents, upsert, skipped):
+        """Merge the fields into the existing docs. Returns the num of missing docs, unless upsert"""
+        rows = self.__make_rows(documents, skipped)
+        if upsert:
+            # Merge the fields into the existing doc, or create it with them
+            self.conn.executemany('INSERT INTO "{}" VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET doc = json_patch(doc, excluded.doc)'\
+                .format(self.index), rows)
+            return 0
+        # One by one, to tell the missing docs like the 404s of ES
+        sql = 'UPDATE "{}" SET doc = json_patch(doc, ?2) WHERE id = ?1'.format(self.index)
+        missing_count = 0
+        for row in rows:
+            if self.conn.execute(sql, row).rowcount == 0:
+                missing_count += 1
+                conf_parser.error_logger.error("Update failed! Missing document: {}".format(row[0]))
+        return missing_count
+
+    def update_documents(self, documents, upsert=False):
+        """Partially update multiple documents (by their 'id') in one transaction.
+        If upsert is True, the absent documents are created with the given fields, otherwise they are dropped"""
+        self.__check_writeability()
+        skipped = []
+        with METRICS.timer(self.write_metric), self.conn:
+            missing_count = self.__update_rows(documents, upsert, skipped)
+        drop_count = len(skipped) + missing_count
+        logger.info('## Updated {0} Dropped {1}'.format(len(documents) - drop_count, drop_count))
+        return len(documents) - drop_count, drop_count
+
+    def save_and_upsert(self, documents, upsert_documents):
+        """Create the absent documents and upsert the partial upsert_documents in one transaction"""
+        self.__check_writeability()
+        skipped = []
+        with METRICS.timer(self.write_metric), self.conn:
+            duplicate_count = self.__insert_rows(documents, False, skipped)
+            self.__update_rows(upsert_documents, True, skipped)
+        total_count = len(documents) + len(upsert_documents)
+        drop_count = len(skipped) + duplicate_count
+        logger.info('## Created/Upserted {0} Dropped {1}'.format(total_count - drop_count, drop_count))
+        return total_count - drop_count, drop_count
+
+    def get_doc_by_id(self, id):
+        """Get a document by id, in the form of an ES get response. None if absent"""
+        row = self.conn.execute('SELECT doc FROM "{}" WHERE id = ?'.format(self.index), (id,)).fetchone()
+        if row is None:
+            return None
+        return {'_index': self.index, '_id': id, 'found': True, '_source': json.loads(row[0])}
+
+    def count_documents(self, query):
+        """Num of documents matching the query"""
+        where, params = make_where(query.get('query', {'match_all': {}}))
+        return self.conn.execute('SELECT COUNT(*) FROM "{0}" WHERE {1}'.format(self.index, where), params).fetchone()[0]
+
+    def get_documents(self, query, bulk_scroll=False):
+        """Get the documents for the given query. Like ES, the search gives the _source of the first
+        'size' (default 10) docs, and the bulk scroll iterates over all the hits ({'_id', '_source'})"""
+        where, params = make_where(query.get('query', {'match_all': {}}))
+        source = query.get('_source', True)
+        if bulk_scroll:
+            return self.__scroll(where, params, source)
+        rows = self.conn.execute('SELECT doc FROM "{0}" WHERE {1} LIMIT ? OFFSET ?'.format(self.index, where), \
+            params + [query.get('size', 10), query.get('from', 0)]).fetchall()
+        return [filter_source(json.loads(doc), source) for doc, in rows]
+
+    def __scroll(self, where, params, source):
+        """Iterate over the hits page by page, in the order of their ids. Every page is a new query,
+        so the docs can be written while scrolling"""
+        last_id = ''
+        while True:
+            with METRICS.timer(self.scroll_metric):
+                rows = self.conn.execute('SELECT id, doc FROM "{0}" WHERE id > ? AND ({1}) ORDER BY id LIMIT ?'\
+                    .format(self.index, where), [last_id] + params + [self.page_size]).fetchall()
+            for id, doc in rows:
+                yield {'_index': self.index, '_id': id, '_source': filter_source(json.loads(doc), source)}
+            if len(rows) < self.page_size:
+                return
+            last_id = rows[-1][0]
+
+    def close(self):
+        self.conn.close()
@@ -2,6 +2,9 @@ import logging
 logger = logging.getLogger(__name__)
 
 class StorageI:
+    # True if the writes return before the documents are saved, see flush()
+    writes_in_background = False
+
     def storage_exists(self):
         pass
     
@@ -10,12 +13,35 @@ class StorageI:
 
     def save_documents(self, documents, update_if_exists):
         pass
+
+    def update_documents(self, documents, upsert=False):
+        pass
     
+    def save_and_upsert(self, documents, upsert_documents):
+        pass
+
     def get_doc_by_id(self, id):
         pass
 
     def get_documents(self, query, bulk_scroll=False):
         pass
+
+    def count_documents(self, query):
+        """Num of documents matching the query, None if the storage can not tell"""
+        return None
+
+    def get_document_slices(self, query, slices=None):
+        """Iterators over disjoint parts of the documents of the query, for parallel consumers"""
+        return [self.get_documents(query, bulk_scroll=True)]
     
+    def flush(self):
+        """Wait until the documents of the previous writes are saved"""
+        pass
+
+    def take_failed_ids(self):
+        """Ids of the documents whose write failed since the previous call, leaving out the duplicates.
+        Call after flush(), the rest of the written documents are saved"""
+        return []
+
     def close(self):
         pass
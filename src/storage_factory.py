@@ -0,0 +1,23 @@
+from storage import StorageI
+
+import logging
+logger = logging.getLogger(__name__)
+
+STORAGE_TYPES = ('elasticsearch', 'sqlite')
+
+def make_storage(index_conf, read_only=False, async_writes=False) -> StorageI:
+    """The storage of an index as per its conf: 'storage' is elasticsearch (default) or sqlite.
+    With async_writes (async_storage of the run_config), the Elasticsearch writes are sent in the background.
+    The storages are imported only when used, so that their dependencies are needed only then"""
+    storage_type = index_conf.get('storage', 'elasticsearch')
+    if storage_type == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(index_conf, read_only=read_only)
+    if storage_type != 'elasticsearch':
+        raise ValueError("Unknown storage {0} of index {1}, expected one of {2}"\
+            .format(storage_type, index_conf['index'], STORAGE_TYPES))
+    if async_writes:
+        from async_es_storage import AsyncESStorage
+        return AsyncESStorage(index_conf, read_only=read_only)
+    from es_storage import ESStorage
+    return ESStorage(index_conf, read_only=read_only)
@@ -0,0 +1,113 @@
+"""Synthetic HTML pages in the layouts of the supported websites, for the benchmarks.
+Every page has the article fields where the site parser looks for them first (one of the older
+layouts now and then) along with the usual boilerplate: navigation links, scripts and a footer.
+The pages are generated from a seed, so that every run works on the same corpus."""
+import random
+from html_parser import Website
+
+# Kannada words the text is made of
+WORDS = ['ಕನ್ನಡ', 'ಸುದ್ದಿ', 'ಬೆಂಗಳೂರು', 'ಸರ್ಕಾರ', 'ಮುಖ್ಯಮಂತ್ರಿ', 'ಚುನಾವಣೆ', 'ಜಿಲ್ಲೆ', 'ರೈತರು', 'ಮಳೆ', 'ಕ್ರಿಕೆಟ್',
+    'ಪಂದ್ಯ', 'ಶಾಲೆ', 'ಬಜೆಟ್', 'ಯೋಜನೆ', 'ಆಸ್ಪತ್ರೆ', 'ನಗರ', 'ಪೊಲೀಸ್', 'ನ್ಯಾಯಾಲಯ', 'ಮಾರುಕಟ್ಟೆ', 'ಸಿನಿಮಾ']
+MONTHS = ['ಜನವರಿ', 'ಫೆಬ್ರವರಿ', 'ಮಾರ್ಚ್', 'ಏಪ್ರಿಲ್', 'ಮೇ', 'ಜೂನ್', 'ಜುಲೈ', 'ಆಗಸ್ಟ್', 'ಸೆಪ್ಟೆಂಬರ್', 'ಅಕ್ಟೋಬರ್', 'ನವೆಂಬರ್', 'ಡಿಸೆಂಬರ್']
+
+BASE_URLS = {
+    Website.KANNADAPRABHA: 'https://www.kannadaprabha.com/',
+    Website.PRAJAVANI: 'https://www.prajavani.net/',
+    Website.VIJAYAKARNATAKA: 'https://vijaykarnataka.com/',
+}
+
+def make_text(rand, num_words):
+    return ' '.join(rand.choice(WORDS) for _ in range(num_words))
+
+def make_boilerplate(rand, base_url, num_links):
+    """Navigation links of the header, sidebar and footer, a few of them to the other domains"""
+    links = []
+    for _ in range(num_links):
+        if rand.random() < 0.1:
+            href = 'https://www.facebook.com/share/{}'.format(rand.randint(1, 10**6))
+        elif rand.random() < 0.5:
+            href = '/{0}/{1}.html'.format(rand.choice(['news', 'state', 'sports', 'cinema']), rand.randint(1, 10**6))
+        else:
+            href = '{0}{1}/{2}.html'.format(base_url, rand.choice(['district', 'nation', 'world']), rand.randint(1, 10**6))
+        links.append('<li><a href="{0}">{1}</a></li>'.format(href, make_text(rand, 2)))
+    return '<ul class="nav">{}</ul>'.format(''.join(links))
+
+def make_head(title, metas):
+    meta_tags = ''.join('<meta {0}="{1}" content="{2}"/>'.format(key, value, content) for key, value, content in metas)
+    return ('<head><meta charset="utf-8"/><title>{0}</title>{1}'
+        '<link rel="stylesheet" href="/static/css/main.css"/><script src="/static/js/main.js"></script>'
+        '<script>var dataLayer = [{{"page": "article"}}];</script></head>').format(title, meta_tags)
+
+def make_kannadaprabha_page(rand, url, paragraphs, title, description, keywords, date):
+    head = make_head(title, [('property', 'og:type', 'article'), ('property', 'og:title', title),
+        ('property', 'og:description', description), ('name', 'news_keywords', keywords), ('property', 'og:url', url)])
+    if rand.random() < 0.8:
+        article = ('<div class="div_article_headline"><span>{0}</span></div>'
+            '<p class="ArticlePublish margin-bottom-10"><span>{1}</span></p>'
+            '<div id="storyContent"><div class="author_txt">{2}</div>{3}<div class="agency_txt">PTI</div></div>'
+            '<div class="article_topic"><span>{4}</span></div>').format(title, date, make_text(rand, 2),
+            ''.join('<p>{}</p>'.format(p) for p in paragraphs), keywords)
+    else:
+        # The older layout
+        article = ('<div class="article_headline"><span>{0}</span></div><div class="article_dateline"><span>{1}</span></div>'
+            '<div class="article_text"><span>{2}</span></div>').format(title, date, '<br/>'.join(paragraphs))
+    return head, article
+
+def make_prajavani_page(rand, url, paragraphs, title, description, keywords, date):
+    head = make_head(title, [('property', 'og:type', 'article'), ('property', 'og:title', title),
+        ('name', 'description', description), ('name', 'keywords', keywords), ('property', 'article:published_time', date)])
+    tags = ''.join('<a href="/tags/{0}">{0}</a>'.format(keyword) for keyword in keywords.split(','))
+    body = ''.join('<p>{}</p>'.format(p) for p in paragraphs)
+    # The related article links inside the text
+    body += '<p>ಇದನ್ನೂ ಓದಿ: <a href="/news/{0}.html">{1}</a></p>'.format(rand.randint(1, 10**6), make_text(rand, 5))
+    if rand.random() < 0.8:
+        article = ('<div class="pj-article__title"><h1>{0}</h1></div><div class="pj-article__tags tags">{1}</div>'
+            '<div class="pj-article__detail__authors__date-section"><time>{2}</time></div>'
+            '<div class="pj-article__content">{3}</div>').format(title, tags, date, body)
+    else:
+        # The older layout
+        article = ('<h1>{0}</h1><div class="pj-article__detail__date-published date"><time>{1}</time></div>'
+            '<div class="field field-name-body">{2}</div>').format(title, date, body)
+    return head, article
+
+def make_vijayakarnataka_page(rand, url, paragraphs, title, description, keywords, date):
+    head = make_head(title, [('property', 'og:type', 'article'), ('property', 'og:title', title),
+        ('name', 'description', description), ('name', 'Keywords', keywords), ('itemprop', 'datePublished', date)])
+    keyword_spans = ''.join('<span><a href="/topics/{0}">{0}</a></span>'.format(keyword) for keyword in keywords.split(','))
+    if rand.random() < 0.8:
+        article = ('<div class="story-article"><h1>{0}</h1><div class="enable-read-more"><h2>{1}</h2></div>'
+            '<article class="story-content">{2}</article></div>'
+            '<div class="keywords"><div class="nowarp_content">{3}</div></div>').format(title, description,
+            ''.join('<div>{}</div><br/>'.format(p) for p in paragraphs), keyword_spans)
+    else:
+        # The older layout
+        article = ('<div id="contentarea_{0}"><h1>{1}</h1><h2>{2}</h2></div><div class="article"><div class="section1">'
+            '<div class="Normal">{3}</div></div></div><div class="keywords_wrap"><div class="nowarp_content">{4}</div></div>')\
+            .format(rand.randint(1, 1000), title, description, '<br/>'.join(paragraphs), keyword_spans)
+    return head, article
+
+PAGE_MAKERS = {
+    Website.KANNADAPRABHA: make_kannadaprabha_page,
+    Website.PRAJAVANI: make_prajavani_page,
+    Website.VIJAYAKARNATAKA: make_vijayakarnataka_page,
+}
+
+def make_page(website: Website, rand: random.Random, page_num):
+    """(url, html bytes) of a synthetic article page of the website"""
+    base_url = BASE_URLS[website]
+    url = '{0}news/{1}.html'.format(base_url, page_num)
+    paragraphs = [make_text(rand, rand.randint(20, 80)) for _ in range(rand.randint(3, 15))]
+    title = make_text(rand, rand.randint(4, 10))
+    description = make_text(rand, rand.randint(10, 25))
+    keywords = ','.join(make_text(rand, 1) for _ in range(rand.randint(2, 6)))
+    date = '{0} {1}, {2}'.format(rand.choice(MONTHS), rand.randint(1, 28), rand.randint(2012, 2021))
+    head, article = PAGE_MAKERS[website](rand, url, paragraphs, title, description, keywords, date)
+    html = '<!DOCTYPE html><html>{0}<body><header>{1}</header><main>{2}</main><aside>{3}</aside><footer>{4}</footer></body></html>'\
+        .format(head, make_boilerplate(rand, base_url, 60), article, make_boilerplate(rand, base_url, 40), \
+            make_boilerplate(rand, base_url, 30))
+    return url, html.encode('utf-8')
+
+def generate_pages(website: Website, num_pages, seed=0):
+    """List of num_pages (url, html bytes) of the website"""
+    rand = random.Random('{0}-{1}'.format(website.value, seed))
+    return [make_page(website, rand, page_num) for page_num in range(num_pages)]
@@ -0,0 +1,181 @@
+import os
+import json
+import mmap
+import heapq
+import bisect
+import hashlib
+from array import array
+import logging
+logger = logging.getLogger(__name__)
+
+# Num of hashes sorted in memory at a time, while building the index from scratch
+SORT_RUN_SIZE = 4 * 1000 * 1000
+# Num of hashes read/written in one go from the files
+IO_BLOCK_SIZE = 64 * 1024
+
+def url_hash(url: str) -> int:
+    """64-bit hash of the url"""
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def _read_hashes(file_obj):
+    """Yield the hashes of a file of hashes, reading a block at a time"""
+    while True:
+        block = array('Q')
+        data = file_obj.read(IO_BLOCK_SIZE * block.itemsize)
+        if not data:
+            return
+        block.frombytes(data)
+        yield from block
+
+def _write_hashes(file_obj, hashes):
+    """Write the hashes to the file, skipping the consecutive duplicates. Returns the num written"""
+    count = 0
+    previous = None
+    block = array('Q')
+    for h in hashes:
+        if h == previous:
+            continue
+        previous = h
+        block.append(h)
+        if len(block) >= IO_BLOCK_SIZE:
+            block.tofile(file_obj)
+            count += len(block)
+            block = array('Q')
+    block.tofile(file_obj)
+    return count + len(block)
+
+class URLHashIndex():
+    """Persistent set of urls with near-constant memory use. The urls are stored as a sorted array
+    of 64-bit hashes in a memory-mapped file, and looked up by binary search.
+    New urls are kept in a small in-memory delta, also appended to a log file so that they survive
+    a crash, and merged into the sorted file by flush().
+    The files are in the native byte order, so they are not meant to be moved across architectures."""
+    def __init__(self, index_dir, name):
+        os.makedirs(index_dir, exist_ok=True)
+        self.sorted_path = os.path.join(index_dir, name + '.u64')
+        self.delta_path = os.path.join(index_dir, name + '.delta')
+        self.meta_path = os.path.join(index_dir, name + '.meta.json')
+
+        self.meta = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as meta_file:
+                self.meta = json.load(meta_file)
+
+        self.sorted_file = None
+        self.sorted_map = None
+        self.sorted_hashes = memoryview(array('Q'))
+        self.__map_sorted_file()
+
+        # Replay the urls added after the last flush
+        self.delta = set()
+        if os.path.exists(self.delta_path):
+            with open(self.delta_path, 'rb') as delta_file:
+                self.delta.update(_read_hashes(delta_file))
+        self.delta_file = open(self.delta_path, 'ab')
+
+    def exists(self):
+        """True if the index has been built before"""
+        return os.path.exists(self.sorted_path)
+
+    def __map_sorted_file(self):
+        self.__unmap_sorted_file()
+        if not os.path.exists(self.sorted_path) or os.path.getsize(self.sorted_path) == 0:
+            return
+        self.sorted_file = open(self.sorted_path, 'rb')
+        self.sorted_map = mmap.mmap(self.sorted_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sorted_hashes = memoryview(self.sorted_map).cast('Q')
+
+    def __unmap_sorted_file(self):
+        self.sorted_hashes.release()
+        self.sorted_hashes = memoryview(array('Q'))
+        if self.sorted_map is not None:
+            self.sorted_map.close()
+            self.sorted_file.close()
+        self.sorted_map = self.sorted_file = None
+
+    def __contains_hash(self, h):
+        if h in self.delta:
+            return True
+        pos = bisect.bisect_left(self.sorted_hashes, h)
+        return pos < len(self.sorted_hashes) and self.sorted_hashes[pos] == h
+
+    def contains(self, url):
+        return self.__contains_hash(url_hash(url))
+
+    def add_urls(self, urls):
+        new_hashes = array('Q')
+        for url in urls:
+            h = url_hash(url)
+            if not self.__contains_hash(h):
+                self.delta.add(h)
+                new_hashes.append(h)
+        new_hashes.tofile(self.delta_file)
+        self.delta_file.flush()
+
+    def __len__(self):
+        return len(self.sorted_hashes) + len(self.delta)
+
+    def flush(self):
+        """Merge the delta into the sorted file"""
+        if len(self.delta) == 0:
+            return
+        tmp_path = self.sorted_path + '.tmp'
+        with open(tmp_path, 'wb') as tmp_file:
+            # Copy the sorted hashes in slices between the insertion points of the delta
+            start = 0
+            for h in sorted(self.delta):
+                pos = bisect.bisect_left(self.sorted_hashes, h, lo=start)
+                tmp_file.write(self.sorted_hashes[start:pos])
+                array('Q', [h]).tofile(tmp_file)
+                start = pos
+            tmp_file.write(self.sorted_hashes[start:])
+        self.__replace_sorted_file(tmp_path)
+
+    def rebuild(self, urls):
+        """Build the index from scratch with the given url iterator, using sorted runs on disk"""
+        run_paths = []
+        run = []
+        for url in urls:
+            run.append(url_hash(url))
+            if len(run) >= SORT_RUN_SIZE:
+                run_paths.append(self.__write_run(run, len(run_paths)))
+                run = []
+        run_paths.append(self.__write_run(run, len(run_paths)))
+
+        tmp_path = self.sorted_path + '.tmp'
+        run_files = [open(run_path, 'rb') for run_path in run_paths]
+        try:
+            with open(tmp_path, 'wb') as tmp_file:
+                count = _write_hashes(tmp_file, heapq.merge(*[_read_hashes(rf) for rf in run_files]))
+        finally:
+            for run_file, run_path in zip(run_files, run_paths):
+                run_file.close()
+                os.remove(run_path)
+        logger.info("Built the url index with {} urls".format(count))
+        self.delta = set()
+        self.__replace_sorted_file(tmp_path)
+
+    def __write_run(self, run, run_num):
+        run_path = '{0}.run{1}'.format(self.sorted_path, run_num)
+        with open(run_path, 'wb') as run_file:
+            _write_hashes(run_file, sorted(run))
+        return run_path
+
+    def __replace_sorted_file(self, tmp_path):
+        self.__unmap_sorted_file()
+        os.replace(tmp_path, self.sorted_path)
+        self.__map_sorted_file()
+        # The delta is part of the sorted file now
+        self.delta = set()
+        self.delta_file.close()
+        self.delta_file = open(self.delta_path, 'wb')
+        self.save_meta()
+
+    def save_meta(self):
+        with open(self.meta_path, 'w') as meta_file:
+            json.dump(self.meta, meta_file)
+
+    def close(self):
+        self.flush()
+        self.delta_file.close()
+        self.__unmap_sorted_file()
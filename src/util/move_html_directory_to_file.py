@@ -1,7 +1,15 @@
-import glob
+# Code to fix the importing of submodules
+from pathlib import Path
+import sys
+if __package__ is None:                  
+    DIR = Path(__file__).resolve().parent
+    sys.path.insert(0, str(DIR.parent))
+    __package__ = DIR.name
+
 import os
 import os.path
-import sys
+
+from dump_walker import walk_html_files
 
 """Utility script that moves any directory with '.html' extension containing 'index.html'
  into a file with the same name.
@@ -12,14 +20,12 @@ import sys
  
 root_dir = sys.argv[1]
 
-all_file_count = 0
 dir_count = 0
 moved_count = 0
 print('Going to check' + os.path.join(root_dir,'**/*.html'))
 
-for fp in glob.glob(os.path.join(root_dir,'**/*.html'), recursive=True):
-    all_file_count += 1
-    if not os.path.isfile(fp):
+for fp, is_dir in walk_html_files(root_dir, ['.html']):
+    if is_dir:
         dir_count += 1
         # The directory at fp will have a file called index.html
         index_file = os.path.join(fp, 'index.html')
@@ -37,4 +43,4 @@ for fp in glob.glob(os.path.join(root_dir,'**/*.html'), recursive=True):
             else:
                 print('Directory {} is not empty'.format(fp))
 
-print('Found {0} total directories ending with .html. Fixed {1} index.html files'.format(dir_count, moved_count))
\ No newline at end of file
+print('Found {0} total directories ending with .html. Fixed {1} index.html files'.format(dir_count, moved_count))
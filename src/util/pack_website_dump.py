@@ -0,0 +1,30 @@
+# Code to fix the importing of submodules
+from pathlib import Path
+import sys
+if __package__ is None:
+    DIR = Path(__file__).resolve().parent
+    sys.path.insert(0, str(DIR.parent))
+    __package__ = DIR.name
+
+import logging
+logging.basicConfig(level='INFO', format='%(asctime)s:%(name)s:%(levelname)s: %(message)s')
+
+from dump_walker import DEFAULT_HTML_EXTENSIONS
+from dump_archive import pack_website_dump
+
+"""Utility script that packs a website dump into a few large pack files with an offset index,
+ to be set as dump_archive in the run_config.
+
+ Usage:
+ src/util/pack_website_dump.py <WEBSITE BASE DIR> <ARCHIVE PATH> [<COMMA SEPARATED HTML EXTENSIONS>]
+ Ex: src/util/pack_website_dump.py /data/kannadaprabha/run1/websites/www.kannadaprabha.com/ archive/kannadaprabha_run1 .html,.cms
+ """
+
+if len(sys.argv) < 3:
+    print('Usage: src/util/pack_website_dump.py <WEBSITE BASE DIR> <ARCHIVE PATH> [<COMMA SEPARATED HTML EXTENSIONS>]')
+    exit(1)
+
+website_base_dir = sys.argv[1]
+archive_path = sys.argv[2]
+html_extensions = sys.argv[3].split(',') if len(sys.argv) > 3 else DEFAULT_HTML_EXTENSIONS
+pack_website_dump(website_base_dir, archive_path, html_extensions)
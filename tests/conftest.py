@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules import each other from src/, and conf_parser reads config/ relative to the repo root
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'src'))
+os.chdir(REPO_DIR)
@@ -0,0 +1,153 @@
+import os
+import multiprocessing
+import pytest
+
+from html_parser import Website
+from es_doc_maker import make_url_doc
+from sqlite_storage import SQLiteStorage
+from article_extractor import ArticleExtractor
+from dedup import Deduplicator, MinHasher
+from synthetic_pages import generate_pages, BASE_URLS
+
+NUM_PAGES = 20
+
+class FailingStorage(SQLiteStorage):
+    """Fails the writes of the docs in fail_ids, like the rejected items of an ES bulk write"""
+    def __init__(self, conf, fail_ids):
+        super().__init__(conf)
+        self.fail_ids = set(fail_ids)
+        self.failed_ids = []
+
+    def save_documents(self, documents, update_if_exists=False):
+        self.failed_ids.extend(doc['id'] for doc in documents if doc['id'] in self.fail_ids)
+        return super().save_documents([doc for doc in documents if doc['id'] not in self.fail_ids], update_if_exists)
+
+    def take_failed_ids(self):
+        failed_ids, self.failed_ids = self.failed_ids, []
+        return failed_ids
+
+def write_pages(website, website_base_dir):
+    """Write the synthetic pages of the website under website_base_dir, returns their urls"""
+    urls = []
+    for url, html in generate_pages(website, NUM_PAGES):
+        file_path = os.path.join(website_base_dir, url.replace(BASE_URLS[website], ''))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as html_file:
+            html_file.write(html)
+        urls.append(url)
+    return urls
+
+class BackgroundStorage(SQLiteStorage):
+    """Stands in for the async storage, whose writes run on a thread of their own"""
+    writes_in_background = True
+
+@pytest.mark.parametrize('website', [Website.KANNADAPRABHA, Website.PRAJAVANI])
+def test_extract_with_worker_pool(tmp_path, website):
+    """The article docs come back from the worker processes as plain str fields,
+    a bs4 NavigableString would drag its whole parse tree into the pickle"""
+    website_base_dir = str(tmp_path / 'dump')
+    urls = write_pages(website, website_base_dir)
+    db_path = str(tmp_path / 'test.db')
+    seed_storage = SQLiteStorage({'index': 'seed_urls', 'sqlite_path': db_path})
+    seed_storage.save_documents([make_url_doc(url, downloaded=True) for url in urls])
+    article_storage = SQLiteStorage({'index': 'articles', 'sqlite_path': db_path})
+
+    extractor = ArticleExtractor(seed_storage, article_storage, website, website_base_dir, BASE_URLS[website], \
+        num_workers=2, worker_batch_size=5)
+    extractor.extract_and_save_pending_articles()
+
+    articles = [doc['_source'] for doc in article_storage.get_documents({'query': {'match_all': {}}}, bulk_scroll=True)]
+    assert sorted(article['id'] for article in articles) == sorted(urls)
+    for article in articles:
+        assert isinstance(article['title'], str) and len(article['title']) > 0
+        assert isinstance(article['publish_date'], str) and len(article['publish_date']) > 0
+    article_storage.close()
+    seed_storage.close()
+
+def test_failed_articles_are_not_marked_extracted(tmp_path):
+    """The articles whose writes failed stay pending, in the url lookup and on the seed index,
+    so that the next run extracts them again"""
+    website = Website.PRAJAVANI
+    website_base_dir = str(tmp_path / 'dump')
+    urls = write_pages(website, website_base_dir)
+    db_path = str(tmp_path / 'test.db')
+    lookup_dir = str(tmp_path / 'lookup')
+    seed_storage = SQLiteStorage({'index': 'seed_urls', 'sqlite_path': db_path})
+    seed_storage.save_documents([make_url_doc(url, downloaded=True) for url in urls])
+    extracted_query = {'query': {'term': {'extracted': True}}}
+
+    for fail_ids, expected_count in [(urls[3:5], NUM_PAGES - 2), ([], NUM_PAGES)]:
+        article_storage = FailingStorage({'index': 'articles', 'sqlite_path': db_path}, fail_ids)
+        extractor = ArticleExtractor(seed_storage, article_storage, website, website_base_dir, BASE_URLS[website], \
+            save_batch_limit=6, lookup_dir=lookup_dir, lookup_name='articles', track_extraction_state=True)
+        extractor.extract_and_save_pending_articles()
+
+        assert article_storage.count_documents({'query': {'match_all': {}}}) == expected_count
+        assert seed_storage.count_documents(extracted_query) == expected_count
+        marked_urls = [doc['_source']['url'] for doc in seed_storage.get_documents(extracted_query, bulk_scroll=True)]
+        assert not any(url in marked_urls for url in fail_ids)
+        article_storage.close()
+    seed_storage.close()
+
+def test_worker_pool_is_not_forked_with_background_writes(tmp_path, monkeypatch):
+    """The workers are started by a fork server when the article storage writes on a thread"""
+    website = Website.KANNADAPRABHA
+    website_base_dir = str(tmp_path / 'dump')
+    urls = write_pages(website, website_base_dir)
+    db_path = str(tmp_path / 'test.db')
+    seed_storage = SQLiteStorage({'index': 'seed_urls', 'sqlite_path': db_path})
+    seed_storage.save_documents([make_url_doc(url, downloaded=True) for url in urls])
+    article_storage = BackgroundStorage({'index': 'articles', 'sqlite_path': db_path})
+
+    start_methods = []
+    get_context = multiprocessing.get_context
+    def spy_get_context(method=None):
+        start_methods.append(method)
+        return get_context(method)
+    monkeypatch.setattr(multiprocessing, 'get_context', spy_get_context)
+
+    extractor = ArticleExtractor(seed_storage, article_storage, website, website_base_dir, BASE_URLS[website], \
+        num_workers=2, worker_batch_size=5)
+    extractor.extract_and_save_pending_articles()
+
+    assert start_methods == ['forkserver']
+    articles = article_storage.get_documents({'query': {'match_all': {}}}, bulk_scroll=True)
+    assert sorted(article['_source']['id'] for article in articles) == sorted(urls)
+    article_storage.close()
+    seed_storage.close()
+
+def test_near_duplicates_of_a_failed_article_are_clustered_again(tmp_path):
+    """A saved article does not keep the cluster_id of a first article that failed to be saved"""
+    website = Website.PRAJAVANI
+    website_base_dir = str(tmp_path / 'dump')
+    urls = write_pages(website, website_base_dir)
+    # The same page under another url
+    copy_url = urls[0].replace('.html', '-copy.html')
+    with open(os.path.join(website_base_dir, urls[0].replace(BASE_URLS[website], '')), 'rb') as html_file:
+        html = html_file.read()
+    with open(os.path.join(website_base_dir, copy_url.replace(BASE_URLS[website], '')), 'wb') as html_file:
+        html_file.write(html)
+    db_path = str(tmp_path / 'test.db')
+    seed_storage = SQLiteStorage({'index': 'seed_urls', 'sqlite_path': db_path})
+    seed_storage.save_documents([make_url_doc(url, downloaded=True) for url in urls + [copy_url]])
+    # The seed urls are scrolled in the order of their ids, the first one of the two stands for the cluster
+    first_url, duplicate_url = sorted([urls[0], copy_url])
+
+    for mode in ['mark', 'drop']:
+        article_storage = FailingStorage({'index': 'articles_' + mode, 'sqlite_path': db_path}, [first_url])
+        deduplicator = Deduplicator(MinHasher(), mode, index_path=str(tmp_path / (mode + '_dedup.db')))
+        extractor = ArticleExtractor(seed_storage, article_storage, website, website_base_dir, BASE_URLS[website], \
+            save_batch_limit=6, deduplicator=deduplicator)
+        extractor.extract_and_save_pending_articles()
+
+        assert article_storage.get_doc_by_id(first_url) is None
+        if mode == 'mark':
+            assert article_storage.get_doc_by_id(duplicate_url)['_source']['cluster_id'] == duplicate_url
+        else:
+            # Left for the next run, along with the failed one
+            assert article_storage.get_doc_by_id(duplicate_url) is None
+        clusters = [doc['_source']['cluster_id'] for doc in article_storage.get_documents({'query': {'match_all': {}}}, \
+            bulk_scroll=True)]
+        assert first_url not in clusters
+        article_storage.close()
+    seed_storage.close()
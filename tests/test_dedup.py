@@ -0,0 +1,81 @@
+import pytest
+
+from dedup import Deduplicator, MinHasher, SIGNATURE_FIELD
+
+STORY = ('ಬೆಂಗಳೂರು: ನಗರದಲ್ಲಿ ಮಂಗಳವಾರ ಸುರಿದ ಭಾರಿ ಮಳೆಯಿಂದಾಗಿ ಹಲವು ರಸ್ತೆಗಳು ಜಲಾವೃತಗೊಂಡಿದ್ದು, ವಾಹನ ಸವಾರರು ಪರದಾಡುವಂತಾಯಿತು. '
+    'ತಗ್ಗು ಪ್ರದೇಶದ ಮನೆಗಳಿಗೆ ನೀರು ನುಗ್ಗಿದ್ದು, ಬಿಬಿಎಂಪಿ ಸಿಬ್ಬಂದಿ ರಾತ್ರಿಯಿಡೀ ಪರಿಹಾರ ಕಾರ್ಯದಲ್ಲಿ ತೊಡಗಿದ್ದರು. '
+    'ಮುಂದಿನ ಎರಡು ದಿನ ರಾಜ್ಯದ ಕರಾವಳಿ ಮತ್ತು ಮಲೆನಾಡು ಜಿಲ್ಲೆಗಳಲ್ಲಿ ವ್ಯಾಪಕ ಮಳೆಯಾಗುವ ಸಾಧ್ಯತೆ ಇದೆ ಎಂದು ಹವಾಮಾನ ಇಲಾಖೆ ತಿಳಿಸಿದೆ.')
+# The same wire story with a different dateline and a line of the site
+NEAR_DUPLICATE = STORY.replace('ಬೆಂಗಳೂರು:', 'ಬೆಂಗಳೂರು (ಪಿಟಿಐ):') + ' ಹೆಚ್ಚಿನ ಸುದ್ದಿಗಳಿಗಾಗಿ ನಮ್ಮ ಜಾಲತಾಣ ನೋಡಿ.'
+DISTINCT = ('ಮೈಸೂರು: ದಸರಾ ಮಹೋತ್ಸವದ ಅಂಗವಾಗಿ ಅರಮನೆ ಆವರಣದಲ್ಲಿ ಆಯೋಜಿಸಿದ್ದ ಸಾಂಸ್ಕೃತಿಕ ಕಾರ್ಯಕ್ರಮಗಳಿಗೆ ಸಾವಿರಾರು ಜನರು ಸಾಕ್ಷಿಯಾದರು. '
+    'ಜಂಬೂ ಸವಾರಿಯ ತಾಲೀಮು ಗುರುವಾರ ಬೆಳಿಗ್ಗೆ ನಡೆಯಲಿದ್ದು, ಆನೆಗಳಿಗೆ ವಿಶೇಷ ಆಹಾರ ನೀಡಲಾಗುತ್ತಿದೆ ಎಂದು ಅರಣ್ಯ ಇಲಾಖೆ ಅಧಿಕಾರಿಗಳು ತಿಳಿಸಿದರು.')
+
+@pytest.fixture
+def minhasher():
+    return MinHasher(num_perm=128, shingle_size=5)
+
+def make_deduplicator(minhasher, tmp_path, mode='mark'):
+    return Deduplicator(minhasher, mode, threshold=0.5, bands=32, index_path=str(tmp_path / 'dedup.db'))
+
+def index_counts(deduplicator):
+    return [deduplicator.conn.execute("SELECT COUNT(*) FROM {}".format(table)).fetchone()[0] \
+        for table in ('signatures', 'bands')]
+
+def test_near_duplicates_share_a_cluster(minhasher, tmp_path):
+    deduplicator = make_deduplicator(minhasher, tmp_path)
+    assert deduplicator.assign('a', minhasher.signature(STORY)) == ('a', False)
+    assert deduplicator.assign('b', minhasher.signature(NEAR_DUPLICATE)) == ('a', True)
+    assert deduplicator.assign('c', minhasher.signature(DISTINCT)) == ('c', False)
+    # An article seen before keeps its cluster
+    assert deduplicator.assign('b', minhasher.signature(NEAR_DUPLICATE)) == ('a', True)
+    deduplicator.close()
+
+    # The index is kept across the runs
+    deduplicator = make_deduplicator(minhasher, tmp_path)
+    assert deduplicator.assign('d', minhasher.signature(STORY)) == ('a', True)
+    deduplicator.close()
+
+@pytest.mark.parametrize('mode, expected_kept', [('mark', [True, True, True]), ('drop', [True, False, True])])
+def test_process(minhasher, tmp_path, mode, expected_kept):
+    deduplicator = make_deduplicator(minhasher, tmp_path, mode)
+    docs = [{'id': 'a', 'article_text': STORY}, \
+        {'id': 'b', 'article_text': NEAR_DUPLICATE, SIGNATURE_FIELD: minhasher.signature(NEAR_DUPLICATE)}, \
+        {'id': 'c', 'article_text': DISTINCT}]
+    assert [deduplicator.process(doc) for doc in docs] == expected_kept
+    assert [doc['cluster_id'] for doc in docs] == ['a', 'a', 'c']
+    assert not any(SIGNATURE_FIELD in doc for doc in docs)
+    deduplicator.close()
+
+def test_commit_takes_out_the_failed_articles(minhasher, tmp_path):
+    deduplicator = make_deduplicator(minhasher, tmp_path)
+    deduplicator.assign('a', minhasher.signature(STORY))
+    deduplicator.assign('c', minhasher.signature(DISTINCT))
+    assert index_counts(deduplicator) == [2, 64]
+    assert deduplicator.commit(['c', 'unknown']) == {}
+    assert index_counts(deduplicator) == [1, 32]
+    # Extracted again, it is clustered again
+    assert deduplicator.assign('c', minhasher.signature(DISTINCT)) == ('c', False)
+    deduplicator.close()
+
+def test_failed_first_article_in_mark_mode(minhasher, tmp_path):
+    """The earliest near-duplicate of a failed first article becomes the first article of the cluster"""
+    deduplicator = make_deduplicator(minhasher, tmp_path, 'mark')
+    deduplicator.assign('a', minhasher.signature(STORY))
+    deduplicator.assign('b', minhasher.signature(NEAR_DUPLICATE))
+    deduplicator.assign('c', minhasher.signature(STORY))
+    assert deduplicator.commit(['a']) == {'b': 'b', 'c': 'b'}
+    assert index_counts(deduplicator) == [2, 32]
+    assert deduplicator.assign('a', minhasher.signature(STORY)) == ('b', True)
+    assert deduplicator.assign('c', minhasher.signature(STORY)) == ('b', True)
+    deduplicator.close()
+
+def test_failed_first_article_in_drop_mode(minhasher, tmp_path):
+    """The near-duplicates dropped for a failed first article are taken out, to be clustered again"""
+    deduplicator = make_deduplicator(minhasher, tmp_path, 'drop')
+    deduplicator.assign('a', minhasher.signature(STORY))
+    deduplicator.assign('b', minhasher.signature(NEAR_DUPLICATE))
+    deduplicator.assign('c', minhasher.signature(DISTINCT))
+    assert deduplicator.commit(['a']) == {'b': None}
+    assert index_counts(deduplicator) == [1, 32]
+    assert deduplicator.assign('b', minhasher.signature(NEAR_DUPLICATE)) == ('b', False)
+    deduplicator.close()
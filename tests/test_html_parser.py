@@ -0,0 +1,43 @@
+import pytest
+
+from metrics import METRICS
+from html_parser import KannadaPrabhaParser
+from extraction_rules import RuleBasedParser, load_site_rules
+
+SHORT_TEXT = 'ಕನ್ನಡ ಸುದ್ದಿ ' * 20
+LONG_TEXT = 'ಕನ್ನಡ ಸುದ್ದಿ ' * 40
+
+def make_page(headline_text, story_text):
+    return '''<html><head><meta property="og:type" content="article">
+    <meta property="og:title" content="Og title"></head><body>
+    <div class="div_article_text"><span>{0}</span></div>
+    <div id="storyContent">{1}</div></body></html>'''.format(headline_text, story_text).encode('utf-8')
+
+def make_parsers(html_text):
+    url = 'https://www.kannadaprabha.com/news/a.html'
+    return [KannadaPrabhaParser(html_text, url), \
+        RuleBasedParser(load_site_rules('config/kannadaprabha_extraction_rules.yml'), html_text, url)]
+
+def branch_counts(field):
+    prefix = 'branch/kannadaprabha/{}/'.format(field)
+    counters = METRICS.take_snapshot()['counters']
+    return {name[len(prefix):]: count for name, count in counters.items() if name.startswith(prefix)}
+
+@pytest.mark.parametrize('headline_text, story_text, expected_branch', [
+    (LONG_TEXT, SHORT_TEXT, 'div.div_article_text'),
+    (SHORT_TEXT, LONG_TEXT, 'div#storyContent'),
+])
+def test_branch_of_the_longest_text(headline_text, story_text, expected_branch):
+    """The branch is the one whose text was kept, not the latest lookup that found a tag"""
+    for parser in make_parsers(make_page(headline_text, story_text)):
+        METRICS.take_snapshot()
+        assert parser.timed_field('article_text').strip() == LONG_TEXT.strip()
+        assert branch_counts('article_text') == {expected_branch: 1}
+
+def test_branch_of_a_fallback_and_of_a_missing_field():
+    for parser in make_parsers(make_page(LONG_TEXT, SHORT_TEXT)):
+        METRICS.take_snapshot()
+        assert parser.timed_field('title') == 'Og title'
+        assert branch_counts('title') == {'meta[property=og:title]': 1}
+        assert parser.timed_field('keywords') is None
+        assert branch_counts('keywords') == {'none': 1}
@@ -0,0 +1,32 @@
+import pytest
+
+from link_extractor import LinkExtractor
+
+BASE_URL = 'https://www.kannadaprabha.com/'
+FILTER_DOMAINS = ['kannadaprabha']
+
+PAGES = [
+    # Links in a script, a style or a comment are not links of the page
+    '''<html><head><script>var s = '<a href="/script-link.html">';</script>
+    <style>a[href="/style-link.html"] { color: red; }</style></head>
+    <body><!-- <a href="/commented.html">old</a> --><a href="/news/a.html">A</a></body></html>''',
+    # A '>' in a quoted attribute value does not end the tag
+    '''<html><body><a title="1 > 0" href="/news/b.html">B</a>
+    <a data-x='<br>' href='/news/c.html'>C</a></body></html>''',
+    # Entities in the attribute values are decoded
+    '''<html><head><link rel="canonical" href="/news/d.html?x=1&amp;y=2">
+    <meta property="og:url" content="https://www.kannadaprabha.com/news/e.html?p=&quot;q&quot;"></head>
+    <body><a HREF="/news/f.html?a=1&amp;b=2">F</a><iframe src="/embed/g.html"></iframe></body></html>''',
+    # Not a comment nor a script, the tags after them are still parsed
+    '''<html><body><script src="/app.js"></script><a href="/news/h.html">H</a>
+    <!----><a href="/news/i.html">I</a></body></html>''',
+]
+
+@pytest.mark.parametrize('html_text', PAGES)
+def test_fast_mode_finds_the_same_links(html_text):
+    """The tokenizer of the fast mode collects the same links as the full BeautifulSoup tree"""
+    full_links = LinkExtractor(fast_mode=False).extract(html_text.encode('utf-8'), BASE_URL, FILTER_DOMAINS)
+    fast_links = LinkExtractor(fast_mode=True).extract(html_text.encode('utf-8'), BASE_URL, FILTER_DOMAINS)
+    assert len(full_links) > 0
+    assert fast_links == full_links
+    assert not any('script-link' in link or 'style-link' in link or 'commented' in link for link in fast_links)
@@ -0,0 +1,73 @@
+import pytest
+
+from sqlite_storage import SQLiteStorage
+
+DOCS = [
+    {'id': 'a', 'downloaded': True, 'text_len': 10, 'extracted': True, 'parser_version': 2},
+    {'id': 'b', 'downloaded': True, 'text_len': 200, 'extracted': True, 'parser_version': 1},
+    {'id': 'c', 'downloaded': True, 'text_len': 50},
+    {'id': 'd', 'downloaded': False},
+]
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage({'index': 'test_index', 'sqlite_path': str(tmp_path / 'test.db'), 'scroll_page_size': 2})
+    storage.save_documents(DOCS)
+    yield storage
+    storage.close()
+
+def matching_ids(storage, query):
+    hits = storage.get_documents({'query': query}, bulk_scroll=True)
+    return sorted(hit['_id'] for hit in hits)
+
+@pytest.mark.parametrize('query, expected_ids', [
+    ({'match_all': {}}, ['a', 'b', 'c', 'd']),
+    ({'term': {'downloaded': 'true'}}, ['a', 'b', 'c']),
+    ({'term': {'downloaded': {'value': False}}}, ['d']),
+    ({'terms': {'text_len': [10, 50]}}, ['a', 'c']),
+    ({'range': {'text_len': {'gt': '20'}}}, ['b', 'c']),
+    ({'range': {'text_len': {'gte': 10, 'lt': 200}}}, ['a', 'c']),
+    ({'exists': {'field': 'extracted'}}, ['a', 'b']),
+    ({'bool': {'should': [{'term': {'text_len': 10}}, {'term': {'downloaded': False}}]}}, ['a', 'd']),
+    ({'bool': {}}, ['a', 'b', 'c', 'd']),
+    # The docs without the fields match the must_not, like in ES
+    ({'bool': {'must': [{'term': {'downloaded': True}}], 'must_not': [{'bool': {'must': [
+        {'term': {'extracted': 'true'}}, {'term': {'parser_version': 2}}]}}]}}, ['b', 'c']),
+    ({'bool': {'must_not': [{'exists': {'field': 'text_len'}}]}}, ['d']),
+    ({'bool': {'filter': [{'range': {'text_len': {'lte': 50}}}], 'must_not': [{'term': {'extracted': True}}]}}, ['c']),
+])
+def test_query_dsl(storage, query, expected_ids):
+    assert matching_ids(storage, query) == expected_ids
+    assert storage.count_documents({'query': query}) == len(expected_ids)
+
+def test_unsupported_query(storage):
+    with pytest.raises(ValueError):
+        storage.count_documents({'query': {'match': {'title': 'x'}}})
+    with pytest.raises(ValueError):
+        storage.count_documents({'query': {'range': {'text_len': {'ne': 1}}}})
+
+def test_duplicates_are_dropped(storage):
+    saved, dropped = storage.save_documents([{'id': 'a', 'text_len': 1}, {'id': 'e'}, {'no_id': True}])
+    assert (saved, dropped) == (1, 2)
+    assert storage.get_doc_by_id('a')['_source']['text_len'] == 10
+
+    saved, dropped = storage.save_documents([{'id': 'a', 'text_len': 1}], update_if_exists=True)
+    assert (saved, dropped) == (1, 0)
+    assert storage.get_doc_by_id('a')['_source'] == {'id': 'a', 'text_len': 1}
+
+def test_save_and_upsert_counts(storage):
+    saved, dropped = storage.save_and_upsert([{'id': 'b'}, {'id': 'f', 'downloaded': False}], \
+        [{'id': 'd', 'downloaded': True}, {'id': 'g', 'downloaded': True}])
+    assert (saved, dropped) == (3, 1)
+    assert storage.get_doc_by_id('d')['_source']['downloaded'] is True
+    assert storage.get_doc_by_id('g')['_source'] == {'id': 'g', 'downloaded': True}
+
+def test_update_of_missing_docs_is_dropped(storage):
+    saved, dropped = storage.update_documents([{'id': 'c', 'extracted': True}, {'id': 'x', 'extracted': True}])
+    assert (saved, dropped) == (1, 1)
+    assert storage.get_doc_by_id('c')['_source']['extracted'] is True
+    assert storage.get_doc_by_id('x') is None
+
+    saved, dropped = storage.update_documents([{'id': 'x', 'extracted': True}], upsert=True)
+    assert (saved, dropped) == (1, 0)
+    assert storage.get_doc_by_id('x')['_source'] == {'id': 'x', 'extracted': True}
@@ -0,0 +1,60 @@
+import random
+
+import url_hash_index
+from url_hash_index import URLHashIndex
+
+def random_urls(count, seed):
+    rng = random.Random(seed)
+    return ['https://www.prajavani.net/{0}/{1}.html'.format(rng.choice(['news', 'sports', 'op-ed']), rng.getrandbits(48)) \
+        for _ in range(count)]
+
+def test_lookup_after_add_and_flush(tmp_path):
+    urls = random_urls(1000, seed=1)
+    index = URLHashIndex(str(tmp_path), 'urls')
+    index.add_urls(urls[:500])
+    assert all(index.contains(url) for url in urls[:500])
+    assert not any(index.contains(url) for url in urls[500:])
+
+    index.flush()
+    index.add_urls(urls[500:800])
+    index.flush()
+    assert len(index) == 800
+    assert all(index.contains(url) for url in urls[:800])
+    assert not any(index.contains(url) for url in urls[800:])
+    index.close()
+
+def test_reopen_replays_the_delta_log(tmp_path):
+    urls = random_urls(600, seed=2)
+    index = URLHashIndex(str(tmp_path), 'urls')
+    index.add_urls(urls[:300])
+    index.flush()
+    index.add_urls(urls[300:500])
+    # Not flushed, like a crashed run. Only the delta log has the last urls
+    index.delta_file.close()
+
+    reopened = URLHashIndex(str(tmp_path), 'urls')
+    assert len(reopened) == 500
+    assert all(reopened.contains(url) for url in urls[:500])
+    assert not any(reopened.contains(url) for url in urls[500:])
+    reopened.close()
+
+    reopened = URLHashIndex(str(tmp_path), 'urls')
+    assert len(reopened.delta) == 0
+    assert all(reopened.contains(url) for url in urls[:500])
+    reopened.close()
+
+def test_rebuild_with_sorted_runs(tmp_path, monkeypatch):
+    # Small runs, so that the rebuild merges several of them
+    monkeypatch.setattr(url_hash_index, 'SORT_RUN_SIZE', 128)
+    urls = random_urls(1000, seed=3)
+    index = URLHashIndex(str(tmp_path), 'urls')
+    index.add_urls(random_urls(50, seed=4))
+    # The duplicates are written once
+    index.rebuild(urls[:700] + urls[:100])
+    assert index.exists()
+    assert len(index) == 700
+    assert all(index.contains(url) for url in urls[:700])
+    assert not any(index.contains(url) for url in urls[700:])
+    assert not any(index.contains(url) for url in random_urls(50, seed=4))
+    assert list(tmp_path.glob('*.run*')) == []
+    index.close()